@@ -4,12 +4,13 @@ import sys
 # Adiciona o diretório raiz do projeto ao PYTHONPATH para ele achar a pasta 'src'
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from src.db.database import get_connection
+from src.db.database import get_read_connection
 
 
 def print_recent_sales(limit=5):
     """Obtém as últimas vendas processadas e seus respectivos clientes e produtos."""
-    conn = get_connection()
+    # Read-only: never blocks (nor is blocked by) a running sync
+    conn = get_read_connection()
 
     query = """
         SELECT 
@@ -47,7 +48,8 @@ def print_recent_sales(limit=5):
 
 def db_stats():
     """Traz uma contagem rápida de volume do banco."""
-    conn = get_connection()
+    # Read-only: never blocks (nor is blocked by) a running sync
+    conn = get_read_connection()
     c_count = conn.execute("SELECT COUNT(*) FROM customers").fetchone()[0]
     p_count = conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
     s_count = conn.execute("SELECT COUNT(*) FROM sales").fetchone()[0]
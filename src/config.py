@@ -14,6 +14,13 @@ class Config:
         os.makedirs(base_dir, exist_ok=True)
         return os.path.join(base_dir, f"crm_{cls.ENVIRONMENT}.sqlite")
 
+    @classmethod
+    def get_cache_path(cls) -> str:
+        """SQLite file of the Hotmart enrichment response cache."""
+        base_dir = f"data/db/{cls.ENVIRONMENT}"
+        os.makedirs(base_dir, exist_ok=True)
+        return os.path.join(base_dir, f"hotmart_cache_{cls.ENVIRONMENT}.sqlite")
+
     @property
     def DB_NAME(self) -> str:
         # Compatibility for instances using Config().DB_NAME
@@ -26,14 +33,60 @@ class Config:
     # Hotmart Sync Parameters
     HOTMART_START_DATE = os.getenv("HOTMART_START_DATE")
     HOTMART_END_DATE = os.getenv("HOTMART_END_DATE")
+    # Max transactions enriched concurrently (/sales/users + /sales/price/details)
+    HOTMART_ENRICH_WORKERS = int(os.getenv("HOTMART_ENRICH_WORKERS", "8"))
+    # Keep-alive connections per host in the HotmartClient session
+    HOTMART_POOL_SIZE = int(os.getenv("HOTMART_POOL_SIZE", "10"))
+    # Request scheduler: global budget in req/s (0 = only follow server headers),
+    # per-endpoint budgets as "sales/users=5,sales/price/details=5"
+    HOTMART_RATE_LIMIT_RPS = float(os.getenv("HOTMART_RATE_LIMIT_RPS", "0"))
+    HOTMART_ENDPOINT_RPS = os.getenv("HOTMART_ENDPOINT_RPS", "")
+    HOTMART_MAX_RETRIES = int(os.getenv("HOTMART_MAX_RETRIES", "5"))
+    HOTMART_BACKOFF_BASE = float(os.getenv("HOTMART_BACKOFF_BASE", "1.0"))
+    HOTMART_BACKOFF_MAX = float(os.getenv("HOTMART_BACKOFF_MAX", "60.0"))
+    # Pages fetched ahead of the enrichment/DB writer in fetch_and_save_sales
+    HOTMART_PREFETCH_PAGES = int(os.getenv("HOTMART_PREFETCH_PAGES", "2"))
+    # Enrichment response cache lifetime (/sales/users, /sales/price/details);
+    # 0 disables the cache
+    HOTMART_CACHE_TTL_HOURS = float(os.getenv("HOTMART_CACHE_TTL_HOURS", "168"))
+    # Raw landing zone (gzip'd JSON Lines per page); empty disables it
+    HOTMART_LANDING_DIR = os.getenv("HOTMART_LANDING_DIR", "data/landing/hotmart")
+    # Processes used by the landing replay (0 = one per CPU)
+    HOTMART_REPLAY_WORKERS = int(os.getenv("HOTMART_REPLAY_WORKERS", "0"))
+    # Validate every mapped sale with the Pydantic models instead of the
+    # lightweight records of the hot path
+    HOTMART_STRICT_MODELS = os.getenv("HOTMART_STRICT_MODELS", "false").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    # Initial backfill: date windows fetched concurrently, first window length
+    # and the rows per window the adaptive sizing aims for
+    HOTMART_BACKFILL_WORKERS = int(os.getenv("HOTMART_BACKFILL_WORKERS", "3"))
+    HOTMART_BACKFILL_WINDOW_DAYS = float(
+        os.getenv("HOTMART_BACKFILL_WINDOW_DAYS", "90")
+    )
+    HOTMART_BACKFILL_TARGET_ROWS = int(
+        os.getenv("HOTMART_BACKFILL_TARGET_ROWS", "5000")
+    )
+
+    # SQLite connection tuning (see get_connection / get_read_connection)
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+    SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
 
     # ManyChat Import Parameters
     MANYCHAT_INPUT_DIR = "data/input/manychat"
+    # Rows per read_csv chunk / executemany batch when loading an export
+    MANYCHAT_CHUNK_SIZE = int(os.getenv("MANYCHAT_CHUNK_SIZE", "50000"))
     MANYCHAT_CSV_OUTPUT = os.getenv("MANYCHAT_CSV_OUTPUT", "manychat_output.csv")
 
     # Output Paths
     OUTPUT_PUBLICO = "data/output/publico"
     OUTPUT_REMARKETING = "data/output/remarketing"
+    # CSV exports: rows fetched per cursor chunk and gzip'd output (.csv.gz)
+    EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "10000"))
+    EXPORT_GZIP = os.getenv("EXPORT_GZIP", "false").lower() in ("1", "true", "yes")
     REPORTS_DIR = "data/reports"
 
     @classmethod
@@ -106,6 +159,17 @@ class Config:
 
         return None, None
 
+    @classmethod
+    def get_hotmart_endpoint_rates(cls) -> dict:
+        """Parses HOTMART_ENDPOINT_RPS into {endpoint: requests_per_second}."""
+        rates = {}
+        for entry in cls.HOTMART_ENDPOINT_RPS.split(","):
+            if "=" not in entry:
+                continue
+            endpoint, rate = entry.split("=", 1)
+            rates[endpoint.strip()] = float(rate)
+        return rates
+
     @classmethod
     def is_prd(cls) -> bool:
         return cls.ENVIRONMENT == "prd"
@@ -0,0 +1,476 @@
+import sqlite3
+from datetime import datetime
+
+# =====================================================================
+# Set-based consolidation of the Master `customers` table.
+#
+# Each source is staged in a TEMP table and merged with a handful of bulk
+# statements instead of one upsert_master_customer() call per person:
+#   1. resolve: find the existing master row (email, then phone, then
+#      hotmart_id) for every staged row;
+#   2. merge: UPDATE ... FROM the staged rows (one winner per master row);
+#      unique identity columns go in a separate UPDATE OR IGNORE;
+#   3. seed: INSERT OR IGNORE the rows that matched nobody, keyed by the
+#      normalized email/phone the resolve step matches on;
+#   4. resolve + merge again the rows that collided with a seed, so
+#      duplicates inside the same batch behave like the sequential version.
+# Hotmart is merged first and stays the Source of Truth; ManyChat only fills
+# gaps (or everything, when the master row itself came from ManyChat).
+#
+# Delta mode: consolidation_watermarks keeps, per source, the last value
+# already merged (sales.imported_at, hotmart_customers.row_id and
+# manychat_contacts.change_seq). Only Hotmart customers with newer sales or
+# raw rows and new or re-exported ManyChat contacts are staged. A full rebuild is the same
+# run starting from empty watermarks.
+# =====================================================================
+
+SQL_CREATE_STAGE_TABLES = [
+    "DROP TABLE IF EXISTS temp.stage_sales_summary",
+    "DROP TABLE IF EXISTS temp.stage_hotmart",
+    "DROP TABLE IF EXISTS temp.stage_manychat",
+    "DROP TABLE IF EXISTS temp.stage_changed_customers",
+    "CREATE TEMP TABLE stage_changed_customers (customer_id TEXT PRIMARY KEY)",
+    """
+    CREATE TEMP TABLE stage_sales_summary (
+        customer_id TEXT PRIMARY KEY,
+        last_purchase_at TIMESTAMP,
+        bought INTEGER,
+        has_estetica INTEGER,
+        has_ilpi INTEGER
+    )
+    """,
+    """
+    CREATE TEMP TABLE stage_hotmart (
+        hotmart_id TEXT,
+        email TEXT,
+        phone TEXT,
+        name TEXT,
+        email_key TEXT,
+        phone_key TEXT,
+        last_purchase_at TIMESTAMP,
+        bought INTEGER,
+        segment TEXT,
+        target_id INTEGER,
+        pass INTEGER
+    )
+    """,
+    """
+    CREATE TEMP TABLE stage_manychat (
+        manychat_id INTEGER PRIMARY KEY,
+        email TEXT,
+        phone TEXT,
+        name TEXT,
+        instagram TEXT,
+        last_remarketing_at TEXT,
+        email_key TEXT,
+        phone_key TEXT,
+        target_id INTEGER,
+        pass INTEGER
+    )
+    """,
+    "CREATE INDEX temp.idx_stage_manychat_target ON stage_manychat(target_id, manychat_id)",
+]
+
+SQL_DROP_STAGE_TABLES = [
+    "DROP TABLE IF EXISTS temp.stage_sales_summary",
+    "DROP TABLE IF EXISTS temp.stage_hotmart",
+    "DROP TABLE IF EXISTS temp.stage_manychat",
+    "DROP TABLE IF EXISTS temp.stage_changed_customers",
+]
+
+SQL_CREATE_WATERMARKS = """
+    CREATE TABLE IF NOT EXISTS consolidation_watermarks (
+        source TEXT PRIMARY KEY,
+        watermark TEXT NOT NULL,
+        updated_at TIMESTAMP
+    )
+"""
+
+SQL_LOAD_WATERMARKS = "SELECT source, watermark FROM consolidation_watermarks"
+
+SQL_SAVE_WATERMARK = """
+    INSERT INTO consolidation_watermarks (source, watermark, updated_at)
+    VALUES (:source, :watermark, :now)
+    ON CONFLICT(source) DO UPDATE SET
+        watermark = excluded.watermark,
+        updated_at = excluded.updated_at
+"""
+
+# Upper bound of this run, read before staging (all in one transaction)
+SQL_CURRENT_WATERMARKS = """
+    SELECT
+        (SELECT MAX(imported_at) FROM sales) as sales,
+        (SELECT MAX(row_id) FROM hotmart_customers) as hotmart_customers,
+        (SELECT MAX(change_seq) FROM manychat_contacts) as manychat_contacts
+"""
+
+# Hotmart customers touched since the last run: new/changed sales or raw rows
+SQL_STAGE_CHANGED_CUSTOMERS = """
+    INSERT OR IGNORE INTO stage_changed_customers (customer_id)
+    SELECT customer_id FROM sales
+    WHERE imported_at > :sales_mark AND imported_at <= :sales_limit
+    UNION
+    SELECT id FROM hotmart_customers
+    WHERE row_id > :hotmart_mark AND row_id <= :hotmart_limit AND id IS NOT NULL
+"""
+
+# One aggregate pass over the sales of the changed customers: last purchase,
+# bought flag and segment flags (product_segments, shared with the audiences).
+# Grouped by the staged id so the plan drives from the stage table and seeks
+# sales, instead of walking the whole sales index in customer order.
+SQL_STAGE_SALES_SUMMARY = """
+    INSERT INTO stage_sales_summary
+    SELECT
+        cc.customer_id,
+        MAX(s.purchased_at),
+        MAX(CASE WHEN s.status IN ('APPROVED', 'COMPLETE') THEN 1 ELSE 0 END),
+        MAX(e.product_id IS NOT NULL),
+        MAX(e.product_id IS NULL)
+    FROM stage_changed_customers cc
+    JOIN sales s ON s.customer_id = cc.customer_id
+    LEFT JOIN product_segments e
+        ON e.product_id = s.product_id AND e.segment = 'ESTETICA'
+    GROUP BY cc.customer_id
+"""
+
+# Latest Raw version (hotmart_customers_current) of each changed Hotmart
+# customer joined to its sales summary
+SQL_STAGE_HOTMART = """
+    INSERT INTO stage_hotmart (
+        hotmart_id, email, phone, name, email_key, phone_key,
+        last_purchase_at, bought, segment
+    )
+    SELECT
+        h.id,
+        h.email,
+        h.phone,
+        h.name,
+        NULLIF(lower(trim(h.email)), ''),
+        NULLIF(trim(h.phone), ''),
+        ss.last_purchase_at,
+        COALESCE(ss.bought, 0),
+        CASE
+            WHEN ss.has_estetica AND ss.has_ilpi THEN 'AMBOS'
+            WHEN ss.has_estetica THEN 'ESTETICA'
+            WHEN ss.has_ilpi THEN 'ILPI'
+        END
+    FROM stage_changed_customers cc
+    JOIN hotmart_customers h ON h.row_id = (
+        SELECT cur.row_id FROM hotmart_customers_current cur
+        WHERE cur.id = cc.customer_id
+    )
+    LEFT JOIN stage_sales_summary ss ON ss.customer_id = h.id
+"""
+
+# New or changed ManyChat contacts with phone (empty strings are treated as missing)
+SQL_STAGE_MANYCHAT = """
+    INSERT INTO stage_manychat (
+        manychat_id, email, phone, name, instagram, last_remarketing_at,
+        email_key, phone_key
+    )
+    SELECT
+        id,
+        NULLIF(trim(email), ''),
+        NULLIF(trim(whatsapp), ''),
+        NULLIF(trim(nome), ''),
+        NULLIF(trim(instagram), ''),
+        NULLIF(data_remarketing, ''),
+        NULLIF(lower(trim(email)), ''),
+        NULLIF(trim(whatsapp), '')
+    FROM manychat_contacts
+    WHERE change_seq > :manychat_mark AND change_seq <= :manychat_limit
+    AND whatsapp > ''
+"""
+
+SQL_RESOLVE_HOTMART = """
+    UPDATE stage_hotmart SET
+        pass = :pass,
+        target_id = COALESCE(
+            (SELECT c.id FROM customers c WHERE c.master_email = stage_hotmart.email_key),
+            (SELECT c.id FROM customers c WHERE c.master_phone = stage_hotmart.phone_key),
+            (SELECT c.id FROM customers c WHERE c.hotmart_id = stage_hotmart.hotmart_id)
+        )
+    WHERE target_id IS NULL
+"""
+
+SQL_RESOLVE_MANYCHAT = """
+    UPDATE stage_manychat SET
+        pass = :pass,
+        target_id = COALESCE(
+            (SELECT c.id FROM customers c WHERE c.master_email = stage_manychat.email_key),
+            (SELECT c.id FROM customers c WHERE c.master_phone = stage_manychat.phone_key)
+        )
+    WHERE target_id IS NULL
+"""
+
+# Staged rows merged into each master row (one winner per master row)
+_HOTMART_MERGE_ROWS = """
+    FROM (
+        SELECT
+            st.*,
+            MAX(st.bought) OVER (PARTITION BY st.target_id) as any_bought,
+            ROW_NUMBER() OVER (
+                PARTITION BY st.target_id ORDER BY st.hotmart_id DESC
+            ) as rn
+        FROM stage_hotmart st
+        WHERE st.target_id IS NOT NULL AND st.pass = :pass
+    ) m
+    WHERE m.rn = 1 AND customers.id = m.target_id
+"""
+
+# Hotmart overwrites almost everything. Attributes always land; the unique
+# identity columns are a separate UPDATE OR IGNORE, so a collision with
+# another master row only skips the identity change.
+SQL_MERGE_HOTMART = f"""
+    UPDATE customers SET
+        name = COALESCE(m.name, customers.name),
+        source = 'HOTMART',
+        has_purchased = CASE WHEN m.any_bought THEN 1 ELSE customers.has_purchased END,
+        segment = COALESCE(m.segment, customers.segment),
+        last_purchase_at = COALESCE(m.last_purchase_at, customers.last_purchase_at),
+        updated_at = :now
+    {_HOTMART_MERGE_ROWS}
+"""
+
+SQL_MERGE_HOTMART_IDENTITY = f"""
+    UPDATE OR IGNORE customers SET
+        master_email = COALESCE(m.email_key, customers.master_email),
+        master_phone = COALESCE(m.phone_key, customers.master_phone),
+        hotmart_id = COALESCE(m.hotmart_id, customers.hotmart_id)
+    {_HOTMART_MERGE_ROWS}
+"""
+
+# Seeded on the same normalized keys the resolve step matches
+SQL_SEED_HOTMART = """
+    INSERT OR IGNORE INTO customers (
+        master_email, master_phone, name, hotmart_id, source,
+        has_purchased, segment, last_purchase_at, updated_at
+    )
+    SELECT
+        email_key, phone_key, name, hotmart_id, 'HOTMART',
+        bought, segment, last_purchase_at, :now
+    FROM stage_hotmart
+    WHERE target_id IS NULL
+    ORDER BY hotmart_id
+"""
+
+_MANYCHAT_MERGE_ROWS = """
+    FROM (
+        SELECT
+            g.target_id,
+            (SELECT s.email_key FROM stage_manychat s
+             WHERE s.target_id = g.target_id AND s.pass = :pass AND s.email_key IS NOT NULL
+             ORDER BY s.manychat_id LIMIT 1) as email,
+            (SELECT s.phone_key FROM stage_manychat s
+             WHERE s.target_id = g.target_id AND s.pass = :pass AND s.phone_key IS NOT NULL
+             ORDER BY s.manychat_id LIMIT 1) as phone,
+            (SELECT s.name FROM stage_manychat s
+             WHERE s.target_id = g.target_id AND s.pass = :pass AND s.name IS NOT NULL
+             ORDER BY s.manychat_id LIMIT 1) as name,
+            (SELECT s.instagram FROM stage_manychat s
+             WHERE s.target_id = g.target_id AND s.pass = :pass AND s.instagram IS NOT NULL
+             ORDER BY s.manychat_id LIMIT 1) as instagram,
+            g.manychat_id,
+            (SELECT s.last_remarketing_at FROM stage_manychat s
+             WHERE s.target_id = g.target_id AND s.pass = :pass
+             AND s.last_remarketing_at IS NOT NULL
+             ORDER BY s.manychat_id DESC LIMIT 1) as last_remarketing_at
+        FROM (
+            SELECT target_id, MIN(manychat_id) as manychat_id
+            FROM stage_manychat
+            WHERE target_id IS NOT NULL AND pass = :pass
+            GROUP BY target_id
+        ) g
+    ) m
+    WHERE customers.id = m.target_id
+"""
+
+# ManyChat fills gaps: first non-empty value wins, except last_remarketing_at
+# (latest contact wins). Rows owned by Hotmart only get instagram/manychat_id.
+SQL_MERGE_MANYCHAT = f"""
+    UPDATE customers SET
+        name = CASE WHEN customers.source = 'MANYCHAT'
+            THEN COALESCE(customers.name, m.name) ELSE customers.name END,
+        instagram = COALESCE(customers.instagram, m.instagram),
+        last_remarketing_at = CASE WHEN customers.source = 'MANYCHAT'
+            THEN COALESCE(m.last_remarketing_at, customers.last_remarketing_at)
+            ELSE customers.last_remarketing_at END,
+        updated_at = :now
+    {_MANYCHAT_MERGE_ROWS}
+"""
+
+SQL_MERGE_MANYCHAT_IDENTITY = f"""
+    UPDATE OR IGNORE customers SET
+        master_email = CASE WHEN customers.source = 'MANYCHAT'
+            THEN COALESCE(customers.master_email, m.email) ELSE customers.master_email END,
+        master_phone = CASE WHEN customers.source = 'MANYCHAT'
+            THEN COALESCE(customers.master_phone, m.phone) ELSE customers.master_phone END,
+        manychat_id = COALESCE(customers.manychat_id, m.manychat_id)
+    {_MANYCHAT_MERGE_ROWS}
+"""
+
+# One new master row per phone (Phone-only rule for ManyChat)
+SQL_SEED_MANYCHAT = """
+    INSERT OR IGNORE INTO customers (
+        master_email, master_phone, name, instagram, manychat_id, source,
+        has_purchased, last_remarketing_at, updated_at
+    )
+    SELECT
+        email_key, phone_key, name, instagram, manychat_id, 'MANYCHAT',
+        0, last_remarketing_at, :now
+    FROM stage_manychat
+    WHERE target_id IS NULL AND phone_key IS NOT NULL
+    AND manychat_id IN (
+        SELECT MIN(manychat_id) FROM stage_manychat
+        WHERE target_id IS NULL
+        GROUP BY phone_key
+    )
+    ORDER BY manychat_id
+"""
+
+# Rows the seed inserted are final: pass 0 keeps them out of the pass-2 merge
+SQL_MARK_SEEDED_HOTMART = """
+    UPDATE stage_hotmart SET
+        pass = 0,
+        target_id = (
+            SELECT c.id FROM customers c WHERE c.hotmart_id = stage_hotmart.hotmart_id
+        )
+    WHERE target_id IS NULL
+"""
+
+SQL_MARK_SEEDED_MANYCHAT = """
+    UPDATE stage_manychat SET
+        pass = 0,
+        target_id = (
+            SELECT c.id FROM customers c WHERE c.manychat_id = stage_manychat.manychat_id
+        )
+    WHERE target_id IS NULL
+"""
+
+
+def create_consolidation_stage(conn: sqlite3.Connection):
+    """Creates the empty TEMP staging tables (also used by query-plan tests)."""
+    for sql in SQL_CREATE_STAGE_TABLES:
+        conn.execute(sql)
+
+
+def _merge_pass(conn, merge_sql: str, identity_sql: str, params: dict) -> int:
+    """Runs one merge pass; returns the master rows whose identity change was skipped."""
+    merged = conn.execute(merge_sql, params).rowcount
+    return merged - conn.execute(identity_sql, params).rowcount
+
+
+def _merge_source(
+    conn,
+    resolve_sql: str,
+    merge_sql: str,
+    identity_sql: str,
+    seed_sql: str,
+    mark_sql: str,
+    now: str,
+) -> int:
+    conn.execute(resolve_sql, {"pass": 1})
+    skipped = _merge_pass(conn, merge_sql, identity_sql, {"pass": 1, "now": now})
+    conn.execute(seed_sql, {"now": now})
+    conn.execute(mark_sql)
+    # Rows that collided with a seed of the same batch now find it
+    conn.execute(resolve_sql, {"pass": 2})
+    skipped += _merge_pass(conn, merge_sql, identity_sql, {"pass": 2, "now": now})
+    return skipped
+
+
+WATERMARK_SOURCES = ("sales", "hotmart_customers", "manychat_contacts")
+
+
+def _load_watermarks(conn: sqlite3.Connection) -> dict:
+    conn.execute(SQL_CREATE_WATERMARKS)
+    return {row[0]: row[1] for row in conn.execute(SQL_LOAD_WATERMARKS)}
+
+
+def _consolidate(conn: sqlite3.Connection, full_rebuild: bool) -> dict:
+    now = datetime.now().isoformat()
+    marks = {} if full_rebuild else _load_watermarks(conn)
+    limits = dict(
+        zip(WATERMARK_SOURCES, conn.execute(SQL_CURRENT_WATERMARKS).fetchone())
+    )
+    params = {
+        "sales_mark": marks.get("sales", ""),
+        "sales_limit": limits["sales"],
+        "hotmart_mark": int(marks.get("hotmart_customers", 0)),
+        "hotmart_limit": limits["hotmart_customers"],
+        "manychat_mark": int(marks.get("manychat_contacts", 0)),
+        "manychat_limit": limits["manychat_contacts"],
+    }
+
+    create_consolidation_stage(conn)
+    try:
+        conn.execute(SQL_CREATE_WATERMARKS)
+
+        # 1. Processar Hotmart (Prioridade)
+        conn.execute(SQL_STAGE_CHANGED_CUSTOMERS, params)
+        conn.execute(SQL_STAGE_SALES_SUMMARY)
+        hotmart_staged = conn.execute(SQL_STAGE_HOTMART).rowcount
+        skipped = _merge_source(
+            conn,
+            SQL_RESOLVE_HOTMART,
+            SQL_MERGE_HOTMART,
+            SQL_MERGE_HOTMART_IDENTITY,
+            SQL_SEED_HOTMART,
+            SQL_MARK_SEEDED_HOTMART,
+            now,
+        )
+
+        # 2. Processar ManyChat (Suplemento)
+        manychat_staged = conn.execute(SQL_STAGE_MANYCHAT, params).rowcount
+        skipped += _merge_source(
+            conn,
+            SQL_RESOLVE_MANYCHAT,
+            SQL_MERGE_MANYCHAT,
+            SQL_MERGE_MANYCHAT_IDENTITY,
+            SQL_SEED_MANYCHAT,
+            SQL_MARK_SEEDED_MANYCHAT,
+            now,
+        )
+
+        if skipped:
+            print(
+                f"Consolidation: {skipped} master row(s) kept their email/phone/id "
+                "(the new value belongs to another master row)."
+            )
+
+        for source, watermark in limits.items():
+            if watermark is not None:
+                conn.execute(
+                    SQL_SAVE_WATERMARK,
+                    {"source": source, "watermark": str(watermark), "now": now},
+                )
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        for sql in SQL_DROP_STAGE_TABLES:
+            conn.execute(sql)
+
+    return {"hotmart": hotmart_staged, "manychat": manychat_staged}
+
+
+def consolidate_all_to_master(conn: sqlite3.Connection) -> dict:
+    """
+    Complete consolidation:
+    1. Rebuild Master from Hotmart (Source of Truth).
+    2. Supplement with ManyChat (Only if has Phone).
+    Runs as a few set-based statements over TEMP staging tables and resets
+    the delta watermarks. Returns how many rows of each source were merged.
+    """
+    return _consolidate(conn, full_rebuild=True)
+
+
+def consolidate_changes_to_master(conn: sqlite3.Connection) -> dict:
+    """
+    Delta consolidation: merges only the Hotmart customers with sales or raw
+    rows imported after the last run and the ManyChat contacts with new ids.
+    Without watermarks (first run) this is the same as a full rebuild.
+    """
+    return _consolidate(conn, full_rebuild=False)
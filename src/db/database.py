@@ -1,12 +1,19 @@
+import hashlib
 import sqlite3
 from datetime import datetime
+from pathlib import Path
 from typing import Optional
 from src.config import Config
-from src.models.schemas import Customer, Product, Sale
+from src.models.schemas import AnyCustomer, AnyProduct, AnySale
+from src.db.consolidation import (  # noqa: F401
+    SQL_CREATE_WATERMARKS,
+    consolidate_all_to_master,
+    consolidate_changes_to_master,
+)
 
 # SQL Templates Gold Layer
-SQL_CREATE_AUDIENCE_ILPI = """
-    CREATE TABLE IF NOT EXISTS audience_ilpi (
+SQL_CREATE_AUDIENCE_TABLE = """
+    CREATE TABLE IF NOT EXISTS {} (
         name TEXT,
         email TEXT PRIMARY KEY,
         phone TEXT,
@@ -17,18 +24,41 @@ SQL_CREATE_AUDIENCE_ILPI = """
     )
 """
 
-SQL_CREATE_AUDIENCE_ESTETICA = """
-    CREATE TABLE IF NOT EXISTS audience_estetica (
-        name TEXT,
-        email TEXT PRIMARY KEY,
-        phone TEXT,
-        country TEXT,
-        state TEXT,
-        value REAL,
-        updated_at TIMESTAMP
+SQL_CREATE_AUDIENCE_ILPI = SQL_CREATE_AUDIENCE_TABLE.format("audience_ilpi")
+SQL_CREATE_AUDIENCE_ESTETICA = SQL_CREATE_AUDIENCE_TABLE.format("audience_estetica")
+
+AUDIENCE_TABLES = ("audience_ilpi", "audience_estetica")
+
+# IDS de produtos mapeados para Estética
+ESTETICA_PRODUCT_IDS = {
+    "5587176",
+    "5554091",
+    "5587203",
+    "5560445",
+    "5588268",
+    "5716749",
+    "6289449",
+    "6289465",
+}
+
+# Product -> audience segment lookup (init_db mirrors ESTETICA_PRODUCT_IDS);
+# products not listed are ILPI
+SQL_CREATE_PRODUCT_SEGMENTS = """
+    CREATE TABLE IF NOT EXISTS product_segments (
+        product_id TEXT PRIMARY KEY,
+        segment TEXT NOT NULL
     )
 """
 
+SQL_UPSERT_PRODUCT_SEGMENT = """
+    INSERT INTO product_segments (product_id, segment) VALUES (?, ?)
+    ON CONFLICT(product_id) DO UPDATE SET segment = excluded.segment
+"""
+
+SQL_LIST_SEGMENT_PRODUCTS = "SELECT product_id FROM product_segments WHERE segment = ?"
+
+SQL_DELETE_PRODUCT_SEGMENT = "DELETE FROM product_segments WHERE product_id = ?"
+
 SQL_CREATE_REMARKETING_HISTORY = """
     CREATE TABLE IF NOT EXISTS remarketing_history (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -42,6 +72,11 @@ SQL_CREATE_REMARKETING_HISTORY = """
     )
 """
 
+SQL_INSERT_AUDIENCE = """
+    INSERT INTO {} (name, email, phone, country, state, value, updated_at)
+    VALUES (:name, :email, :phone, :country, :state, :value, :updated_at)
+"""
+
 SQL_UPSERT_AUDIENCE = """
     INSERT INTO {} (name, email, phone, country, state, value, updated_at)
     VALUES (:name, :email, :phone, :country, :state, :value, :updated_at)
@@ -64,19 +99,318 @@ SQL_UPSERT_SALE = """
         :payment_type, :installments, :approved_date, :order_date,
         :purchased_at, :updated_at, :customer_id, :product_id, :imported_at
     )
+    ON CONFLICT(transaction_id) DO UPDATE SET
+        status = excluded.status,
+        total_price = excluded.total_price,
+        approved_date = excluded.approved_date,
+        updated_at = excluded.updated_at,
+        imported_at = excluded.imported_at
+    WHERE sales.status IS NOT excluded.status
+        OR sales.total_price IS NOT excluded.total_price
+        OR sales.updated_at IS NOT excluded.updated_at
+"""
+
+# Landing replay: the mapping may have changed since the sale was stored, so
+# every mapped column is overwritten (imported_at only moves when one differs)
+SQL_REPLAY_UPSERT_SALE = """
+    INSERT INTO sales (
+        transaction_id, status, total_price, currency, payment_method,
+        payment_type, installments, approved_date, order_date,
+        purchased_at, updated_at, customer_id, product_id, imported_at
+    ) VALUES (
+        :transaction, :status, :total_price, :currency, :payment_method,
+        :payment_type, :installments, :approved_date, :order_date,
+        :purchased_at, :updated_at, :customer_id, :product_id, :imported_at
+    )
+    ON CONFLICT(transaction_id) DO UPDATE SET
+        status = excluded.status,
+        total_price = excluded.total_price,
+        currency = excluded.currency,
+        payment_method = excluded.payment_method,
+        payment_type = excluded.payment_type,
+        installments = excluded.installments,
+        approved_date = excluded.approved_date,
+        order_date = excluded.order_date,
+        purchased_at = excluded.purchased_at,
+        updated_at = excluded.updated_at,
+        customer_id = excluded.customer_id,
+        product_id = excluded.product_id,
+        imported_at = excluded.imported_at
+    WHERE sales.status IS NOT excluded.status
+        OR sales.total_price IS NOT excluded.total_price
+        OR sales.currency IS NOT excluded.currency
+        OR sales.payment_method IS NOT excluded.payment_method
+        OR sales.payment_type IS NOT excluded.payment_type
+        OR sales.installments IS NOT excluded.installments
+        OR sales.approved_date IS NOT excluded.approved_date
+        OR sales.order_date IS NOT excluded.order_date
+        OR sales.purchased_at IS NOT excluded.purchased_at
+        OR sales.updated_at IS NOT excluded.updated_at
+        OR sales.customer_id IS NOT excluded.customer_id
+        OR sales.product_id IS NOT excluded.product_id
 """
 
+# Keeps the most recently inserted row of each transaction
+SQL_DEDUPE_SALES = """
+    DELETE FROM sales
+    WHERE transaction_id IS NOT NULL
+    AND rowid NOT IN (
+        SELECT MAX(rowid) FROM sales
+        WHERE transaction_id IS NOT NULL
+        GROUP BY transaction_id
+    )
+"""
+
+# Natural key of a ManyChat row: same contact exported again = same key.
+# Contacts without phone and email also need name and instagram, or every
+# one registered at the same time would collapse into a single row.
+SQL_MANYCHAT_NATURAL_KEY = """
+    COALESCE(whatsapp, '') || '|' || COALESCE(email, '')
+        || '|' || COALESCE(data_registro, '')
+        || CASE WHEN COALESCE(whatsapp, '') = '' AND COALESCE(email, '') = ''
+            THEN '|' || COALESCE(nome, '') || '|' || COALESCE(instagram, '')
+            ELSE '' END
+"""
+
+SQL_BACKFILL_MANYCHAT_KEYS = f"""
+    UPDATE manychat_contacts SET natural_key = {SQL_MANYCHAT_NATURAL_KEY}
+    WHERE natural_key IS NULL
+"""
+
+# Rows without phone and email keyed before name/instagram joined the key
+SQL_REKEY_ANONYMOUS_MANYCHAT = f"""
+    UPDATE OR IGNORE manychat_contacts SET natural_key = {SQL_MANYCHAT_NATURAL_KEY}
+    WHERE COALESCE(whatsapp, '') = '' AND COALESCE(email, '') = ''
+    AND natural_key IS NOT {SQL_MANYCHAT_NATURAL_KEY}
+"""
+
+# change_seq orders the ManyChat changes (delta consolidation watermark):
+# every insert takes the next value, and the importer bumps it on re-exports.
+# id stays stable, so customers.manychat_id keeps pointing at the contact.
+SQL_CREATE_MANYCHAT_CHANGE_SEQ_TRIGGER = """
+    CREATE TRIGGER IF NOT EXISTS trg_manychat_contacts_change_seq
+    AFTER INSERT ON manychat_contacts
+    WHEN NEW.change_seq IS NULL
+    BEGIN
+        UPDATE manychat_contacts
+        SET change_seq = (SELECT COALESCE(MAX(change_seq), 0) + 1 FROM manychat_contacts)
+        WHERE id = NEW.id;
+    END
+"""
+
+SQL_BACKFILL_MANYCHAT_CHANGE_SEQ = (
+    "UPDATE manychat_contacts SET change_seq = id WHERE change_seq IS NULL"
+)
+
+# Keeps the most recent export of each contact
+SQL_DEDUPE_MANYCHAT = """
+    DELETE FROM manychat_contacts
+    WHERE id NOT IN (
+        SELECT MAX(id) FROM manychat_contacts GROUP BY natural_key
+    )
+"""
+
+SQL_CREATE_MANYCHAT_IMPORT_FILES = """
+    CREATE TABLE IF NOT EXISTS manychat_import_files (
+        file_hash TEXT PRIMARY KEY,
+        file_name TEXT NOT NULL,
+        status TEXT NOT NULL,
+        rows_committed INTEGER NOT NULL DEFAULT 0,
+        rows_inserted INTEGER NOT NULL DEFAULT 0,
+        started_at TIMESTAMP,
+        finished_at TIMESTAMP
+    )
+"""
+
+# Progress of the initial backfill, one row per date window
+SQL_CREATE_SYNC_CHECKPOINTS = """
+    CREATE TABLE IF NOT EXISTS sync_checkpoints (
+        backfill_id TEXT NOT NULL,
+        window_start INTEGER NOT NULL,
+        window_end INTEGER NOT NULL,
+        next_page_token TEXT,
+        pages INTEGER NOT NULL DEFAULT 0,
+        row_count INTEGER NOT NULL DEFAULT 0,
+        status TEXT NOT NULL,
+        updated_at TIMESTAMP,
+        PRIMARY KEY (backfill_id, window_start)
+    )
+"""
+
+
+# Change data capture: a buyer version is only appended when its attribute
+# hash (?15) differs from the current one of the same id (?1)
+SQL_INSERT_HOTMART_CUSTOMER = """
+    INSERT INTO hotmart_customers (
+        id, email, name, phone, document,
+        zip_code, address, number, neighborhood, city, state, country,
+        created_at, updated_at, attr_hash
+    )
+    SELECT ?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8, ?9, ?10, ?11, ?12, ?13, ?14, ?15
+    WHERE NOT EXISTS (
+        SELECT 1 FROM hotmart_customers_current
+        WHERE id = ?1 AND attr_hash = ?15
+    )
+"""
+
+# Latest version of each Hotmart buyer (points at its hotmart_customers row)
+SQL_CREATE_HOTMART_CUSTOMERS_CURRENT = """
+    CREATE TABLE IF NOT EXISTS hotmart_customers_current (
+        id TEXT PRIMARY KEY,
+        row_id INTEGER NOT NULL,
+        attr_hash TEXT,
+        imported_at TIMESTAMP
+    )
+"""
+
+SQL_CREATE_HOTMART_CURRENT_TRIGGER = """
+    CREATE TRIGGER IF NOT EXISTS trg_hotmart_customers_current
+    AFTER INSERT ON hotmart_customers
+    WHEN NEW.id IS NOT NULL
+    BEGIN
+        INSERT INTO hotmart_customers_current (id, row_id, attr_hash, imported_at)
+        VALUES (NEW.id, NEW.row_id, NEW.attr_hash, NEW.imported_at)
+        ON CONFLICT(id) DO UPDATE SET
+            row_id = excluded.row_id,
+            attr_hash = excluded.attr_hash,
+            imported_at = excluded.imported_at;
+    END
+"""
+
+# One-time migration: hash the existing history and point every id at its
+# latest version (same order the consolidation used: imported_at, row_id)
+SQL_BACKFILL_HOTMART_HASHES = """
+    UPDATE hotmart_customers SET attr_hash = customer_attr_hash(
+        email, name, phone, document, zip_code, address, number,
+        neighborhood, city, state, country
+    )
+    WHERE attr_hash IS NULL
+"""
+
+SQL_SEED_HOTMART_CUSTOMERS_CURRENT = """
+    INSERT OR REPLACE INTO hotmart_customers_current (id, row_id, attr_hash, imported_at)
+    SELECT id, row_id, attr_hash, imported_at FROM (
+        SELECT
+            id, row_id, attr_hash, imported_at,
+            ROW_NUMBER() OVER (
+                PARTITION BY id ORDER BY imported_at DESC, row_id DESC
+            ) as rn
+        FROM hotmart_customers
+        WHERE id IS NOT NULL
+    )
+    WHERE rn = 1
+"""
+
+# Remarketing eligibility: a contact with a phone can be contacted again
+# 30 days after both its last remarketing and its last purchase. '' means
+# eligible now; NULL (no phone, unreadable timestamp) means never, which
+# keeps those rows out of the partial index.
+SQL_NEXT_ELIGIBLE_AT = """
+    CASE
+        WHEN COALESCE({row}master_phone, '') = '' THEN NULL
+        WHEN {row}last_remarketing_at IS NOT NULL
+            AND datetime({row}last_remarketing_at) IS NULL THEN NULL
+        WHEN {row}last_purchase_at IS NOT NULL
+            AND datetime({row}last_purchase_at) IS NULL THEN NULL
+        ELSE max(
+            COALESCE(datetime({row}last_remarketing_at, '+30 days'), ''),
+            COALESCE(datetime({row}last_purchase_at, '+30 days'), '')
+        )
+    END
+"""
+
+SQL_CREATE_NEXT_ELIGIBLE_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_customers_next_eligible_insert
+    AFTER INSERT ON customers
+    BEGIN
+        UPDATE customers SET next_eligible_at = {SQL_NEXT_ELIGIBLE_AT.format(row="NEW.")}
+        WHERE id = NEW.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_customers_next_eligible_update
+    AFTER UPDATE OF master_phone, last_remarketing_at, last_purchase_at ON customers
+    BEGIN
+        UPDATE customers SET next_eligible_at = {SQL_NEXT_ELIGIBLE_AT.format(row="NEW.")}
+        WHERE id = NEW.id;
+    END
+    """,
+]
+
+SQL_BACKFILL_NEXT_ELIGIBLE = (
+    f"UPDATE customers SET next_eligible_at = {SQL_NEXT_ELIGIBLE_AT.format(row='')}"
+)
+
+SQL_UPSERT_PRODUCT = """
+    INSERT INTO products (id, name)
+    VALUES (?, ?)
+    ON CONFLICT(id) DO UPDATE SET
+        name=excluded.name
+"""
+
+
+# Managed secondary indexes (created by init_db). Each one backs a query
+# template; tests/test_query_plans.py fails if a template falls back to a
+# full table scan.
+SQL_CREATE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_sales_customer_id ON sales(customer_id)",
+    "CREATE INDEX IF NOT EXISTS idx_sales_imported_at ON sales(imported_at)",
+    "CREATE INDEX IF NOT EXISTS idx_sales_purchased_at ON sales(purchased_at)",
+    "CREATE INDEX IF NOT EXISTS idx_sales_status ON sales(status)",
+    "CREATE INDEX IF NOT EXISTS idx_hotmart_customers_id ON hotmart_customers(id, imported_at)",
+    "CREATE INDEX IF NOT EXISTS idx_manychat_contacts_whatsapp ON manychat_contacts(whatsapp)",
+    "CREATE INDEX IF NOT EXISTS idx_manychat_contacts_change_seq ON manychat_contacts(change_seq)",
+    "CREATE INDEX IF NOT EXISTS idx_customers_next_eligible ON customers(next_eligible_at, id) WHERE next_eligible_at IS NOT NULL",
+]
+
+SQL_MAX_SALE_DATE = "SELECT MAX(purchased_at) as max_date FROM sales"
+
+
+def _tuning_pragmas() -> list[str]:
+    """Pragmas shared by the read-write and read-only profiles."""
+    return [
+        f"PRAGMA busy_timeout = {Config.SQLITE_BUSY_TIMEOUT_MS}",
+        # Negative cache_size is in KiB
+        f"PRAGMA cache_size = -{Config.SQLITE_CACHE_SIZE_KB}",
+        f"PRAGMA mmap_size = {Config.SQLITE_MMAP_SIZE}",
+        "PRAGMA temp_store = MEMORY",
+        "PRAGMA foreign_keys = ON",
+    ]
+
 
 def get_connection(db_path: str = Config.DB_NAME) -> sqlite3.Connection:
-    """Returns a connection to the SQLite database defined by the config."""
-    conn = sqlite3.connect(db_path)
-    # Enable foreign keys
-    conn.execute("PRAGMA foreign_keys = ON;")
+    """
+    Returns a read-write connection to the SQLite database defined by the config.
+    The database runs in WAL mode (readers and the writer do not block each
+    other) with synchronous=NORMAL, which is durable across application
+    crashes and only loses the last commits on power loss.
+    """
+    conn = sqlite3.connect(db_path, timeout=Config.SQLITE_BUSY_TIMEOUT_MS / 1000)
+    for pragma in _tuning_pragmas():
+        conn.execute(pragma)
+    # WAL is persistent in the file; in-memory databases keep "memory"
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
     # Return rows as dictionaries
     conn.row_factory = sqlite3.Row
     return conn
 
 
+def get_read_connection(db_path: str = Config.DB_NAME) -> sqlite3.Connection:
+    """
+    Returns a read-only connection for viewers, exports and reports. It reads
+    the last committed snapshot while the sync writes (WAL) and cannot write.
+    """
+    uri = f"{Path(db_path).resolve().as_uri()}?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, timeout=Config.SQLITE_BUSY_TIMEOUT_MS / 1000)
+    for pragma in _tuning_pragmas():
+        conn.execute(pragma)
+    conn.execute("PRAGMA query_only = ON")
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
 def init_db(conn: sqlite3.Connection):
     """Initializes the SQLite database with the required tables."""
     cur = conn.cursor()
@@ -116,7 +450,9 @@ def init_db(conn: sqlite3.Connection):
             data_contactar TEXT,
             ultima_interacao TEXT,
             data_registro TEXT,
-            imported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            imported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            natural_key TEXT,
+            change_seq INTEGER
         )
     """)
 
@@ -135,7 +471,8 @@ def init_db(conn: sqlite3.Connection):
             segment TEXT,
             last_remarketing_at TIMESTAMP,
             last_purchase_at TIMESTAMP,
-            updated_at TIMESTAMP
+            updated_at TIMESTAMP,
+            next_eligible_at TEXT
         )
     """)
 
@@ -164,6 +501,18 @@ def init_db(conn: sqlite3.Connection):
         cur.execute("ALTER TABLE customers ADD COLUMN last_purchase_at TIMESTAMP")
     except sqlite3.OperationalError:
         pass
+    # Migração: next_eligible_at mantido por triggers; preenchido uma vez
+    has_next_eligible = cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_customers_next_eligible_update'"
+    ).fetchone()
+    if not has_next_eligible:
+        try:
+            cur.execute("ALTER TABLE customers ADD COLUMN next_eligible_at TEXT")
+        except sqlite3.OperationalError:
+            pass
+        cur.execute(SQL_BACKFILL_NEXT_ELIGIBLE)
+    for sql in SQL_CREATE_NEXT_ELIGIBLE_TRIGGERS:
+        cur.execute(sql)
     try:
         cur.execute(
             "ALTER TABLE sales ADD COLUMN imported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP"
@@ -197,6 +546,17 @@ def init_db(conn: sqlite3.Connection):
         )
     """)
 
+    # Migração: transaction_id único. Bancos antigos têm linhas repetidas
+    # a cada sync incremental; removemos as duplicatas uma única vez.
+    has_unique_txn = cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_sales_transaction_id'"
+    ).fetchone()
+    if not has_unique_txn:
+        cur.execute(SQL_DEDUPE_SALES)
+        cur.execute(
+            "CREATE UNIQUE INDEX idx_sales_transaction_id ON sales(transaction_id)"
+        )
+
     cur.execute("""
         CREATE TABLE IF NOT EXISTS hotmart_sales_products (
             row_id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -231,98 +591,297 @@ def init_db(conn: sqlite3.Connection):
         )
     """)
 
+    # Migração: CDC em hotmart_customers. Cada versão guarda o hash dos
+    # atributos; a tabela current aponta para a última versão de cada id.
+    try:
+        cur.execute("ALTER TABLE hotmart_customers ADD COLUMN attr_hash TEXT")
+    except sqlite3.OperationalError:
+        pass
+    has_current = cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'hotmart_customers_current'"
+    ).fetchone()
+    cur.execute(SQL_CREATE_HOTMART_CUSTOMERS_CURRENT)
+    if not has_current:
+        conn.create_function("customer_attr_hash", 11, _attr_hash, deterministic=True)
+        cur.execute(SQL_BACKFILL_HOTMART_HASHES)
+        cur.execute(SQL_SEED_HOTMART_CUSTOMERS_CURRENT)
+    cur.execute(SQL_CREATE_HOTMART_CURRENT_TRIGGER)
+
+    # Migração: chave natural única em manychat_contacts. Re-exportar o mesmo
+    # contato duplicava a linha; removemos as duplicatas uma única vez.
+    try:
+        cur.execute("ALTER TABLE manychat_contacts ADD COLUMN natural_key TEXT")
+    except sqlite3.OperationalError:
+        pass
+    has_unique_key = cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_manychat_contacts_natural_key'"
+    ).fetchone()
+    if not has_unique_key:
+        cur.execute(SQL_BACKFILL_MANYCHAT_KEYS)
+        cur.execute(SQL_DEDUPE_MANYCHAT)
+        cur.execute(
+            "CREATE UNIQUE INDEX idx_manychat_contacts_natural_key ON manychat_contacts(natural_key)"
+        )
+    cur.execute(SQL_REKEY_ANONYMOUS_MANYCHAT)
+
+    # Migração: change_seq (watermark do ManyChat), preenchido uma vez com o id
+    has_change_seq = cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_manychat_contacts_change_seq'"
+    ).fetchone()
+    if not has_change_seq:
+        try:
+            cur.execute("ALTER TABLE manychat_contacts ADD COLUMN change_seq INTEGER")
+        except sqlite3.OperationalError:
+            pass
+        cur.execute(SQL_BACKFILL_MANYCHAT_CHANGE_SEQ)
+    cur.execute(SQL_CREATE_MANYCHAT_CHANGE_SEQ_TRIGGER)
+
+    # Ledger of imported ManyChat files (content hash + resume point)
+    cur.execute(SQL_CREATE_MANYCHAT_IMPORT_FILES)
+
+    # Checkpoints of the parallel initial backfill
+    cur.execute(SQL_CREATE_SYNC_CHECKPOINTS)
+
     # Gold Layer: Audiences
     cur.execute(SQL_CREATE_AUDIENCE_ILPI)
     cur.execute(SQL_CREATE_AUDIENCE_ESTETICA)
     cur.execute(SQL_CREATE_REMARKETING_HISTORY)
 
+    # Segment lookup (read by consolidation and audiences) mirrors the
+    # product ids mapped in code, removals included
+    cur.execute(SQL_CREATE_PRODUCT_SEGMENTS)
+    cur.executemany(
+        SQL_UPSERT_PRODUCT_SEGMENT,
+        [(pid, "ESTETICA") for pid in sorted(ESTETICA_PRODUCT_IDS)],
+    )
+    stale = [
+        (row[0],)
+        for row in cur.execute(SQL_LIST_SEGMENT_PRODUCTS, ("ESTETICA",)).fetchall()
+        if row[0] not in ESTETICA_PRODUCT_IDS
+    ]
+    cur.executemany(SQL_DELETE_PRODUCT_SEGMENT, stale)
+
+    # Delta consolidation watermarks
+    cur.execute(SQL_CREATE_WATERMARKS)
+
+    for sql in SQL_CREATE_INDEXES:
+        cur.execute(sql)
+
     conn.commit()
 
 
-def upsert_customer(conn: sqlite3.Connection, customer: Customer):
-    """Inserts a customer record as a Raw log (Append)."""
-    conn.execute(
-        """
-        INSERT INTO hotmart_customers (
-            id, email, name, phone, document, 
-            zip_code, address, number, neighborhood, city, state, country, 
-            created_at, updated_at
-        )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """,
-        (
-            customer.id,
-            customer.email,
-            customer.name,
-            customer.phone,
-            customer.document,
-            customer.zip_code,
-            customer.address,
-            customer.number,
-            customer.neighborhood,
-            customer.city,
-            customer.state,
-            customer.country,
-            customer.created_at.isoformat(),
-            customer.updated_at.isoformat() if customer.updated_at else None,
-        ),
-    )
+# Buyer attributes tracked by the CDC hash (created_at/updated_at come from
+# the sale, so they would make every sale a new version)
+CUSTOMER_HASH_FIELDS = (
+    "email",
+    "name",
+    "phone",
+    "document",
+    "zip_code",
+    "address",
+    "number",
+    "neighborhood",
+    "city",
+    "state",
+    "country",
+)
 
 
-def upsert_product(conn: sqlite3.Connection, product: Product):
-    """Inserts or updates a product record."""
-    conn.execute(
-        """
-        INSERT INTO products (id, name)
-        VALUES (?, ?)
-        ON CONFLICT(id) DO UPDATE SET
-            name=excluded.name
-    """,
-        (product.id, product.name),
+def _attr_hash(*values) -> str:
+    raw = "\x1f".join("\x00" if v is None else str(v) for v in values)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def customer_attr_hash(customer: AnyCustomer) -> str:
+    """Hash of the buyer attributes; a new raw version is kept only when it changes."""
+    return _attr_hash(*(getattr(customer, field) for field in CUSTOMER_HASH_FIELDS))
+
+
+def _customer_params(customer: AnyCustomer) -> tuple:
+    return (
+        customer.id,
+        customer.email,
+        customer.name,
+        customer.phone,
+        customer.document,
+        customer.zip_code,
+        customer.address,
+        customer.number,
+        customer.neighborhood,
+        customer.city,
+        customer.state,
+        customer.country,
+        customer.created_at.isoformat(),
+        customer.updated_at.isoformat() if customer.updated_at else None,
+        customer_attr_hash(customer),
     )
 
 
-def upsert_sale(conn: sqlite3.Connection, sale: Sale, imported_at: str = None):
-    """Upserts a sale record using its transaction ID. Merges with existing records."""
-    cur = conn.cursor()
+def _product_params(product: AnyProduct) -> tuple:
+    return (product.id, product.name)
 
-    if imported_at is None:
-        imported_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-    # Prepare data dict for named parameters mapping transaction -> transaction_id
-    data = {
-        **sale.model_dump(),
+def _sale_params(sale: AnySale, imported_at: str) -> dict:
+    # Read the attributes directly: works for the models and the slots records
+    return {
         "transaction": sale.transaction,
+        "status": sale.status,
+        "total_price": sale.total_price,
+        "currency": sale.currency,
+        "payment_method": sale.payment_method,
+        "payment_type": sale.payment_type,
+        "installments": sale.installments,
+        "approved_date": sale.approved_date,
+        "order_date": sale.order_date,
+        "purchased_at": sale.purchased_at.isoformat() if sale.purchased_at else None,
+        "updated_at": sale.updated_at.isoformat() if sale.updated_at else None,
+        "customer_id": sale.customer_id,
+        "product_id": sale.product_id,
         "imported_at": imported_at,
     }
 
-    # SQLite named parameters don't handle datetime well in :memory: tests sometimes
-    # if not properly converted, but schemas.py uses datetime objects.
-    # Pydantic's model_dump() with mode='json' or manual string conversion handles it.
-    for k, v in data.items():
-        if isinstance(v, datetime):
-            data[k] = v.isoformat()
 
-    cur.execute(SQL_UPSERT_SALE, data)
+def upsert_customer(conn: sqlite3.Connection, customer: AnyCustomer):
+    """
+    Appends a customer version to the Raw log when its attributes changed
+    (see SQL_INSERT_HOTMART_CUSTOMER); hotmart_customers_current follows it.
+    """
+    conn.execute(SQL_INSERT_HOTMART_CUSTOMER, _customer_params(customer))
+
+
+def upsert_product(conn: sqlite3.Connection, product: AnyProduct):
+    """Inserts or updates a product record."""
+    conn.execute(SQL_UPSERT_PRODUCT, _product_params(product))
+
+
+def upsert_sale(conn: sqlite3.Connection, sale: AnySale, imported_at: str = None):
+    """
+    Upserts a sale record using its transaction ID. An existing sale only has
+    status, price and dates refreshed (and imported_at bumped) when they changed.
+    """
+    cur = conn.cursor()
+
+    if imported_at is None:
+        imported_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    cur.execute(SQL_UPSERT_SALE, _sale_params(sale, imported_at))
     conn.commit()
 
 
+def _write_sale_records(conn: sqlite3.Connection, params: list, replay: bool):
+    sale_sql = SQL_REPLAY_UPSERT_SALE if replay else SQL_UPSERT_SALE
+    conn.executemany(SQL_INSERT_HOTMART_CUSTOMER, [p[0] for p in params])
+    conn.executemany(SQL_UPSERT_PRODUCT, [p[1] for p in params])
+    conn.executemany(sale_sql, [p[2] for p in params])
+
+
+def bulk_upsert_sales(
+    conn: sqlite3.Connection,
+    records: list[tuple[AnyCustomer, AnyProduct, AnySale]],
+    imported_at: str = None,
+    replay: bool = False,
+) -> int:
+    """
+    Writes a page of (customer, product, sale) records with executemany inside
+    a single transaction. If the batch fails, it is retried record by record,
+    each under its own SAVEPOINT, so a bad record only skips itself.
+    replay overwrites every mapped sale column (SQL_REPLAY_UPSERT_SALE).
+    Does not commit: the caller commits once per page.
+    Returns the number of records written.
+    """
+    if imported_at is None:
+        imported_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    params = []
+    for customer, product, sale in records:
+        try:
+            params.append(
+                (
+                    _customer_params(customer),
+                    _product_params(product),
+                    _sale_params(sale, imported_at),
+                )
+            )
+        except Exception as e:
+            print(f"Skipping malformed item {getattr(sale, 'transaction', '?')}: {e}")
+
+    if not params:
+        return 0
+
+    # Keep the page inside one transaction (a bare SAVEPOINT would autocommit on RELEASE)
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+
+    conn.execute("SAVEPOINT sales_page")
+    try:
+        _write_sale_records(conn, params, replay)
+        conn.execute("RELEASE SAVEPOINT sales_page")
+        return len(params)
+    except sqlite3.Error as e:
+        print(f"Batch write failed ({e}). Retrying item by item...")
+        conn.execute("ROLLBACK TO SAVEPOINT sales_page")
+        conn.execute("RELEASE SAVEPOINT sales_page")
+
+    written = 0
+    for item_params in params:
+        conn.execute("SAVEPOINT sales_item")
+        try:
+            _write_sale_records(conn, [item_params], replay)
+            conn.execute("RELEASE SAVEPOINT sales_item")
+            written += 1
+        except sqlite3.Error as e:
+            conn.execute("ROLLBACK TO SAVEPOINT sales_item")
+            conn.execute("RELEASE SAVEPOINT sales_item")
+            print(f"Skipping item {item_params[2]['transaction']}: {e}")
+
+    return written
+
+
 def upsert_audience_member(conn: sqlite3.Connection, table_name: str, data: dict):
     """
     Upserts a member into a specific audience table (Gold layer).
     """
     cur = conn.cursor()
     # Sanitize table name (should only be internal constants)
-    if table_name not in ("audience_ilpi", "audience_estetica"):
+    if table_name not in AUDIENCE_TABLES:
         raise ValueError(f"Invalid audience table name: {table_name}")
 
     cur.execute(SQL_UPSERT_AUDIENCE.format(table_name), data)
     conn.commit()
 
 
+def rebuild_audience_tables(conn: sqlite3.Connection, members: dict):
+    """
+    Replaces whole audience tables ({table_name: [member dict, ...]}).
+    Each table is bulk-loaded into a <table>_shadow copy and swapped in with
+    DROP + RENAME, all in a single transaction: readers keep seeing the
+    previous complete audience until the one commit.
+    """
+    for table_name in members:
+        # Sanitize table name (should only be internal constants)
+        if table_name not in AUDIENCE_TABLES:
+            raise ValueError(f"Invalid audience table name: {table_name}")
+
+    # DDL must run inside the transaction (a bare DROP would autocommit)
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    try:
+        for table_name, rows in members.items():
+            shadow = f"{table_name}_shadow"
+            conn.execute(f"DROP TABLE IF EXISTS {shadow}")
+            conn.execute(SQL_CREATE_AUDIENCE_TABLE.format(shadow))
+            conn.executemany(SQL_INSERT_AUDIENCE.format(shadow), rows)
+            conn.execute(f"DROP TABLE IF EXISTS {table_name}")
+            conn.execute(f"ALTER TABLE {shadow} RENAME TO {table_name}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
 def get_max_sale_date(conn: sqlite3.Connection) -> Optional[str]:
     """Retrieves the latest purchased_at date from the sales table."""
-    row = conn.execute("SELECT MAX(purchased_at) as max_date FROM sales").fetchone()
+    row = conn.execute(SQL_MAX_SALE_DATE).fetchone()
     if row and row["max_date"]:
         return row["max_date"]
     return None
@@ -467,80 +1026,3 @@ def upsert_master_customer(
                 now,
             ),
         )
-
-
-def consolidate_all_to_master(conn: sqlite3.Connection):
-    """
-    Complete consolidation:
-    1. Rebuild Master from Hotmart (Source of Truth).
-    2. Supplement with ManyChat (Only if has Phone).
-    """
-    from src.logic.user_logic import get_segment_for_products
-
-    cur = conn.cursor()
-
-    # 1. Processar Hotmart (Prioridade)
-    # Pegamos a versão mais RECENTE de cada cliente no Raw
-    cur.execute("""
-        WITH LatestHotmart AS (
-            SELECT *, ROW_NUMBER() OVER (PARTITION BY id ORDER BY imported_at DESC) as rn
-            FROM hotmart_customers
-        )
-        SELECT 
-            c.id as hotmart_id,
-            c.email as master_email,
-            c.phone as master_phone,
-            c.name,
-            (
-                SELECT s.purchased_at 
-                FROM sales s 
-                WHERE s.customer_id = c.id 
-                ORDER BY s.purchased_at DESC 
-                LIMIT 1
-            ) as last_purchase_at,
-            (SELECT GROUP_CONCAT(DISTINCT s.product_id) FROM sales s WHERE s.customer_id = c.id) as product_ids,
-            (SELECT MAX(CASE WHEN s.status IN ('APPROVED', 'COMPLETE') THEN 1 ELSE 0 END) FROM sales s WHERE s.customer_id = c.id) as bought
-        FROM LatestHotmart c
-        WHERE c.rn = 1
-    """)
-    hotmart_users = cur.fetchall()
-
-    for row in hotmart_users:
-        p_ids = row["product_ids"].split(",") if row["product_ids"] else []
-        segment = get_segment_for_products(p_ids)
-
-        upsert_master_customer(
-            conn,
-            source="HOTMART",
-            email=row["master_email"],
-            phone=row["master_phone"],
-            name=row["name"],
-            hotmart_id=row["hotmart_id"],
-            has_purchased=bool(row["bought"]),
-            segment=segment,
-            last_purchase_at=row["last_purchase_at"],
-        )
-
-    # 2. Processar ManyChat (Suplemento)
-    cur.execute("""
-        SELECT 
-            email, whatsapp as phone, nome as name, instagram, 
-            id as manychat_id, data_remarketing as last_remarketing_at
-        FROM manychat_contacts
-        WHERE whatsapp IS NOT NULL AND whatsapp != ''
-    """)
-    manychat_users = cur.fetchall()
-
-    for row in manychat_users:
-        upsert_master_customer(
-            conn,
-            source="MANYCHAT",
-            email=row["email"],
-            phone=row["phone"],
-            name=row["name"],
-            instagram=row["instagram"],
-            manychat_id=row["manychat_id"],
-            last_remarketing_at=row["last_remarketing_at"],
-        )
-
-    conn.commit()
@@ -1,14 +1,23 @@
 import os
+import json
+import time
 import base64
+import threading
 import requests
 from typing import Optional
 
 
 class HotmartAuth:
     AUTH_URL = "https://api-sec-vlc.hotmart.com/security/oauth/token"
+    # Refresh this many seconds before expires_in runs out
+    REFRESH_MARGIN_SECONDS = 60
 
     def __init__(
-        self, client_id: Optional[str] = None, client_secret: Optional[str] = None
+        self,
+        client_id: Optional[str] = None,
+        client_secret: Optional[str] = None,
+        session: Optional[requests.Session] = None,
+        token_cache_path: Optional[str] = None,
     ):
         self.client_id = client_id or os.getenv("HOTMART_CLIENT_ID")
         self.client_secret = client_secret or os.getenv("HOTMART_CLIENT_SECRET")
@@ -19,16 +28,58 @@ class HotmartAuth:
             )
 
         self._access_token: Optional[str] = None
+        # Unix timestamp; None means the API did not send expires_in
+        self._expires_at: Optional[float] = None
+        # Single-flight: only one thread talks to the auth endpoint at a time
+        self._lock = threading.Lock()
+        # Shared with HotmartClient so the token call reuses the pooled connections
+        self.session = session
+        # Optional file so scheduler restarts skip a new auth round trip
+        self.token_cache_path = token_cache_path or os.getenv("HOTMART_TOKEN_CACHE")
 
     def _get_basic_auth_header(self) -> str:
         credentials = f"{self.client_id}:{self.client_secret}"
         encoded_credentials = base64.b64encode(credentials.encode()).decode()
         return f"Basic {encoded_credentials}"
 
+    def _is_token_fresh(self) -> bool:
+        if not self._access_token:
+            return False
+        if self._expires_at is None:
+            return True
+        return time.time() < self._expires_at - self.REFRESH_MARGIN_SECONDS
+
     def get_access_token(self, force_refresh: bool = False) -> str:
-        if self._access_token and not force_refresh:
+        if not force_refresh and self._is_token_fresh():
             return self._access_token
 
+        with self._lock:
+            # Another thread may have refreshed while we waited for the lock
+            if not force_refresh and self._is_token_fresh():
+                return self._access_token
+
+            if not force_refresh and self._load_cached_token():
+                return self._access_token
+
+            return self._request_new_token()
+
+    def invalidate(self, rejected_token: str):
+        """
+        Drops rejected_token (e.g. after a 401) so the next get_access_token() call
+        re-authenticates. No-op if another thread already replaced it.
+        """
+        with self._lock:
+            if self._access_token != rejected_token:
+                return
+            self._access_token = None
+            self._expires_at = None
+            if self.token_cache_path and os.path.exists(self.token_cache_path):
+                try:
+                    os.remove(self.token_cache_path)
+                except OSError:
+                    pass
+
+    def _request_new_token(self) -> str:
         headers = {
             "Authorization": self._get_basic_auth_header(),
             "Content-Type": "application/json",
@@ -36,15 +87,64 @@ class HotmartAuth:
 
         url = f"{self.AUTH_URL}?grant_type=client_credentials"
 
-        response = requests.post(url, headers=headers)
+        http = self.session or requests
+        response = http.post(url, headers=headers)
         response.raise_for_status()
 
         data = response.json()
-        self._access_token = data.get("access_token")
+        access_token = data.get("access_token")
 
-        if not self._access_token:
+        if not access_token:
             raise ValueError(
                 "Failed to retrieve access_token from Hotmart API response."
             )
 
+        expires_in = data.get("expires_in")
+        self._access_token = access_token
+        self._expires_at = time.time() + float(expires_in) if expires_in else None
+        self._save_cached_token()
+
         return self._access_token
+
+    def _load_cached_token(self) -> bool:
+        """Restores a still-fresh token from token_cache_path, if any."""
+        if not self.token_cache_path or not os.path.exists(self.token_cache_path):
+            return False
+        try:
+            with open(self.token_cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if cached.get("client_id") != self.client_id:
+            return False
+
+        self._access_token = cached.get("access_token")
+        self._expires_at = cached.get("expires_at")
+        if self._is_token_fresh():
+            return True
+
+        self._access_token = None
+        self._expires_at = None
+        return False
+
+    def _save_cached_token(self):
+        if not self.token_cache_path:
+            return
+        payload = {
+            "client_id": self.client_id,
+            "access_token": self._access_token,
+            "expires_at": self._expires_at,
+        }
+        try:
+            cache_dir = os.path.dirname(self.token_cache_path)
+            if cache_dir:
+                os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f"{self.token_cache_path}.tmp"
+            # The token is a credential: keep the file private to the user
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(payload, f)
+            os.replace(tmp_path, self.token_cache_path)
+        except OSError as e:
+            print(f"Warning: Could not persist Hotmart token cache: {e}")
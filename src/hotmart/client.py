@@ -1,16 +1,31 @@
 import requests
 from typing import Dict, Any, Optional
 from src.hotmart.auth import HotmartAuth
+from src.hotmart.session import build_session, get_connection_stats
+from src.hotmart.rate_limit import RequestScheduler
+from src.config import Config
 
 
 class HotmartClient:
     BASE_URL = "https://developers.hotmart.com/payments/api/v1"
 
-    def __init__(self, auth: Optional[HotmartAuth] = None):
-        self.auth = auth or HotmartAuth()
+    def __init__(
+        self,
+        auth: Optional[HotmartAuth] = None,
+        session: Optional[requests.Session] = None,
+        pool_size: Optional[int] = None,
+        scheduler: Optional[RequestScheduler] = None,
+    ):
+        # One pooled keep-alive session for every call of this client
+        self.session = session or build_session(pool_size or Config.HOTMART_POOL_SIZE)
+        self.auth = auth or HotmartAuth(session=self.session)
+        if self.auth.session is None:
+            self.auth.session = self.session
+        # Token bucket + retry/backoff shared by every thread using this client
+        self.scheduler = scheduler or RequestScheduler.from_config()
 
-    def get_headers(self) -> Dict[str, str]:
-        token = self.auth.get_access_token()
+    def get_headers(self, token: Optional[str] = None) -> Dict[str, str]:
+        token = token or self.auth.get_access_token()
         return {
             "Authorization": f"Bearer {token}",
             "Content-Type": "application/json",
@@ -19,12 +34,40 @@ class HotmartClient:
 
     def _request(self, method: str, endpoint: str, **kwargs) -> Dict[str, Any]:
         url = f"{self.BASE_URL}/{endpoint.lstrip('/')}"
-        headers = self.get_headers()
+        extra_headers = kwargs.pop("headers", None) or {}
+
+        token = self.auth.get_access_token()
+        auth_retried = False
+        attempt = 0
+
+        while True:
+            self.scheduler.acquire(endpoint)
+            try:
+                response = self._send(method, url, token, extra_headers, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if not self.scheduler.can_retry(attempt):
+                    raise
+                self.scheduler.wait_before_retry(endpoint, attempt)
+                attempt += 1
+                continue
+
+            self.scheduler.observe(endpoint, response)
 
-        if "headers" in kwargs:
-            headers.update(kwargs.pop("headers"))
+            if response.status_code == 401 and not auth_retried:
+                # Token revoked or expired early: re-authenticate once and retry
+                auth_retried = True
+                self.auth.invalidate(token)
+                token = self.auth.get_access_token()
+                continue
+
+            if self.scheduler.should_retry(response, attempt):
+                # Throttled (429) or transient 5xx: back off instead of losing the page
+                self.scheduler.wait_before_retry(endpoint, attempt, response)
+                attempt += 1
+                continue
+
+            break
 
-        response = requests.request(method, url, headers=headers, **kwargs)
         response.raise_for_status()
 
         # Some Hotmart endpoints might return 204 No Content
@@ -33,6 +76,17 @@ class HotmartClient:
 
         return response.json()
 
+    def _send(
+        self, method: str, url: str, token: str, extra_headers: Dict[str, str], **kwargs
+    ) -> requests.Response:
+        headers = self.get_headers(token)
+        headers.update(extra_headers)
+        return self.session.request(method, url, headers=headers, **kwargs)
+
+    def connection_stats(self) -> Dict[str, int]:
+        """Connections opened vs reused by this client's session (auth included)."""
+        return get_connection_stats(self.session)
+
     def get(self, endpoint: str, **kwargs) -> Dict[str, Any]:
         """Performs a GET request to the Hotmart API."""
         return self._request("GET", endpoint, **kwargs)
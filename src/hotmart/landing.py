@@ -0,0 +1,92 @@
+import gzip
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Iterator, Optional
+from src.config import Config
+
+# =====================================================================
+# Raw landing zone of the Hotmart sync.
+#
+# Every /sales/history page is written, together with the enrichment
+# (/sales/users user, /sales/price/details payload) of each item, as one
+# gzip'd JSON Lines file. Files are append-only (never overwritten), so a
+# mapping change can be replayed locally (see src/pipelines/replay_landing.py)
+# instead of crawling the API again.
+# =====================================================================
+
+LANDING_SUFFIX = ".jsonl.gz"
+
+
+class LandingZone:
+    """
+    Writes one <run_id>-<seq>.jsonl.gz file per page under directory.
+    Thread-safe: the backfill workers land their pages concurrently.
+    """
+
+    def __init__(self, directory: str, run_id: Optional[str] = None):
+        self.directory = directory
+        self.run_id = run_id or datetime.now().strftime("%Y%m%dT%H%M%S%f")
+        self._seq = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _next_path(self) -> str:
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+        return os.path.join(self.directory, f"{self.run_id}-{seq:06d}{LANDING_SUFFIX}")
+
+    def write_page(
+        self, items: list[dict], enrichments: list[tuple[dict, dict]]
+    ) -> Optional[str]:
+        """Lands a page (items in page order). Returns the file written."""
+        if not items:
+            return None
+        path = self._next_path()
+        # "xb": a landed file is never overwritten
+        with gzip.open(path, "xb") as f:
+            for item, (user_detail, price_detail) in zip(items, enrichments):
+                line = {
+                    "item": item,
+                    "user_detail": user_detail,
+                    "price_detail": price_detail,
+                }
+                f.write(json.dumps(line, ensure_ascii=False).encode("utf-8"))
+                f.write(b"\n")
+        return path
+
+
+def open_landing_zone() -> Optional[LandingZone]:
+    """Opens the configured landing zone, or None when HOTMART_LANDING_DIR is empty."""
+    if not Config.HOTMART_LANDING_DIR:
+        return None
+    return LandingZone(Config.HOTMART_LANDING_DIR)
+
+
+def list_landing_files(directory: str) -> list[str]:
+    """Landed files in write order (run id, then page sequence)."""
+    if not os.path.isdir(directory):
+        return []
+    return [
+        os.path.join(directory, name)
+        for name in sorted(os.listdir(directory))
+        if name.endswith(LANDING_SUFFIX)
+    ]
+
+
+def read_landing_file(path: str) -> Iterator[tuple[dict, tuple[dict, dict]]]:
+    """Yields (item, (user_detail, price_detail)) for every landed sale."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield (
+                record["item"],
+                (
+                    record.get("user_detail") or {},
+                    record.get("price_detail") or {},
+                ),
+            )
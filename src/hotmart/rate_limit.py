@@ -0,0 +1,200 @@
+import time
+import random
+import threading
+import requests
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+from src.config import Config
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. rate is in requests per second; rate <= 0 means
+    no client-side cap (only pauses requested by the server are enforced).
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = self.capacity
+        self._last = clock()
+        self._paused_until = 0.0
+
+    def _reserve(self) -> float:
+        """Takes a token (possibly going negative) and returns how long to wait."""
+        with self._lock:
+            now = self._clock()
+            wait = 0.0
+            if self.rate > 0:
+                elapsed = now - self._last
+                self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+                self._tokens -= 1
+                if self._tokens < 0:
+                    wait = -self._tokens / self.rate
+            self._last = now
+            return max(wait, self._paused_until - now)
+
+    def acquire(self) -> float:
+        """Blocks until the request may be sent. Returns the time waited."""
+        wait = self._reserve()
+        if wait > 0:
+            self._sleep(wait)
+        return max(wait, 0.0)
+
+    def pause_for(self, seconds: float):
+        """Holds every caller for the given time (server asked us to slow down)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+
+class RequestScheduler:
+    """
+    Rate-limit-aware scheduling for HotmartClient requests:
+    - a global token bucket plus optional per-endpoint budgets;
+    - honors Retry-After and X-RateLimit-Remaining / X-RateLimit-Reset headers;
+    - retries 429/5xx and connection errors with exponential backoff and full jitter.
+    """
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(
+        self,
+        rate: float = 0.0,
+        endpoint_rates: Optional[Dict[str, float]] = None,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._clock = clock
+        self._sleep = sleep
+        self._global = TokenBucket(rate, clock=clock, sleep=sleep)
+        self._endpoints = {
+            self._normalize(endpoint): TokenBucket(ep_rate, clock=clock, sleep=sleep)
+            for endpoint, ep_rate in (endpoint_rates or {}).items()
+        }
+
+    @classmethod
+    def from_config(cls) -> "RequestScheduler":
+        return cls(
+            rate=Config.HOTMART_RATE_LIMIT_RPS,
+            endpoint_rates=Config.get_hotmart_endpoint_rates(),
+            max_retries=Config.HOTMART_MAX_RETRIES,
+            backoff_base=Config.HOTMART_BACKOFF_BASE,
+            backoff_max=Config.HOTMART_BACKOFF_MAX,
+        )
+
+    @staticmethod
+    def _normalize(endpoint: str) -> str:
+        return endpoint.split("?", 1)[0].strip("/")
+
+    def _buckets(self, endpoint: str):
+        buckets = [self._global]
+        endpoint_bucket = self._endpoints.get(self._normalize(endpoint))
+        if endpoint_bucket:
+            buckets.append(endpoint_bucket)
+        return buckets
+
+    def acquire(self, endpoint: str):
+        """Waits for the global budget and, if configured, the endpoint budget."""
+        for bucket in self._buckets(endpoint):
+            bucket.acquire()
+
+    def observe(self, endpoint: str, response: requests.Response):
+        """Pauses the endpoint's buckets when the server says the quota is spent."""
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        if remaining is None:
+            return
+        try:
+            if int(float(remaining)) > 0:
+                return
+        except ValueError:
+            return
+
+        delay = self._parse_reset(response.headers.get("X-RateLimit-Reset"))
+        if delay:
+            for bucket in self._buckets(endpoint):
+                bucket.pause_for(delay)
+
+    def can_retry(self, attempt: int) -> bool:
+        return attempt < self.max_retries
+
+    def should_retry(self, response: requests.Response, attempt: int) -> bool:
+        return response.status_code in self.RETRY_STATUSES and self.can_retry(attempt)
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Exponential backoff with full jitter: uniform(0, min(max, base * 2^n))."""
+        ceiling = min(self.backoff_max, self.backoff_base * (2**attempt))
+        return random.uniform(0, ceiling)
+
+    def wait_before_retry(
+        self, endpoint: str, attempt: int, response: Optional[requests.Response] = None
+    ) -> float:
+        """
+        Sleeps before a retry. A server-provided delay (Retry-After or
+        X-RateLimit-Reset) pauses every request to the endpoint; otherwise only
+        the calling thread backs off. Returns the delay applied.
+        """
+        server_delay = None
+        if response is not None:
+            server_delay = self._parse_retry_after(response.headers.get("Retry-After"))
+            if server_delay is None and response.status_code == 429:
+                server_delay = self._parse_reset(
+                    response.headers.get("X-RateLimit-Reset")
+                )
+
+        if server_delay is not None:
+            for bucket in self._buckets(endpoint):
+                bucket.pause_for(server_delay)
+            return server_delay
+
+        delay = self.backoff_delay(attempt)
+        self._sleep(delay)
+        return delay
+
+    @staticmethod
+    def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+        """Retry-After is either delta-seconds or an HTTP date."""
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+    @staticmethod
+    def _parse_reset(value: Optional[str]) -> Optional[float]:
+        """X-RateLimit-Reset may be seconds until reset or a unix timestamp."""
+        if not value:
+            return None
+        try:
+            reset = float(value)
+        except ValueError:
+            return None
+        # Large values are epoch timestamps (seconds or milliseconds)
+        if reset > 1e12:
+            reset = reset / 1000.0 - time.time()
+        elif reset > 1e9:
+            reset = reset - time.time()
+        return max(reset, 0.0)
@@ -1,6 +1,141 @@
+import json
+import sqlite3
+import threading
+import time
 from src.hotmart.client import HotmartClient
 from src.models.schemas import HotmartSalesRequestParams
-from typing import Dict, Any, Optional
+from src.config import Config
+from typing import Callable, Dict, Any, Optional
+
+SQL_CREATE_RESPONSE_CACHE = """
+    CREATE TABLE IF NOT EXISTS hotmart_response_cache (
+        endpoint TEXT NOT NULL,
+        transaction_id TEXT NOT NULL,
+        sale_status TEXT,
+        payload TEXT NOT NULL,
+        fetched_at REAL NOT NULL,
+        PRIMARY KEY (endpoint, transaction_id)
+    )
+"""
+
+SQL_GET_CACHED_RESPONSE = """
+    SELECT sale_status, payload, fetched_at
+    FROM hotmart_response_cache
+    WHERE endpoint = ? AND transaction_id = ?
+"""
+
+SQL_PUT_CACHED_RESPONSE = """
+    INSERT INTO hotmart_response_cache (endpoint, transaction_id, sale_status, payload, fetched_at)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(endpoint, transaction_id) DO UPDATE SET
+        sale_status = excluded.sale_status,
+        payload = excluded.payload,
+        fetched_at = excluded.fetched_at
+"""
+
+
+class ResponseCache:
+    """
+    On-disk (SQLite) cache of the per-transaction enrichment responses, keyed
+    by (endpoint, transaction). An entry is a miss once it is older than
+    ttl_seconds or when the sale status seen in /sales/history no longer
+    matches the status it was fetched under. Thread-safe; keeps hit/miss counters.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl_seconds: float,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Enrichment runs on worker threads; the lock serializes every access
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # WAL + synchronous=NORMAL: a put commits without an fsync (only
+        # checkpoints sync), so misses do not serialize on the disk. Losing
+        # the last entries on a crash only costs a refetch.
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.execute(SQL_CREATE_RESPONSE_CACHE)
+        self._conn.commit()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "invalidated": 0}
+
+    def get(
+        self, endpoint: str, transaction: str, status: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                SQL_GET_CACHED_RESPONSE, (endpoint, transaction)
+            ).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            cached_status, payload, fetched_at = row
+            if self._clock() - fetched_at > self.ttl_seconds:
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            if status is not None and cached_status != status:
+                # Refund, chargeback, approval... the enrichment may have changed
+                self._stats["invalidated"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+        return json.loads(payload)
+
+    def put(
+        self,
+        endpoint: str,
+        transaction: str,
+        response: Dict[str, Any],
+        status: Optional[str] = None,
+    ):
+        payload = json.dumps(response)
+        with self._lock:
+            self._conn.execute(
+                SQL_PUT_CACHED_RESPONSE,
+                (endpoint, transaction, status, payload, self._clock()),
+            )
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_response_cache() -> Optional[ResponseCache]:
+    """Opens the cache configured in Config, or None when HOTMART_CACHE_TTL_HOURS is 0."""
+    if Config.HOTMART_CACHE_TTL_HOURS <= 0:
+        return None
+    return ResponseCache(Config.get_cache_path(), Config.HOTMART_CACHE_TTL_HOURS * 3600)
+
+
+def _cached_get(
+    endpoint: str,
+    transaction: str,
+    client: Optional[HotmartClient],
+    cache: Optional[ResponseCache],
+    status: Optional[str],
+) -> Dict[str, Any]:
+    if cache is not None:
+        cached = cache.get(endpoint, transaction, status)
+        if cached is not None:
+            return cached
+    if client is None:
+        client = HotmartClient()
+    response = client.get(endpoint, params={"transaction": transaction})
+    if cache is not None:
+        cache.put(endpoint, transaction, response, status)
+    return response
 
 
 def get_sales_history(
@@ -17,18 +152,23 @@ def get_sales_history(
 
 
 def get_sale_users(
-    transaction: str, client: Optional[HotmartClient] = None
+    transaction: str,
+    client: Optional[HotmartClient] = None,
+    cache: Optional[ResponseCache] = None,
+    status: Optional[str] = None,
 ) -> Dict[str, Any]:
-    """Fetches user details for a specific transaction (returns address, phone, etc)."""
-    if client is None:
-        client = HotmartClient()
-    return client.get("/sales/users", params={"transaction": transaction})
+    """
+    Fetches user details for a specific transaction (returns address, phone, etc).
+    With a cache, a fresh entry fetched under the same sale status is reused.
+    """
+    return _cached_get("/sales/users", transaction, client, cache, status)
 
 
 def get_sale_price_details(
-    transaction: str, client: Optional[HotmartClient] = None
+    transaction: str,
+    client: Optional[HotmartClient] = None,
+    cache: Optional[ResponseCache] = None,
+    status: Optional[str] = None,
 ) -> Dict[str, Any]:
     """Fetches price details including payment method and installments."""
-    if client is None:
-        client = HotmartClient()
-    return client.get("/sales/price/details", params={"transaction": transaction})
+    return _cached_get("/sales/price/details", transaction, client, cache, status)
@@ -0,0 +1,78 @@
+import threading
+import requests
+from typing import Dict, List
+from requests.adapters import HTTPAdapter
+from urllib3.poolmanager import PoolManager
+
+
+class _TrackingPoolManager(PoolManager):
+    """PoolManager that remembers every pool it created (even after LRU eviction)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.created_pools: List = []
+        self._created_lock = threading.Lock()
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        pool = super()._new_pool(scheme, host, port, request_context=request_context)
+        with self._created_lock:
+            self.created_pools.append(pool)
+        return pool
+
+
+class CountingHTTPAdapter(HTTPAdapter):
+    """
+    Keep-alive HTTPAdapter that reports how many TCP/TLS connections were opened
+    and how many requests reused an already open connection.
+    """
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+
+        self.poolmanager = _TrackingPoolManager(
+            num_pools=connections,
+            maxsize=maxsize,
+            block=block,
+            **pool_kwargs,
+        )
+
+    def connection_stats(self) -> Dict[str, int]:
+        with self.poolmanager._created_lock:
+            pools = list(self.poolmanager.created_pools)
+
+        # urllib3 counts new sockets and requests made on each pool
+        opened = sum(pool.num_connections for pool in pools)
+        sent = sum(pool.num_requests for pool in pools)
+        return {
+            "connections_opened": opened,
+            "connections_reused": max(sent - opened, 0),
+            "requests": sent,
+        }
+
+
+def build_session(pool_size: int) -> requests.Session:
+    """
+    Returns a requests.Session backed by a CountingHTTPAdapter.
+    pool_size is the number of keep-alive connections kept per host, so it
+    should be at least the number of concurrent enrichment workers.
+    """
+    session = requests.Session()
+    adapter = CountingHTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_connection_stats(session: requests.Session) -> Dict[str, int]:
+    """Sums the connection counters of every CountingHTTPAdapter mounted on session."""
+    stats = {"connections_opened": 0, "connections_reused": 0, "requests": 0}
+    seen = set()
+    for adapter in session.adapters.values():
+        if not isinstance(adapter, CountingHTTPAdapter) or id(adapter) in seen:
+            continue
+        seen.add(id(adapter))
+        for key, value in adapter.connection_stats().items():
+            stats[key] += value
+    return stats
@@ -1,22 +1,31 @@
 import sqlite3
-import csv
-import os
 from datetime import datetime
-from src.logic.user_logic import ESTETICA_PRODUCT_IDS
-from src.db.database import upsert_audience_member
+from typing import Iterable
+from src.db.database import rebuild_audience_tables, upsert_audience_member
+from src.logic.exporter import iter_cursor, write_csv_export
+from src.config import Config
+
+# Audience table of each segment in product_segments
+SEGMENT_TABLES = {"ILPI": "audience_ilpi", "ESTETICA": "audience_estetica"}
 
 # SQL Templates
-SQL_FETCH_SALES_WITH_CUSTOMERS = """
-    SELECT 
+# LTV per customer (normalized email) and segment, one row each. name/phone
+# are bare columns: SQLite takes them from the row holding MIN(c.id).
+SQL_AGGREGATE_AUDIENCES = """
+    SELECT
+        lower(trim(c.master_email)) as email,
         c.name,
-        c.master_email as email,
         c.master_phone as phone,
-        s.product_id,
-        s.total_price,
-        s.status
+        COALESCE(ps.segment, 'ILPI') as segment,
+        ROUND(SUM(COALESCE(s.total_price, 0)), 2) as value,
+        MIN(c.id) as customer_id
     FROM sales s
     JOIN customers c ON s.customer_id = c.hotmart_id
+    LEFT JOIN product_segments ps ON ps.product_id = s.product_id
     WHERE s.status IN ('APPROVED', 'COMPLETE')
+    AND trim(c.master_email) != ''
+    GROUP BY lower(trim(c.master_email)), COALESCE(ps.segment, 'ILPI')
+    HAVING value > 0
 """
 
 SQL_COUNT_AUDIENCE = "SELECT COUNT(*) FROM {}"
@@ -24,85 +33,82 @@ SQL_COUNT_AUDIENCE = "SELECT COUNT(*) FROM {}"
 SQL_EXPORT_AUDIENCE = """
     SELECT name, email, phone, country, state, value 
     FROM {} 
-    ORDER BY value DESC
+    ORDER BY value DESC, email
 """
 
 
-def refresh_audiences(conn: sqlite3.Connection):
+def refresh_audiences(conn: sqlite3.Connection, rebuild: bool = True):
     """
     Orchestrates the audience refresh process.
+    rebuild swaps in freshly built tables (members who no longer qualify
+    drop out); rebuild=False only upserts the current members.
     """
-    audiences_data = _get_aggregated_audience_data(conn)
-    _persist_audience_data(conn, audiences_data)
-    print(
-        f"Audiences refreshed successfully for {len(audiences_data)} unique customers."
-    )
+    audience_rows = _get_aggregated_audience_data(conn)
+    if rebuild:
+        customers = _rebuild_audience_data(conn, audience_rows)
+    else:
+        customers = _persist_audience_data(conn, audience_rows)
+    print(f"Audiences refreshed successfully for {customers} unique customers.")
 
 
-def _get_aggregated_audience_data(conn: sqlite3.Connection) -> dict:
+def _get_aggregated_audience_data(conn: sqlite3.Connection) -> sqlite3.Cursor:
     """
-    Extracts sales and aggregates LTV per customer and segment.
+    Aggregates LTV per customer and segment in SQL (SQL_AGGREGATE_AUDIENCES).
+    Returns the cursor, so the rows are streamed instead of loaded at once.
     """
-    cur = conn.cursor()
-    cur.execute(SQL_FETCH_SALES_WITH_CUSTOMERS)
-    rows = cur.fetchall()
+    return conn.execute(SQL_AGGREGATE_AUDIENCES)
 
-    aggregated = {}
-    now_str = datetime.now().isoformat()
 
-    for row in rows:
-        email = row["email"].lower().strip()
-        if not email:
-            continue
+def _audience_member(row: sqlite3.Row, now_str: str) -> dict:
+    return {
+        "name": row["name"],
+        "email": row["email"],
+        "phone": row["phone"],
+        "country": "BR",
+        "state": "",
+        "value": row["value"],
+        "updated_at": now_str,
+    }
 
-        if email not in aggregated:
-            aggregated[email] = {
-                "name": row["name"],
-                "email": email,
-                "phone": row["phone"],
-                "ilpi_value": 0.0,
-                "estetica_value": 0.0,
-                "updated_at": now_str,
-            }
-
-        is_estetica = row["product_id"] in ESTETICA_PRODUCT_IDS
-        val = row["total_price"] or 0.0
-
-        if is_estetica:
-            aggregated[email]["estetica_value"] += val
-        else:
-            aggregated[email]["ilpi_value"] += val
 
-    return aggregated
+def _rebuild_audience_data(
+    conn: sqlite3.Connection, audience_rows: Iterable[sqlite3.Row]
+) -> int:
+    """
+    Rebuilds every Gold audience table from the aggregated rows in one
+    transaction (see rebuild_audience_tables).
+    Returns the number of unique customers written.
+    """
+    now_str = datetime.now().isoformat()
+    members = {table: [] for table in SEGMENT_TABLES.values()}
+    emails = set()
+    for row in audience_rows:
+        table = SEGMENT_TABLES.get(row["segment"])
+        if table is None:
+            continue
+        members[table].append(_audience_member(row, now_str))
+        emails.add(row["email"])
 
+    rebuild_audience_tables(conn, members)
+    return len(emails)
 
-def _persist_audience_data(conn: sqlite3.Connection, audiences_data: dict):
+
+def _persist_audience_data(
+    conn: sqlite3.Connection, audience_rows: Iterable[sqlite3.Row]
+) -> int:
     """
     Persists the aggregated data into Gold tables.
+    Returns the number of unique customers written.
     """
-    for email, data in audiences_data.items():
-        common_info = {
-            "name": data["name"],
-            "email": data["email"],
-            "phone": data["phone"],
-            "country": "BR",
-            "state": "",
-            "updated_at": data["updated_at"],
-        }
-
-        if data["ilpi_value"] > 0:
-            upsert_audience_member(
-                conn,
-                "audience_ilpi",
-                {**common_info, "value": round(data["ilpi_value"], 2)},
-            )
-
-        if data["estetica_value"] > 0:
-            upsert_audience_member(
-                conn,
-                "audience_estetica",
-                {**common_info, "value": round(data["estetica_value"], 2)},
-            )
+    now_str = datetime.now().isoformat()
+    emails = set()
+    for row in audience_rows:
+        table = SEGMENT_TABLES.get(row["segment"])
+        if table is None:
+            continue
+        upsert_audience_member(conn, table, _audience_member(row, now_str))
+        emails.add(row["email"])
+    return len(emails)
 
 
 def generate_audience_report(conn: sqlite3.Connection):
@@ -125,28 +131,26 @@ def generate_audience_report(conn: sqlite3.Connection):
     print("=" * 50 + "\n")
 
 
-def export_audiences_to_csv(conn: sqlite3.Connection):
+def export_audiences_to_csv(conn: sqlite3.Connection) -> dict:
     """
-    Exports Gold tables to CSV files using SQL templates.
+    Streams the Gold tables to CSV (see src/logic/exporter.py).
+    Returns {table: path}; the path is None when the audience did not
+    change since the previous export.
     """
-    output_dir = os.path.join("data", "output", "publico")
-    os.makedirs(output_dir, exist_ok=True)
-
-    today_str = datetime.now().strftime("%Y-%m-%d")
-    tables = ["audience_ilpi", "audience_estetica"]
-
-    for table in tables:
-        filename = f"publico_{table.replace('audience_', '')}_{today_str}.csv"
-        filepath = os.path.join(output_dir, filename)
-
-        cur = conn.cursor()
-        cur.execute(SQL_EXPORT_AUDIENCE.format(table))
-        rows = cur.fetchall()
-
-        with open(filepath, "w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow(["name", "email", "phone", "country", "state", "value"])
-            for row in rows:
-                writer.writerow(row)
-
-        print(f"Publico exportado para: {filepath} ({len(rows)} registros)")
+    exported = {}
+    for table in SEGMENT_TABLES.values():
+        cur = conn.execute(SQL_EXPORT_AUDIENCE.format(table))
+        filepath, count = write_csv_export(
+            iter_cursor(cur),
+            ["name", "email", "phone", "country", "state", "value"],
+            Config.OUTPUT_PUBLICO,
+            f"publico_{table.replace('audience_', '')}",
+        )
+        exported[table] = filepath
+        if filepath is None:
+            print(
+                f"Publico {table} sem alteracoes ({count} registros), export ignorado."
+            )
+        else:
+            print(f"Publico exportado para: {filepath} ({count} registros)")
+    return exported
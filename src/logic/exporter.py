@@ -0,0 +1,108 @@
+import csv
+import gzip
+import hashlib
+import io
+import os
+import sqlite3
+from datetime import datetime
+from typing import Iterable, Iterator, Optional, Sequence
+from src.config import Config
+
+# =====================================================================
+# Streaming CSV exporter shared by the Gold exports. Rows are written chunk
+# by chunk (constant memory) to a temporary file, optionally gzip'd, while a
+# SHA-256 of the CSV content is computed. The digest of the last export of
+# each name is kept in <name>.sha256 next to the files: when the content is
+# unchanged the new file is discarded and nothing needs to be re-uploaded.
+# =====================================================================
+
+
+def iter_cursor(cur: sqlite3.Cursor, chunk_size: Optional[int] = None) -> Iterator:
+    """Yields the cursor rows using fetchmany chunks instead of fetchall."""
+    chunk_size = chunk_size or Config.EXPORT_CHUNK_SIZE
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def _digest_path(output_dir: str, name: str) -> str:
+    return os.path.join(output_dir, f"{name}.sha256")
+
+
+def _read_digest(path: str) -> Optional[str]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _open_binary(path: str, compress: bool):
+    if compress:
+        # mtime=0 keeps the gzip bytes reproducible for the same content
+        return gzip.GzipFile(path, mode="wb", mtime=0)
+    return open(path, "wb")
+
+
+def write_csv_export(
+    rows: Iterable[Sequence],
+    header: Sequence[str],
+    output_dir: str,
+    name: str,
+    chunk_size: Optional[int] = None,
+    compress: Optional[bool] = None,
+    date_str: Optional[str] = None,
+) -> tuple[Optional[str], int]:
+    """
+    Streams rows into <output_dir>/<name>_<date>.csv[.gz].
+    Returns (path, row count); path is None when the content matches the
+    previous export of name (no new file is written).
+    """
+    chunk_size = chunk_size or Config.EXPORT_CHUNK_SIZE
+    if compress is None:
+        compress = Config.EXPORT_GZIP
+    date_str = date_str or datetime.now().strftime("%Y-%m-%d")
+
+    os.makedirs(output_dir, exist_ok=True)
+    ext = ".csv.gz" if compress else ".csv"
+    filepath = os.path.join(output_dir, f"{name}_{date_str}{ext}")
+    tmp_path = f"{filepath}.tmp"
+
+    digest = hashlib.sha256()
+    count = 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush(out):
+        data = buffer.getvalue().encode("utf-8")
+        digest.update(data)
+        out.write(data)
+        buffer.seek(0)
+        buffer.truncate()
+
+    try:
+        with _open_binary(tmp_path, compress) as out:
+            writer.writerow(header)
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+                if count % chunk_size == 0:
+                    flush(out)
+            flush(out)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    hex_digest = digest.hexdigest()
+    digest_file = _digest_path(output_dir, name)
+    if hex_digest == _read_digest(digest_file):
+        os.remove(tmp_path)
+        return None, count
+
+    os.replace(tmp_path, filepath)
+    with open(digest_file, "w", encoding="utf-8") as f:
+        f.write(hex_digest + "\n")
+    return filepath, count
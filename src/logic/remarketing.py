@@ -1,97 +1,126 @@
 import sqlite3
-import csv
-import os
 from datetime import datetime
-from typing import List
+from typing import Iterable
+from src.logic.exporter import iter_cursor, write_csv_export
+from src.config import Config
 
 # SQL Templates
+# Reads the partial index idx_customers_next_eligible in order: the k
+# contacts waiting the longest, so each batch rotates through the base
+# without scanning or sorting the whole customers table.
 SQL_FIND_ELIGIBLE_REMARKETING = """
-    SELECT 
+    SELECT
         id as customer_id,
         master_email as email,
         master_phone as phone,
         last_remarketing_at,
         last_purchase_at
     FROM customers
-    WHERE (
-        last_remarketing_at IS NULL 
-        OR datetime(last_remarketing_at) <= datetime('now', '-30 days')
+    WHERE next_eligible_at IS NOT NULL
+    AND next_eligible_at <= datetime('now')
+    ORDER BY next_eligible_at, id
+    LIMIT :limit
+"""
+
+# Set-based batch: the selection lands in a TEMP table, then history and
+# customers are written with one statement each
+SQL_CREATE_REMARKETING_BATCH = """
+    CREATE TEMP TABLE IF NOT EXISTS remarketing_batch (
+        seq INTEGER PRIMARY KEY,
+        customer_id INTEGER NOT NULL,
+        email TEXT,
+        phone TEXT,
+        last_remarketing_at TIMESTAMP,
+        last_purchase_at TIMESTAMP
     )
-    AND (
-        last_purchase_at IS NULL 
-        OR datetime(last_purchase_at) <= datetime('now', '-30 days')
+"""
+
+SQL_FILL_REMARKETING_BATCH = f"""
+    INSERT INTO remarketing_batch (
+        customer_id, email, phone, last_remarketing_at, last_purchase_at
     )
-    AND master_phone IS NOT NULL AND master_phone != ''
-    ORDER BY RANDOM()
-    LIMIT :limit
+    {SQL_FIND_ELIGIBLE_REMARKETING}
 """
 
 SQL_INSERT_REMARKETING_HISTORY = """
-    INSERT INTO remarketing_history (customer_id, email, phone, last_remarketing_at, last_purchase_at)
-    VALUES (:customer_id, :email, :phone, :last_remarketing_at, :last_purchase_at)
+    INSERT INTO remarketing_history (
+        customer_id, email, phone, last_remarketing_at, last_purchase_at
+    )
+    SELECT customer_id, email, phone, last_remarketing_at, last_purchase_at
+    FROM remarketing_batch
+    ORDER BY seq
+"""
+
+SQL_MARK_REMARKETED = """
+    UPDATE customers SET last_remarketing_at = :now
+    WHERE id IN (SELECT customer_id FROM remarketing_batch)
+"""
+
+SQL_READ_REMARKETING_BATCH = """
+    SELECT email, phone, last_remarketing_at, last_purchase_at
+    FROM remarketing_batch
+    ORDER BY seq
 """
 
 
 def generate_remarketing_batch(conn: sqlite3.Connection, limit: int = 50):
     """
     Identifies eligible customers, saves them to Gold history, and exports to CSV.
+    History and Master are written set-based, in one transaction with a
+    single run timestamp.
     """
-    cur = conn.cursor()
-
-    # 1. Fetch eligible
-    cur.execute(SQL_FIND_ELIGIBLE_REMARKETING, {"limit": limit})
-    eligible = cur.fetchall()
+    # Update Master and ManyChat (simulated through Master for now)
+    # In a real sync back to manychat, we would need an API call,
+    # but here we update our local tracking.
+    now_str = datetime.now().isoformat()
+    params = {"limit": limit, "now": now_str}
+
+    conn.execute(SQL_CREATE_REMARKETING_BATCH)
+    # Keep the batch inside one transaction (a bare SAVEPOINT would autocommit on
+    # RELEASE); a failure only undoes the batch, not earlier work on conn
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    conn.execute("SAVEPOINT remarketing_batch")
+    try:
+        conn.execute("DELETE FROM remarketing_batch")
+        selected = conn.execute(SQL_FILL_REMARKETING_BATCH, params).rowcount
+        if selected:
+            conn.execute(SQL_INSERT_REMARKETING_HISTORY)
+            conn.execute(SQL_MARK_REMARKETED, params)
+        conn.execute("RELEASE SAVEPOINT remarketing_batch")
+    except Exception:
+        conn.execute("ROLLBACK TO SAVEPOINT remarketing_batch")
+        conn.execute("RELEASE SAVEPOINT remarketing_batch")
+        raise
+    conn.commit()
 
-    if not eligible:
+    if not selected:
         print("Nenhum contato elegivel para remarketing hoje.")
         return
 
-    # 2. Persist in Gold History
-    for row in eligible:
-        data = dict(row)
-        cur.execute(SQL_INSERT_REMARKETING_HISTORY, data)
-
-        # Update Master and ManyChat (simulated through Master for now)
-        # In a real sync back to manychat, we would need an API call,
-        # but here we update our local tracking.
-        now_str = datetime.now().isoformat()
-        cur.execute(
-            "UPDATE customers SET last_remarketing_at = ? WHERE id = ?",
-            (now_str, data["customer_id"]),
-        )
+    print(f"Lote de remarketing gerado com {selected} registros.")
 
+    # Export to CSV (values as they were before this batch)
+    export_remarketing_csv(iter_cursor(conn.execute(SQL_READ_REMARKETING_BATCH)))
+    conn.execute("DELETE FROM remarketing_batch")
     conn.commit()
-    print(f"Lote de remarketing gerado com {len(eligible)} registros.")
 
-    # 3. Export to CSV
-    export_remarketing_csv(eligible)
 
-
-def export_remarketing_csv(batch: List[sqlite3.Row]):
+def export_remarketing_csv(batch: Iterable[sqlite3.Row]):
     """
     Exports a batch of eligible records to CSV.
     """
-    output_dir = os.path.join("data", "output", "remarketing")
-    os.makedirs(output_dir, exist_ok=True)
-
-    today_str = datetime.now().strftime("%Y-%m-%d")
-    filename = f"remarketing_{today_str}.csv"
-    filepath = os.path.join(output_dir, filename)
-
-    with open(filepath, "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["email", "phone", "last_remarketing_at", "last_purchase_at"])
-        for row in batch:
-            writer.writerow(
-                [
-                    row["email"],
-                    row["phone"],
-                    row["last_remarketing_at"],
-                    row["last_purchase_at"],
-                ]
-            )
-
-    print(f"Lote de remarketing exportado para: {filepath}")
+    columns = ["email", "phone", "last_remarketing_at", "last_purchase_at"]
+    filepath, _ = write_csv_export(
+        ([row[c] for c in columns] for row in batch),
+        columns,
+        Config.OUTPUT_REMARKETING,
+        "remarketing",
+    )
+    if filepath is None:
+        print("Lote de remarketing igual ao anterior, export ignorado.")
+    else:
+        print(f"Lote de remarketing exportado para: {filepath}")
 
 
 def generate_remarketing_report(conn: sqlite3.Connection):
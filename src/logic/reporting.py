@@ -1,6 +1,28 @@
 import sqlite3
 from typing import Dict, Any
 
+# SQL Templates ({where_clause} is empty or "WHERE imported_at = ?")
+SQL_LOAD_BUYERS = "SELECT COUNT(DISTINCT customer_id) FROM sales {where_clause}"
+
+SQL_LOAD_VALUE = """
+    SELECT SUM(total_price)
+    FROM sales
+    {where_clause} {connector} status IN ({placeholders})
+"""
+
+SQL_LOAD_CANCELLATIONS = """
+    SELECT COUNT(*), SUM(total_price)
+    FROM sales
+    {where_clause} {connector} status IN ({placeholders})
+"""
+
+SQL_RECENT_LOADS = (
+    "SELECT DISTINCT imported_at FROM sales ORDER BY imported_at DESC LIMIT 2"
+)
+
+POSITIVE_STATUSES = ("APPROVED", "COMPLETE", "BILLET_PRINTED", "WAITING_PAYMENT")
+NEGATIVE_STATUSES = ("CANCELED", "REFUNDED", "CHARGEBACK", "PARTIALLY_REFUNDED")
+
 
 def get_stats_for_load(
     conn: sqlite3.Connection, imported_at_filter: str = None
@@ -17,33 +39,29 @@ def get_stats_for_load(
         where_clause = "WHERE imported_at = ?"
         params = [imported_at_filter]
 
+    connector = "AND" if where_clause else "WHERE"
+
     # 1. Unique buyers (unique customer_id in this batch)
-    cur.execute(f"SELECT COUNT(DISTINCT customer_id) FROM sales {where_clause}", params)
+    cur.execute(SQL_LOAD_BUYERS.format(where_clause=where_clause), params)
     unique_buyers = cur.fetchone()[0] or 0
 
     # 2. Total Approved/Complete Sales Value
     # Note: Using IN for common positive statuses
-    positive_statuses = ("APPROVED", "COMPLETE", "BILLET_PRINTED", "WAITING_PAYMENT")
-    status_placeholders = ", ".join("?" for _ in positive_statuses)
-
-    query_approved = f"""
-        SELECT SUM(total_price) 
-        FROM sales 
-        {where_clause} {"AND" if where_clause else "WHERE"} status IN ({status_placeholders})
-    """
-    cur.execute(query_approved, params + list(positive_statuses))
+    query_approved = SQL_LOAD_VALUE.format(
+        where_clause=where_clause,
+        connector=connector,
+        placeholders=", ".join("?" for _ in POSITIVE_STATUSES),
+    )
+    cur.execute(query_approved, params + list(POSITIVE_STATUSES))
     total_value = cur.fetchone()[0] or 0.0
 
     # 3. Cancellations
-    negative_statuses = ("CANCELED", "REFUNDED", "CHARGEBACK", "PARTIALLY_REFUNDED")
-    neg_placeholders = ", ".join("?" for _ in negative_statuses)
-
-    query_cancelled = f"""
-        SELECT COUNT(*), SUM(total_price)
-        FROM sales
-        {where_clause} {"AND" if where_clause else "WHERE"} status IN ({neg_placeholders})
-    """
-    cur.execute(query_cancelled, params + list(negative_statuses))
+    query_cancelled = SQL_LOAD_CANCELLATIONS.format(
+        where_clause=where_clause,
+        connector=connector,
+        placeholders=", ".join("?" for _ in NEGATIVE_STATUSES),
+    )
+    cur.execute(query_cancelled, params + list(NEGATIVE_STATUSES))
     row = cur.fetchone()
     cancelled_count = row[0] or 0
     cancelled_value = row[1] or 0.0
@@ -67,9 +85,7 @@ def generate_delta_report(conn: sqlite3.Connection):
     cur = conn.cursor()
 
     # Find distinct import timestamps
-    cur.execute(
-        "SELECT DISTINCT imported_at FROM sales ORDER BY imported_at DESC LIMIT 2"
-    )
+    cur.execute(SQL_RECENT_LOADS)
     loads = [row[0] for row in cur.fetchall()]
 
     report_lines = []
@@ -1,16 +1,5 @@
 from typing import List
-
-# IDS de produtos mapeados para Estética
-ESTETICA_PRODUCT_IDS = {
-    "5587176",
-    "5554091",
-    "5587203",
-    "5560445",
-    "5588268",
-    "5716749",
-    "6289449",
-    "6289465",
-}
+from src.db.database import ESTETICA_PRODUCT_IDS
 
 
 def get_segment_for_products(product_ids: List[str]) -> str:
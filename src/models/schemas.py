@@ -1,5 +1,6 @@
+from dataclasses import dataclass
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, Union
 from datetime import datetime
 
 
@@ -44,6 +45,56 @@ class Sale(BaseModel):
     product_id: str
 
 
+# Fast path of the sync: same fields as the models above, without validation.
+# Mapping builds these unless strict mode asks for the Pydantic models.
+
+
+@dataclass(slots=True)
+class CustomerRecord:
+    id: str
+    created_at: datetime
+    name: str | None = None
+    email: str | None = None
+    phone: str | None = None
+    document: str | None = None
+    zip_code: str | None = None
+    address: str | None = None
+    number: str | None = None
+    neighborhood: str | None = None
+    city: str | None = None
+    state: str | None = None
+    country: str | None = None
+    updated_at: Optional[datetime] = None
+
+
+@dataclass(slots=True)
+class ProductRecord:
+    id: str
+    name: str
+
+
+@dataclass(slots=True)
+class SaleRecord:
+    transaction: str
+    customer_id: str
+    product_id: str
+    status: str | None = None
+    payment_method: str | None = None
+    payment_type: str | None = None
+    installments: int | None = None
+    approved_date: int | None = None
+    order_date: int | None = None
+    total_price: float | None = None
+    currency: str | None = None
+    purchased_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
+AnyCustomer = Union[Customer, CustomerRecord]
+AnyProduct = Union[Product, ProductRecord]
+AnySale = Union[Sale, SaleRecord]
+
+
 class HotmartSalesRequestParams(BaseModel):
     """
     Contract for requesting sales from Hotmart.
@@ -18,7 +18,7 @@ from src.logic.remarketing import (
     generate_remarketing_batch,
     generate_remarketing_report,
 )
-from src.db.database import get_connection
+from src.pipelines.context import PipelineContext
 from src.config import Config
 
 
@@ -31,28 +31,27 @@ def run_daily_job():
     print(f"[{datetime.now().isoformat()}] Starting daily scheduled job...")
 
     try:
-        # 1. Hotmart Sync
-        # Note: sync_sales_to_db handles its own connection and incremental logic
-        print("--- Step 1: Hotmart Sync ---")
-        sync_sales_to_db()
-
-        # 2. ManyChat Import
-        # Note: process_manychat_input_dir handles reading from data/input/manychat and cleanup
-        print("\n--- Step 2: ManyChat Import ---")
-        process_manychat_input_dir()
-
-        # 3. Gold Audience Refresh
-        print("\n--- Step 3: Refreshing Gold Audiences ---")
-        with get_connection() as conn:
-            refresh_audiences(conn)
-            generate_audience_report(conn)
-            export_audiences_to_csv(conn)
-
-        # 4. Remarketing Generation (Gold)
-        print("\n--- Step 4: Generating Remarketing Batch ---")
-        with get_connection() as conn:
-            generate_remarketing_batch(conn, limit=50)
-            generate_remarketing_report(conn)
+        # One connection (schema checked once per process) for every step
+        with PipelineContext() as ctx:
+            # 1. Hotmart Sync
+            print("--- Step 1: Hotmart Sync ---")
+            sync_sales_to_db(conn=ctx.conn)
+
+            # 2. ManyChat Import
+            # Note: process_manychat_input_dir handles reading from data/input/manychat and cleanup
+            print("\n--- Step 2: ManyChat Import ---")
+            process_manychat_input_dir(conn=ctx.conn)
+
+            # 3. Gold Audience Refresh
+            print("\n--- Step 3: Refreshing Gold Audiences ---")
+            refresh_audiences(ctx.conn)
+            generate_audience_report(ctx.conn)
+            export_audiences_to_csv(ctx.conn)
+
+            # 4. Remarketing Generation (Gold)
+            print("\n--- Step 4: Generating Remarketing Batch ---")
+            generate_remarketing_batch(ctx.conn, limit=50)
+            generate_remarketing_report(ctx.conn)
 
         print(f"\n[{datetime.now().isoformat()}] Daily job completed successfully.")
     except Exception as e:
@@ -0,0 +1,315 @@
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+from src.hotmart.sales import get_sales_history
+from src.hotmart.client import HotmartClient
+from src.hotmart.landing import LandingZone
+from src.db.database import bulk_upsert_sales
+from src.pipelines.sales_pages import _build_page_records, _put_until_stopped
+from src.config import Config
+
+# =====================================================================
+# Parallel, checkpointed initial backfill.
+#
+# The range is cut into date windows that are fetched concurrently, each
+# with its own page_token stream. Worker threads only talk to the API; the
+# calling thread owns the SQLite connection and writes every page together
+# with its checkpoint (sync_checkpoints), so a restart resumes each window
+# from the last committed next_page_token.
+# =====================================================================
+
+MS_PER_DAY = 86_400_000
+# Hotmart rejects ranges above ~2 years
+MAX_WINDOW_DAYS = 730
+MIN_WINDOW_DAYS = 1
+
+SQL_LOAD_CHECKPOINTS = """
+    SELECT window_start, window_end, next_page_token, status, row_count
+    FROM sync_checkpoints
+    WHERE backfill_id = ?
+    ORDER BY window_start
+"""
+
+SQL_START_WINDOW = """
+    INSERT INTO sync_checkpoints (backfill_id, window_start, window_end, status, updated_at)
+    VALUES (?, ?, ?, 'RUNNING', ?)
+    ON CONFLICT(backfill_id, window_start) DO UPDATE SET
+        status = 'RUNNING',
+        updated_at = excluded.updated_at
+"""
+
+SQL_SAVE_PAGE = """
+    UPDATE sync_checkpoints SET
+        next_page_token = ?,
+        pages = pages + 1,
+        row_count = row_count + ?,
+        status = ?,
+        updated_at = ?
+    WHERE backfill_id = ? AND window_start = ?
+"""
+
+SQL_UNFINISHED_BACKFILL = """
+    SELECT 1 FROM sync_checkpoints
+    WHERE backfill_id = ? AND status != 'DONE'
+    LIMIT 1
+"""
+
+# Windows of another range (edited .env dates, DEV's "yesterday") can never
+# be resumed: retire them so they stop looking unfinished
+SQL_RETIRE_STALE_BACKFILLS = """
+    UPDATE sync_checkpoints SET status = 'ABANDONED', updated_at = ?
+    WHERE backfill_id != ? AND status NOT IN ('DONE', 'ABANDONED')
+"""
+
+
+@dataclass
+class BackfillWindow:
+    start_ms: int
+    end_ms: int
+    page_token: Optional[str] = None
+    rows: int = 0
+
+    @property
+    def days(self) -> float:
+        return (self.end_ms - self.start_ms + 1) / MS_PER_DAY
+
+
+class AdaptiveWindowSizer:
+    """
+    Picks the length of the next window from the density (rows/day) of the
+    windows already fetched, aiming at target_rows per window. Empty windows
+    double the length; growth is capped at 2x per step.
+    """
+
+    def __init__(
+        self,
+        initial_days: float,
+        target_rows: int,
+        min_days: float = MIN_WINDOW_DAYS,
+        max_days: float = MAX_WINDOW_DAYS,
+    ):
+        self.min_days = min_days
+        self.max_days = max_days
+        self.target_rows = target_rows
+        self.days = self._clamp(initial_days)
+
+    def _clamp(self, days: float) -> float:
+        return max(self.min_days, min(self.max_days, days))
+
+    def observe(self, days: float, rows: int):
+        if rows <= 0:
+            self.days = self._clamp(self.days * 2)
+            return
+        density = rows / max(days, 1e-9)
+        self.days = self._clamp(min(self.target_rows / density, self.days * 2))
+
+
+def make_backfill_id(start_dt: datetime, end_dt: datetime) -> str:
+    """Checkpoint key of a backfill range (windows resume only within it)."""
+    return f"{int(start_dt.timestamp() * 1000)}-{int(end_dt.timestamp() * 1000)}"
+
+
+def has_unfinished_backfill(conn, backfill_id: Optional[str]) -> bool:
+    """True when a window of this backfill range is not DONE yet."""
+    if backfill_id is None:
+        return False
+    return conn.execute(SQL_UNFINISHED_BACKFILL, (backfill_id,)).fetchone() is not None
+
+
+def backfill_pool_size(
+    workers: Optional[int] = None, max_workers: Optional[int] = None
+) -> int:
+    """
+    Keep-alive connections needed by a backfill: each window runs its page
+    fetch plus max_workers enrichment requests at the same time.
+    """
+    workers = workers or Config.HOTMART_BACKFILL_WORKERS
+    if max_workers is None:
+        max_workers = Config.HOTMART_ENRICH_WORKERS
+    return max(Config.HOTMART_POOL_SIZE, workers * (max_workers + 1))
+
+
+def _fetch_window(
+    window: BackfillWindow,
+    client: HotmartClient,
+    max_workers: int,
+    results: queue.Queue,
+    stop: threading.Event,
+    landing: Optional[LandingZone] = None,
+):
+    """
+    Worker: walks the window's pages and hands each one to the writer.
+    If the checkpointed token is rejected, the window restarts from its first
+    page (pages already saved are upserted again).
+    """
+    params = {"start_date": str(window.start_ms), "end_date": str(window.end_ms)}
+    token = window.page_token
+    resuming = token is not None
+    try:
+        while not stop.is_set():
+            if token:
+                params["page_token"] = token
+            try:
+                response = get_sales_history(client=client, **params)
+            except Exception as e:
+                if not resuming:
+                    raise
+                print(
+                    f"Backfill window {window.start_ms}: resume token failed ({e}). "
+                    "Restarting from its first page."
+                )
+                resuming = False
+                token = None
+                params.pop("page_token", None)
+                continue
+            resuming = False
+            items = response.get("items", [])
+            token = response.get("page_info", {}).get("next_page_token")
+            records = _build_page_records(items, client, max_workers, landing=landing)
+            _put_until_stopped(
+                results, (window, records, len(items), token, None), stop
+            )
+            if not token:
+                return
+    except Exception as e:
+        _put_until_stopped(results, (window, None, 0, None, e), stop)
+
+
+def run_backfill(
+    conn,
+    start_dt: datetime,
+    end_dt: datetime,
+    client: Optional[HotmartClient] = None,
+    imported_at: str = None,
+    workers: Optional[int] = None,
+    max_workers: Optional[int] = None,
+    landing: Optional[LandingZone] = None,
+) -> int:
+    """
+    Fetches [start_dt, end_dt] in concurrent date windows and saves every page.
+    Windows left unfinished by a previous run of the same range are resumed
+    from their checkpoint; those of any other range are marked ABANDONED.
+    The row counts already checkpointed seed the window sizer. Raw pages go
+    to landing when one is given. Returns the number of sales saved.
+    """
+    workers = workers or Config.HOTMART_BACKFILL_WORKERS
+    if max_workers is None:
+        max_workers = Config.HOTMART_ENRICH_WORKERS
+    client = client or HotmartClient(pool_size=backfill_pool_size(workers, max_workers))
+
+    start_ms = int(start_dt.timestamp() * 1000)
+    end_ms = int(end_dt.timestamp() * 1000)
+    backfill_id = make_backfill_id(start_dt, end_dt)
+
+    retired = conn.execute(
+        SQL_RETIRE_STALE_BACKFILLS, (datetime.now().isoformat(), backfill_id)
+    ).rowcount
+    conn.commit()
+    if retired:
+        print(f"Abandoned {retired} unfinished window(s) of an older backfill range.")
+
+    sizer = AdaptiveWindowSizer(
+        Config.HOTMART_BACKFILL_WINDOW_DAYS, Config.HOTMART_BACKFILL_TARGET_ROWS
+    )
+    pending = deque()
+    cursor = start_ms
+    for row in conn.execute(SQL_LOAD_CHECKPOINTS, (backfill_id,)).fetchall():
+        window_start, window_end, token, status, row_count = tuple(row)
+        cursor = max(cursor, window_end + 1)
+        window = BackfillWindow(window_start, window_end, token, row_count)
+        if status == "DONE":
+            # New windows are sized from the density already seen
+            sizer.observe(window.days, window.rows)
+        else:
+            pending.append(window)
+    if pending or cursor > start_ms:
+        print(f"Resuming backfill {backfill_id}: {len(pending)} unfinished window(s).")
+
+    results = queue.Queue(maxsize=workers * 2)
+    stop = threading.Event()
+    success_count = 0
+    failed = []
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        running = 0
+        try:
+            while True:
+                while running < workers and (pending or cursor <= end_ms):
+                    if pending:
+                        window = pending.popleft()
+                    else:
+                        window_end = min(
+                            cursor + int(sizer.days * MS_PER_DAY) - 1, end_ms
+                        )
+                        window = BackfillWindow(cursor, window_end)
+                        cursor = window_end + 1
+
+                    conn.execute(
+                        SQL_START_WINDOW,
+                        (
+                            backfill_id,
+                            window.start_ms,
+                            window.end_ms,
+                            datetime.now().isoformat(),
+                        ),
+                    )
+                    conn.commit()
+                    print(
+                        f"Backfill window {datetime.fromtimestamp(window.start_ms / 1000)} "
+                        f"-> {datetime.fromtimestamp(window.end_ms / 1000)}"
+                    )
+                    executor.submit(
+                        _fetch_window,
+                        window,
+                        client,
+                        max_workers,
+                        results,
+                        stop,
+                        landing,
+                    )
+                    running += 1
+
+                if running == 0:
+                    break
+
+                window, records, item_count, token, error = results.get()
+                if error is not None:
+                    # Checkpoint stays RUNNING: the next run resumes this window
+                    print(f"Backfill window {window.start_ms} failed: {error}")
+                    failed.append(window)
+                    running -= 1
+                    continue
+
+                saved = bulk_upsert_sales(conn, records, imported_at=imported_at)
+                conn.execute(
+                    SQL_SAVE_PAGE,
+                    (
+                        token,
+                        saved,
+                        "RUNNING" if token else "DONE",
+                        datetime.now().isoformat(),
+                        backfill_id,
+                        window.start_ms,
+                    ),
+                )
+                conn.commit()
+                success_count += saved
+                window.rows += item_count
+
+                if not token:
+                    running -= 1
+                    sizer.observe(window.days, window.rows)
+        except BaseException:
+            stop.set()
+            raise
+
+    if failed:
+        print(
+            f"Backfill incomplete: {len(failed)} window(s) failed and will resume on the next run."
+        )
+    print(f"Backfill saved {success_count} sales.")
+    return success_count
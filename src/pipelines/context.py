@@ -0,0 +1,61 @@
+import sqlite3
+import threading
+from typing import Optional
+from src.db.database import get_connection, init_db
+from src.config import Config
+
+# Databases whose schema was already checked by this process
+_SCHEMA_READY: set[str] = set()
+_SCHEMA_LOCK = threading.Lock()
+
+
+def ensure_schema(conn: sqlite3.Connection, db_path: str):
+    """
+    Runs init_db once per process for each database file. In-memory
+    databases are private to their connection, so they are always initialized.
+    """
+    if db_path == ":memory:":
+        init_db(conn)
+        return
+    with _SCHEMA_LOCK:
+        if db_path in _SCHEMA_READY:
+            return
+        init_db(conn)
+        _SCHEMA_READY.add(db_path)
+
+
+class PipelineContext:
+    """
+    Unit of work of a pipeline job: one tuned read-write connection shared by
+    every step, so pragmas and the warm page cache carry over between them.
+    Opened lazily; on exit a pending transaction is committed (or rolled back
+    if the job raised) and the connection is closed.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or Config.DB_NAME
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = get_connection(self.db_path)
+            ensure_schema(self._conn, self.db_path)
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def __enter__(self) -> "PipelineContext":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._conn is not None:
+            if exc_type is None:
+                self._conn.commit()
+            else:
+                self._conn.rollback()
+        self.close()
+        return False
@@ -1,18 +1,27 @@
+import argparse
+import queue
+import threading
 from datetime import datetime, timedelta
-from typing import Optional, Union
-from src.hotmart.sales import get_sales_history, get_sale_users, get_sale_price_details
+from typing import Optional
+from src.hotmart.sales import ResponseCache, get_sales_history, open_response_cache
 from src.hotmart.client import HotmartClient
-from src.models.schemas import Customer, Product, Sale
+from src.hotmart.landing import LandingZone, open_landing_zone
 from src.db.database import (
     get_connection,
     init_db,
-    upsert_customer,
-    upsert_product,
-    upsert_sale,
+    bulk_upsert_sales,
     get_max_sale_date,
     consolidate_all_to_master,
+    consolidate_changes_to_master,
 )
 from src.logic.reporting import generate_delta_report
+from src.pipelines.sales_pages import _build_page_records, _put_until_stopped
+from src.pipelines.backfill import (
+    backfill_pool_size,
+    has_unfinished_backfill,
+    make_backfill_id,
+    run_backfill,
+)
 from src.config import Config
 
 
@@ -22,144 +31,33 @@ def _date_str_to_ms(date_str: str) -> str:
     return str(int(dt.timestamp() * 1000))
 
 
-def _parse_hotmart_date(date_raw: Optional[Union[int, str]]) -> datetime:
-    """
-    Boundary Testable: Safely converts Hotmart millisecond timestamps to datetime.
-    """
-    if not date_raw:
-        return datetime.now()
-    try:
-        # Hotmart dates are in milliseconds
-        return datetime.fromtimestamp(int(date_raw) / 1000.0)
-    except (ValueError, TypeError, OSError):
-        return datetime.now()
-
-
-def _resolve_buyer_id(buyer_data: dict, txn_id: str) -> str:
-    """
-    MC/DC Testable: Resolves the best available unique ID for a buyer.
-    Conditions: ucode, id, txn_id.
-    """
-    ucode = buyer_data.get("ucode")
-    external_id = buyer_data.get("id")
+_END_OF_PAGES = object()
 
-    if ucode:
-        return str(ucode)
-    if external_id:
-        return str(external_id)
-    return str(txn_id)
 
-
-def _extract_sale_models(
-    item: dict, client: HotmartClient
-) -> tuple[Customer, Product, Sale]:
+def _prefetch_pages(
+    params: dict, client: HotmartClient, pages: queue.Queue, stop: threading.Event
+):
     """
-    Orchestrates the mapping from Hotmart JSON to Pydantic models.
+    Producer: follows next_page_token and queues the raw /sales/history pages.
+    Ends with _END_OF_PAGES, or with the exception that stopped it.
     """
-    purchase_data = item.get("purchase", {})
-    buyer_data = item.get("buyer", {})
-    prod_data = item.get("product", {})
-
-    txn_id = purchase_data.get("transaction") or item.get("transaction") or "UNKNOWN"
-    status = purchase_data.get("status") or item.get("status") or "UNKNOWN"
-
-    # Dates
-    purchased_at = _parse_hotmart_date(purchase_data.get("order_date"))
-    updated_at_raw = purchase_data.get("approved_date")
-    updated_at = None
-    if updated_at_raw:
-        updated_at = _parse_hotmart_date(updated_at_raw)
-
-    # IDs and Contact
-    buyer_id = _resolve_buyer_id(buyer_data, txn_id)
-    phone_fallback = buyer_data.get("phone") or purchase_data.get("phone")
-    document = buyer_data.get("document") or purchase_data.get("document")
-
-    # Enrichment with secondary APIs
-    user_detail = {}
+    params = dict(params)
+    page_count = 0
     try:
-        users_meta = get_sale_users(txn_id, client=client)
-        users_list = users_meta.get("users", [])
-        for user in users_list:
-            if user.get("role") in ("BUYer", "BUYER"):
-                user_detail = user.get("user", {})
-                break
-        if not user_detail and users_list:
-            user_detail = users_list[0].get("user", {})
-    except Exception as e:
-        print(f"User enrichment failed for {txn_id}: {e}")
+        while not stop.is_set():
+            page_count += 1
+            print(f"Fetching page {page_count}...")
+            response = get_sales_history(client=client, **params)
+            _put_until_stopped(pages, response, stop)
 
-    price_detail = {}
-    try:
-        price_detail = get_sale_price_details(txn_id, client=client)
+            next_token = response.get("page_info", {}).get("next_page_token")
+            if not next_token:
+                break
+            params["page_token"] = next_token
     except Exception as e:
-        print(f"Price enrichment failed for {txn_id}: {e}")
-
-    user_address = user_detail.get("address", {})
-    phone_rich = user_detail.get("phone") or phone_fallback
-
-    # Model Mapping
-    customer = Customer(
-        id=buyer_id,
-        email=buyer_data.get("email")
-        or user_detail.get("email")
-        or f"unknown_{txn_id}@noemail.com",
-        name=buyer_data.get("name") or user_detail.get("name") or "Unknown Buyer",
-        phone=str(phone_rich) if phone_rich else None,
-        document=str(document) if document else None,
-        zip_code=user_address.get("zip_code"),
-        address=user_address.get("address"),
-        number=user_address.get("number"),
-        neighborhood=user_address.get("neighborhood"),
-        city=user_address.get("city"),
-        state=user_address.get("state"),
-        country=user_address.get("country"),
-        created_at=purchased_at,
-        updated_at=updated_at,
-    )
-
-    product = Product(
-        id=str(prod_data.get("id", "0")),
-        name=prod_data.get("name", "Unknown Product"),
-    )
-
-    # Payment
-    payment_method = purchase_data.get("payment", {}).get("type") or "UNKNOWN"
-    payment_type = None
-    installments = None
-    payment_meta = price_detail.get("payment")
-    if payment_meta:
-        payment_type = payment_meta.get("type") or payment_method
-        installments = payment_meta.get("installments_number")
-
-    total_price = purchase_data.get("price", {}).get("value") or getattr(
-        purchase_data, "price", 0.0
-    )
-
-    # Status resilience (Hypothesis found dictionary case)
-    status_str = str(status) if not isinstance(status, str) else status
-
-    sale = Sale(
-        transaction=txn_id,
-        status=status_str.upper(),
-        total_price=float(total_price or 0.0),
-        currency=purchase_data.get("currency", "BRL"),
-        payment_method=payment_method,
-        payment_type=payment_type,
-        installments=installments,
-        approved_date=int(updated_at_raw) if updated_at_raw else None,
-        order_date=(
-            int(purchase_data.get("order_date"))
-            if purchase_data.get("order_date")
-            else None
-        ),
-        purchased_at=purchased_at,
-        updated_at=updated_at,
-        customer_id=customer.id,
-        product_id=product.id,
-    )
-
-    return customer, product, sale
+        _put_until_stopped(pages, e, stop)
+        return
+    _put_until_stopped(pages, _END_OF_PAGES, stop)
 
 
 def fetch_and_save_sales(
@@ -169,10 +67,22 @@ def fetch_and_save_sales(
     page_token: str = None,
     client: Optional[HotmartClient] = None,
     imported_at: str = None,
+    max_workers: Optional[int] = None,
+    cache: Optional[ResponseCache] = None,
+    landing: Optional[LandingZone] = None,
 ) -> int:
-    """Core function to fetch sales over a specific time period and save them to SQLite."""
+    """
+    Core function to fetch sales over a specific time period and save them to SQLite.
+    The enrichment lookups of each page run concurrently (see sales_pages.py),
+    bounded by max_workers (defaults to Config.HOTMART_ENRICH_WORKERS), while a
+    fetcher thread prefetches the next pages (see _prefetch_pages).
+    Enrichment responses are served from cache when one is given, and raw
+    pages are kept in landing when one is given.
+    """
     if client is None:
         client = HotmartClient()
+    if max_workers is None:
+        max_workers = Config.HOTMART_ENRICH_WORKERS
     params = {}
     if start_date_ms:
         params["start_date"] = start_date_ms
@@ -184,78 +94,60 @@ def fetch_and_save_sales(
     print(f"Fetching sales history with base params: {params}")
     success_count = 0
     page_count = 0
-    has_next = True
 
-    while has_next:
-        page_count += 1
-        try:
-            print(f"Fetching page {page_count}...")
-            response = get_sales_history(client=client, **params)
-        except Exception as e:
-            print(f"Failed to fetch data from Hotmart. Error: {e}")
-            break
-
-        items = response.get("items", [])
-        page_info = response.get("page_info", {})
-        print(
-            f"Retrieved {len(items)} sales records in page {page_count}. Processing models..."
-        )
-
-        # Determine if there's a next page and update params
-        next_token = page_info.get("next_page_token")
-        if next_token:
-            params["page_token"] = next_token
-        else:
-            has_next = False
-
-        # Process the page's items
-        for item in items:
-            txn_id = "UNKNOWN"
-            try:
-                # Use extracted mapping function
-                customer, product, sale = _extract_sale_models(item, client)
-                txn_id = sale.transaction
+    # The fetcher thread stays at most HOTMART_PREFETCH_PAGES pages ahead
+    pages = queue.Queue(maxsize=max(Config.HOTMART_PREFETCH_PAGES, 1))
+    stop = threading.Event()
+    fetcher = threading.Thread(
+        target=_prefetch_pages,
+        args=(params, client, pages, stop),
+        name="hotmart-page-fetcher",
+        daemon=True,
+    )
+    fetcher.start()
 
-                # 3. Save to database
-                upsert_customer(conn, customer)
-                upsert_product(conn, product)
-                upsert_sale(conn, sale, imported_at=imported_at)
+    try:
+        while True:
+            page = pages.get()
+            if page is _END_OF_PAGES:
+                break
+            if isinstance(page, Exception):
+                print(f"Failed to fetch data from Hotmart. Error: {page}")
+                break
 
-                success_count += 1
+            page_count += 1
+            items = page.get("items", [])
+            print(
+                f"Retrieved {len(items)} sales records in page {page_count}. Processing models..."
+            )
 
-            except Exception as e:
-                print(f"Skipping malformed or incomplete item {txn_id}: {e}")
-                continue
+            records = _build_page_records(
+                items, client, max_workers, cache, landing=landing
+            )
 
+            # Save the whole page in a single transaction
+            success_count += bulk_upsert_sales(conn, records, imported_at=imported_at)
             conn.commit()
+    finally:
+        # Also unblocks the fetcher if we stopped early (error or break)
+        stop.set()
+        fetcher.join()
 
     print(
         f"Successfully synced {success_count} total sales into the database over {page_count} pages."
     )
+    if cache is not None:
+        stats = cache.stats()
+        print(
+            f"Enrichment cache: {stats['hits']} hits, {stats['misses']} misses "
+            f"({stats['expired']} expired, {stats['invalidated']} status changes), "
+            f"hit rate {stats['hit_rate']:.0%}."
+        )
     return success_count
 
 
-def get_date_chunks(
-    start_dt: datetime, end_dt: datetime, max_days: int = 730
-) -> list[tuple[datetime, datetime]]:
-    """Breaks a date range into smaller chunks of up to max_days to avoid API limits."""
-    chunks = []
-    current_start = start_dt
-    while current_start <= end_dt:
-        current_end = current_start + timedelta(days=max_days)
-        if current_end > end_dt:
-            current_end = end_dt
-
-        chunks.append((current_start, current_end))
-        current_start = current_end + timedelta(days=1)
-
-    return chunks
-
-
-def do_initial_sync(conn, client: HotmartClient = None, imported_at: str = None):
-    """Scenario 1: The database is empty. Requires dates from .env config."""
-    print("Scenario: Initial sync -> requiring dates from .env config.")
-
+def _initial_sync_range() -> tuple[datetime, datetime]:
+    """Range of the initial sync: the .env dates, or yesterday in DEV."""
     if not Config.HOTMART_START_DATE or not Config.HOTMART_END_DATE:
         raise ValueError(
             "HOTMART_START_DATE and HOTMART_END_DATE must be provided in .env for the initial sync."
@@ -265,24 +157,33 @@ def do_initial_sync(conn, client: HotmartClient = None, imported_at: str = None)
         yesterday = datetime.now() - timedelta(days=1)
         start_dt = yesterday.replace(hour=0, minute=0, second=0, microsecond=0)
         end_dt = yesterday.replace(hour=23, minute=59, second=59, microsecond=999)
-        print(f"DEV MODE: Overriding dates to yesterday only: {start_dt} to {end_dt}")
-    else:
-        start_dt = datetime.strptime(Config.HOTMART_START_DATE, "%Y-%m-%d")
-        end_dt = datetime.strptime(Config.HOTMART_END_DATE, "%Y-%m-%d")
+        return start_dt, end_dt
 
-    client = client or HotmartClient()
-    chunks = get_date_chunks(start_dt, end_dt, max_days=730)
+    start_dt = datetime.strptime(Config.HOTMART_START_DATE, "%Y-%m-%d")
+    end_dt = datetime.strptime(Config.HOTMART_END_DATE, "%Y-%m-%d")
+    return start_dt, end_dt
 
-    for current_start, current_end in chunks:
-        print(
-            f"Syncing chunk from {current_start.strftime('%Y-%m-%d')} to {current_end.strftime('%Y-%m-%d')}"
-        )
-        start_ms = str(int(current_start.timestamp() * 1000))
-        end_ms = str(int(current_end.timestamp() * 1000))
 
-        fetch_and_save_sales(
-            conn, start_ms, end_ms, client=client, imported_at=imported_at
-        )
+def do_initial_sync(conn, client: HotmartClient = None, imported_at: str = None):
+    """Scenario 1: The database is empty. Requires dates from .env config."""
+    print("Scenario: Initial sync -> requiring dates from .env config.")
+
+    start_dt, end_dt = _initial_sync_range()
+    if Config.is_dev():
+        print(f"DEV MODE: Overriding dates to yesterday only: {start_dt} to {end_dt}")
+
+    # Date windows are fetched concurrently and checkpointed (see backfill.py).
+    # Every window enriches its pages concurrently: size the keep-alive pool
+    # for all of them, or urllib3 discards the extra connections
+    client = client or HotmartClient(pool_size=backfill_pool_size())
+    run_backfill(
+        conn,
+        start_dt,
+        end_dt,
+        client=client,
+        imported_at=imported_at,
+        landing=open_landing_zone(),
+    )
 
 
 def do_incremental_sync(
@@ -304,39 +205,80 @@ def do_incremental_sync(
     end_ms = str(int(end_date.timestamp() * 1000))
 
     client = client or HotmartClient()
-    fetch_and_save_sales(conn, start_ms, end_ms, client=client, imported_at=imported_at)
+    # The overlap with the previous run is mostly served from the response cache
+    cache = open_response_cache()
+    try:
+        fetch_and_save_sales(
+            conn,
+            start_ms,
+            end_ms,
+            client=client,
+            imported_at=imported_at,
+            cache=cache,
+            landing=open_landing_zone(),
+        )
+    finally:
+        if cache is not None:
+            cache.close()
 
 
-def sync_sales_to_db():
+def sync_sales_to_db(full_rebuild: bool = False, conn=None):
     """
     Main orchestrator that determines the scenario and triggers the correct flow.
     Uses Config to determine the date range based on the environment.
+    Only the customers touched by this run are re-consolidated unless
+    full_rebuild is set. conn is the shared job connection (see
+    PipelineContext); without it the sync opens and closes its own.
     """
     print("Starting Hotmart sync pipeline...")
 
-    # Ensure database is ready
-    conn = get_connection()
-    init_db(conn)
-    print("Database initialized.")
+    own_conn = conn is None
+    if own_conn:
+        # Ensure database is ready
+        conn = get_connection()
+        init_db(conn)
+        print("Database initialized.")
+    try:
+        _run_sync(conn, full_rebuild)
+    finally:
+        if own_conn:
+            conn.close()
+    print("Hotmart sync completed.")
+
 
+def _run_sync(conn, full_rebuild: bool):
     # Generate a unique timestamp for this run (for reporting deltas)
     run_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     max_date = get_max_sale_date(conn)
 
-    if not max_date:
+    # An interrupted backfill of the current range resumes before switching to
+    # incremental syncs (windows of an older range are not resumable)
+    backfill_id = None
+    if max_date and Config.HOTMART_START_DATE and Config.HOTMART_END_DATE:
+        backfill_id = make_backfill_id(*_initial_sync_range())
+
+    if not max_date or has_unfinished_backfill(conn, backfill_id):
         do_initial_sync(conn, imported_at=run_timestamp)
     else:
         do_incremental_sync(conn, max_date, imported_at=run_timestamp)
 
-    consolidate_all_to_master(conn)
+    if full_rebuild:
+        consolidate_all_to_master(conn)
+    else:
+        consolidate_changes_to_master(conn)
 
     print("\nGenerating status report...")
     generate_delta_report(conn)
 
-    conn.close()
-    print("Hotmart sync completed.")
-
 
 if __name__ == "__main__":
-    sync_sales_to_db()
+    parser = argparse.ArgumentParser(description="Sync Hotmart sales to the CRM.")
+    parser.add_argument(
+        "--full-rebuild",
+        action="store_true",
+        help="Rebuild the whole Master table instead of only the changes",
+    )
+    args = parser.parse_args()
+
+    sync_sales_to_db(full_rebuild=args.full_rebuild)
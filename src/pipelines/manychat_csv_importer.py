@@ -1,8 +1,16 @@
-import csv
 import argparse
+import hashlib
 import os
 from datetime import datetime, timedelta
-from src.db.database import get_connection, consolidate_all_to_master
+from typing import Iterator, List
+import numpy as np
+import pandas as pd
+from src.db.database import (
+    get_connection,
+    init_db,
+    consolidate_all_to_master,
+    consolidate_changes_to_master,
+)
 from src.config import Config
 
 
@@ -30,54 +38,255 @@ def excel_date_to_datetime(excel_date_str: str) -> str:
         return ""
 
 
-def import_manychat_csv(file_path: str):
+# Vectorized excel_date_to_datetime(): same epoch and the same float -> microsecond
+# rounding as datetime.timedelta(days=...), one numpy pass per column.
+EXCEL_EPOCH = np.datetime64("1899-12-30T00:00:00", "us")
+US_PER_DAY = 86_400_000_000
+# Serials that land between year 1 and year 9999 (the datetime range)
+EXCEL_MIN_SERIAL = -693593
+EXCEL_MAX_SERIAL = 2958466
+
+
+def excel_dates_to_iso(values: pd.Series) -> pd.Series:
+    """
+    Converts a column of Excel serial dates (numbers, or strings with '.' or
+    ',' decimals) to ISO strings, matching excel_date_to_datetime(). Invalid
+    or missing values become ''.
+    """
+    if pd.api.types.is_numeric_dtype(values):
+        serial = values.to_numpy(dtype="float64", na_value=np.nan)
+    else:
+        text = values.fillna("").astype(str).str.replace(",", ".", regex=False)
+        serial = np.full(len(text), np.nan)
+        filled = (text != "").to_numpy()
+        # Python's float() parser (correctly rounded), as the scalar version uses
+        try:
+            serial[filled] = text[filled].astype("float64").to_numpy()
+        except ValueError:
+            # Some cells are not numbers: parse only the ones that are
+            numeric = pd.to_numeric(text, errors="coerce").notna().to_numpy()
+            serial[numeric] = text[numeric].astype("float64").to_numpy()
+
+    valid = (
+        np.isfinite(serial) & (serial >= EXCEL_MIN_SERIAL) & (serial < EXCEL_MAX_SERIAL)
+    )
+    serial = np.where(valid, serial, 0.0)
+
+    # timedelta(days=x): whole days exact, fraction -> microseconds, then
+    # round half to even on the total
+    whole_days = np.trunc(serial)
+    frac_us = (serial - whole_days) * US_PER_DAY
+    whole_us = np.trunc(frac_us)
+    odd = np.mod(whole_us, 2)
+    micros = (
+        whole_days.astype("int64") * US_PER_DAY
+        + whole_us.astype("int64")
+        + (np.round(frac_us - whole_us + odd) - odd).astype("int64")
+    )
+
+    stamps = np.datetime_as_string(
+        EXCEL_EPOCH + micros.astype("timedelta64[us]"), unit="us"
+    )
+    # isoformat() omits the fraction when it is zero
+    stamps = np.where(micros % 1_000_000 == 0, stamps.astype("U19"), stamps)
+    return pd.Series(np.where(valid, stamps, ""), index=values.index, dtype=object)
+
+
+# A contact exported again (same natural key) has its mutable columns
+# refreshed when they changed, and takes the next change_seq (the delta
+# consolidation watermark), so the change is picked up on the next run. The
+# id stays put: customers.manychat_id keeps pointing at the contact.
+SQL_INSERT_MANYCHAT_CONTACT = """
+    INSERT INTO manychat_contacts (
+        nome, email, instagram, whatsapp, data_remarketing,
+        agendamento, data_agendamento, contactar, data_contactar,
+        ultima_interacao, data_registro, natural_key
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(natural_key) DO UPDATE SET
+        nome = excluded.nome,
+        instagram = excluded.instagram,
+        data_remarketing = excluded.data_remarketing,
+        agendamento = excluded.agendamento,
+        data_agendamento = excluded.data_agendamento,
+        contactar = excluded.contactar,
+        data_contactar = excluded.data_contactar,
+        ultima_interacao = excluded.ultima_interacao,
+        imported_at = CURRENT_TIMESTAMP,
+        change_seq = (SELECT MAX(change_seq) FROM manychat_contacts) + 1
+    WHERE manychat_contacts.nome IS NOT excluded.nome
+        OR manychat_contacts.instagram IS NOT excluded.instagram
+        OR manychat_contacts.data_remarketing IS NOT excluded.data_remarketing
+        OR manychat_contacts.agendamento IS NOT excluded.agendamento
+        OR manychat_contacts.data_agendamento IS NOT excluded.data_agendamento
+        OR manychat_contacts.contactar IS NOT excluded.contactar
+        OR manychat_contacts.data_contactar IS NOT excluded.data_contactar
+        OR manychat_contacts.ultima_interacao IS NOT excluded.ultima_interacao
+"""
+
+SQL_GET_IMPORT_FILE = """
+    SELECT status, rows_committed FROM manychat_import_files WHERE file_hash = ?
+"""
+
+SQL_START_IMPORT_FILE = """
+    INSERT INTO manychat_import_files (file_hash, file_name, status, started_at)
+    VALUES (?, ?, 'IN_PROGRESS', ?)
+    ON CONFLICT(file_hash) DO UPDATE SET file_name = excluded.file_name
+"""
+
+SQL_IMPORT_FILE_PROGRESS = """
+    UPDATE manychat_import_files
+    SET rows_committed = rows_committed + ?, rows_inserted = rows_inserted + ?
+    WHERE file_hash = ?
+"""
+
+SQL_FINISH_IMPORT_FILE = """
+    UPDATE manychat_import_files SET status = 'DONE', finished_at = ?
+    WHERE file_hash = ?
+"""
+
+
+MANYCHAT_TEXT_COLUMNS = ["nome", "email", "instagram", "whatsapp"]
+MANYCHAT_FLAG_COLUMNS = ["agendamento", "contactar"]
+MANYCHAT_DATE_COLUMNS = [
+    "data_remarketing",
+    "data_agendamento",
+    "data_contactar",
+    "ultima_interacao",
+    "data_registro",
+]
+# Columns read from the export
+MANYCHAT_CSV_COLUMNS = [
+    "nome",
+    "email",
+    "instagram",
+    "whatsapp",
+    "data_remarketing",
+    "agendamento",
+    "data_agendamento",
+    "contactar",
+    "data_contactar",
+    "ultima_interacao",
+    "data_registro",
+]
+# Column order of SQL_INSERT_MANYCHAT_CONTACT
+MANYCHAT_INSERT_COLUMNS = MANYCHAT_CSV_COLUMNS + ["natural_key"]
+
+
+def _read_manychat_chunks(
+    file_path: str, chunk_size: int = None, skip_rows: int = 0
+) -> Iterator[pd.DataFrame]:
+    """
+    Streams a ManyChat CSV as DataFrames of at most chunk_size rows, already
+    cleaned and in MANYCHAT_INSERT_COLUMNS order. Memory stays flat.
+    The first skip_rows data rows are skipped (resume point).
+    """
+    chunk_size = chunk_size or Config.MANYCHAT_CHUNK_SIZE
+    # Manychat exports often use tabs instead of commas. Date columns are parsed
+    # as numbers by the C parser (PT-BR ',' decimals, correctly rounded); a
+    # column with anything else stays text and takes the slower string path.
+    with pd.read_csv(
+        file_path,
+        sep="\t",
+        usecols=lambda column: column in MANYCHAT_CSV_COLUMNS,
+        skiprows=range(1, skip_rows + 1),
+        dtype={column: str for column in MANYCHAT_TEXT_COLUMNS + MANYCHAT_FLAG_COLUMNS},
+        keep_default_na=False,
+        na_values={column: [""] for column in MANYCHAT_DATE_COLUMNS},
+        decimal=",",
+        float_precision="round_trip",
+        encoding="utf-8",
+        chunksize=chunk_size,
+    ) as reader:
+        for chunk in reader:
+            chunk = chunk.reindex(columns=MANYCHAT_CSV_COLUMNS)
+            for column in MANYCHAT_TEXT_COLUMNS:
+                chunk[column] = chunk[column].fillna("").str.strip()
+            for column in MANYCHAT_FLAG_COLUMNS:
+                chunk[column] = chunk[column].fillna("").str.strip().str.upper()
+            for column in MANYCHAT_DATE_COLUMNS:
+                chunk[column] = excel_dates_to_iso(chunk[column])
+            # Same expression as SQL_MANYCHAT_NATURAL_KEY
+            chunk["natural_key"] = (
+                chunk["whatsapp"] + "|" + chunk["email"] + "|" + chunk["data_registro"]
+            )
+            anonymous = (chunk["whatsapp"] == "") & (chunk["email"] == "")
+            chunk.loc[anonymous, "natural_key"] += (
+                "|" + chunk["nome"] + "|" + chunk["instagram"]
+            )[anonymous]
+            yield chunk
+
+
+def _file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _ingest_manychat_file(conn, file_path: str) -> int:
+    """
+    Loads a ManyChat CSV into manychat_contacts, committing after every chunk
+    together with the file's ledger entry (manychat_import_files):
+    - a file whose content hash is already DONE is skipped;
+    - an IN_PROGRESS file resumes after its last committed chunk.
+    Returns the number of new or changed rows.
+    """
+    file_hash = _file_sha256(file_path)
+    ledger = conn.execute(SQL_GET_IMPORT_FILE, (file_hash,)).fetchone()
+    if ledger and ledger[0] == "DONE":
+        print(f"{file_path} was already imported (same content). Skipping.")
+        return 0
+
+    skip_rows = ledger[1] if ledger else 0
+    if skip_rows:
+        print(f"Resuming {file_path} after {skip_rows} committed rows...")
+
+    now = datetime.now().isoformat()
+    conn.execute(SQL_START_IMPORT_FILE, (file_hash, os.path.basename(file_path), now))
+    conn.commit()
+
+    cur = conn.cursor()
+    rows_inserted = 0
+    for chunk in _read_manychat_chunks(file_path, skip_rows=skip_rows):
+        cur.executemany(
+            SQL_INSERT_MANYCHAT_CONTACT, chunk.itertuples(index=False, name=None)
+        )
+        inserted = max(cur.rowcount, 0)
+        conn.execute(SQL_IMPORT_FILE_PROGRESS, (len(chunk), inserted, file_hash))
+        conn.commit()
+        rows_inserted += inserted
+
+    conn.execute(SQL_FINISH_IMPORT_FILE, (datetime.now().isoformat(), file_hash))
+    conn.commit()
+    return rows_inserted
+
+
+def _run_consolidation(conn, full_rebuild: bool):
+    print("Triggering Master consolidation...")
+    if full_rebuild:
+        consolidate_all_to_master(conn)
+    else:
+        consolidate_changes_to_master(conn)
+    print("Consolidation finished.")
+
+
+def import_manychat_csv(file_path: str, full_rebuild: bool = False):
     """
     Reads a ManyChat CSV file (tab-separated) and imports it to the SQLite manychat_contacts table.
-    Then, it triggers the engine to merge these into the master customers table.
+    Then, it triggers the engine to merge these into the master customers table
+    (only the new contacts, unless full_rebuild is set).
     """
     conn = get_connection()
-    cur = conn.cursor()
+    init_db(conn)
 
     print(f"Opening {file_path} for ManyChat import...")
 
     try:
-        with open(file_path, mode="r", encoding="utf-8") as file:
-            # Manychat exports often use tabs instead of commas
-            reader = csv.DictReader(file, delimiter="\t")
-            rows_imported = 0
-
-            for row in reader:
-                cur.execute(
-                    """
-                    INSERT INTO manychat_contacts (
-                        nome, email, instagram, whatsapp, data_remarketing, 
-                        agendamento, data_agendamento, contactar, data_contactar, 
-                        ultima_interacao, data_registro
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                    (
-                        row.get("nome", "").strip(),
-                        row.get("email", "").strip(),
-                        row.get("instagram", "").strip(),
-                        row.get("whatsapp", "").strip(),
-                        excel_date_to_datetime(row.get("data_remarketing", "")),
-                        row.get("agendamento", "").strip().upper(),
-                        excel_date_to_datetime(row.get("data_agendamento", "")),
-                        row.get("contactar", "").strip().upper(),
-                        excel_date_to_datetime(row.get("data_contactar", "")),
-                        excel_date_to_datetime(row.get("ultima_interacao", "")),
-                        excel_date_to_datetime(row.get("data_registro", "")),
-                    ),
-                )
-                rows_imported += 1
-
-            conn.commit()
-            print(f"Import complete! {rows_imported} rows added to manychat_contacts.")
-
-            # Trigger consolidation
-            print("Triggering Master consolidation...")
-            consolidate_all_to_master(conn)
-            print("Consolidation finished.")
+        rows_imported = _ingest_manychat_file(conn, file_path)
+        print(f"Import complete! {rows_imported} rows added to manychat_contacts.")
+
+        _run_consolidation(conn, full_rebuild)
 
         # Cleanup: Delete file after successful processing
         os.remove(file_path)
@@ -91,22 +300,90 @@ def import_manychat_csv(file_path: str):
         conn.close()
 
 
-def process_manychat_input_dir():
-    """Processes all CSV files in the ManyChat input directory."""
+def import_manychat_batch(
+    file_paths: List[str], full_rebuild: bool = False, conn=None
+) -> dict:
+    """
+    Imports several ManyChat CSV files and consolidates once for the batch.
+    Files are tracked one by one: a file that fails keeps its committed chunks
+    (the next run resumes it) and stays on disk; files that finished are
+    deleted after the consolidation. conn is the shared job connection (see
+    PipelineContext); without it the batch opens and closes its own.
+    Returns {"imported": {path: new_rows}, "failed": {path: error}}.
+    """
+    results = {"imported": {}, "failed": {}}
+    if not file_paths:
+        return results
+
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+        init_db(conn)
+
+    try:
+        for file_path in file_paths:
+            print(f"Opening {file_path} for ManyChat import...")
+            try:
+                rows_imported = _ingest_manychat_file(conn, file_path)
+            except Exception as e:
+                conn.rollback()
+                results["failed"][file_path] = str(e)
+                print(f"An error occurred importing {file_path}: {e}")
+                continue
+            results["imported"][file_path] = rows_imported
+            print(f"{rows_imported} new rows from {file_path}.")
+
+        if not results["imported"]:
+            return results
+
+        _run_consolidation(conn, full_rebuild)
+
+    except Exception as e:
+        # Raw rows stay committed; the next run consolidates them and the
+        # ledger skips the files already loaded
+        print(f"An error occurred during batch consolidation: {e}")
+        for file_path in results["imported"]:
+            results["failed"][file_path] = str(e)
+        results["imported"] = {}
+        return results
+    finally:
+        if own_conn:
+            conn.close()
+
+    total = sum(results["imported"].values())
+    print(
+        f"Import complete! {total} rows from {len(results['imported'])} file(s) "
+        f"added to manychat_contacts."
+    )
+
+    # Cleanup: only files that were fully loaded and consolidated
+    for file_path in results["imported"]:
+        os.remove(file_path)
+        print(f"File {file_path} deleted successfully.")
+
+    return results
+
+
+def process_manychat_input_dir(full_rebuild: bool = False, conn=None):
+    """Processes all CSV files in the ManyChat input directory as one batch."""
     input_dir = Config.MANYCHAT_INPUT_DIR
     if not os.path.exists(input_dir):
         print(f"Input directory {input_dir} does not exist.")
         return
 
-    files = [f for f in os.listdir(input_dir) if f.endswith(".csv")]
+    files = sorted(f for f in os.listdir(input_dir) if f.endswith(".csv"))
     if not files:
         print(f"No CSV files found in {input_dir}.")
         return
 
-    for file_name in files:
-        full_path = os.path.join(input_dir, file_name)
-        print(f"Processing {file_name}...")
-        import_manychat_csv(full_path)
+    print(f"Processing {len(files)} file(s) from {input_dir}...")
+    results = import_manychat_batch(
+        [os.path.join(input_dir, file_name) for file_name in files],
+        full_rebuild=full_rebuild,
+        conn=conn,
+    )
+    if results["failed"]:
+        print(f"Files kept for retry: {', '.join(results['failed'])}")
 
 
 if __name__ == "__main__":
@@ -116,9 +393,14 @@ if __name__ == "__main__":
         nargs="?",
         help="Path to a specific ManyChat CSV file (optional)",
     )
+    parser.add_argument(
+        "--full-rebuild",
+        action="store_true",
+        help="Rebuild the whole Master table instead of only the new contacts",
+    )
     args = parser.parse_args()
 
     if args.file_path:
-        import_manychat_csv(args.file_path)
+        import_manychat_csv(args.file_path, full_rebuild=args.full_rebuild)
     else:
-        process_manychat_input_dir()
+        process_manychat_input_dir(full_rebuild=args.full_rebuild)
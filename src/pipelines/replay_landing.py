@@ -0,0 +1,137 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Optional
+from src.hotmart.landing import list_landing_files, read_landing_file
+from src.pipelines.sales_pages import _extract_sale_models
+from src.db.database import (
+    get_connection,
+    init_db,
+    bulk_upsert_sales,
+    consolidate_all_to_master,
+    consolidate_changes_to_master,
+)
+from src.config import Config
+
+# =====================================================================
+# Replays the Hotmart landing zone (see src/hotmart/landing.py): re-runs
+# the mapping of every landed page in worker processes and persists the
+# result, without touching the API. Files are written in landing order so
+# the newest version of a sale wins, one commit per file.
+# =====================================================================
+
+
+def _map_landing_file(path: str, strict: bool) -> tuple[list, int]:
+    """Worker: maps one landed page. Returns (records, skipped item count)."""
+    records = []
+    skipped = 0
+    for item, enrichment in read_landing_file(path):
+        try:
+            records.append(_extract_sale_models(item, None, enrichment, strict))
+        except Exception:
+            skipped += 1
+    return records, skipped
+
+
+def replay_landing(
+    conn,
+    paths: list[str],
+    workers: Optional[int] = None,
+    strict: Optional[bool] = None,
+    imported_at: str = None,
+) -> int:
+    """
+    Maps the given landed files with up to workers processes and upserts the
+    sales in file order. Returns the number of sales written.
+    """
+    if workers is None:
+        workers = Config.HOTMART_REPLAY_WORKERS or os.cpu_count() or 1
+    if strict is None:
+        strict = Config.HOTMART_STRICT_MODELS
+    if imported_at is None:
+        imported_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    saved = 0
+    skipped = 0
+
+    def persist(mapped):
+        nonlocal saved, skipped
+        for records, file_skipped in mapped:
+            saved += bulk_upsert_sales(
+                conn, records, imported_at=imported_at, replay=True
+            )
+            conn.commit()
+            skipped += file_skipped
+
+    if workers <= 1 or len(paths) <= 1:
+        persist(_map_landing_file(path, strict) for path in paths)
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as executor:
+            # map() keeps the file order; chunks amortize the IPC per file
+            chunksize = max(1, len(paths) // (workers * 4))
+            persist(
+                executor.map(
+                    _map_landing_file,
+                    paths,
+                    [strict] * len(paths),
+                    chunksize=chunksize,
+                )
+            )
+
+    print(
+        f"Replayed {len(paths)} landed page(s): {saved} sales saved, {skipped} skipped."
+    )
+    return saved
+
+
+def replay_landing_to_db(
+    directory: Optional[str] = None,
+    workers: Optional[int] = None,
+    full_rebuild: bool = False,
+):
+    """Replays a landing directory into the configured database and consolidates."""
+    directory = directory or Config.HOTMART_LANDING_DIR
+    paths = list_landing_files(directory)
+    if not paths:
+        print(f"No landed pages found in {directory}.")
+        return
+
+    conn = get_connection()
+    init_db(conn)
+    try:
+        replay_landing(conn, paths, workers=workers)
+        print("Triggering Master consolidation...")
+        if full_rebuild:
+            consolidate_all_to_master(conn)
+        else:
+            consolidate_changes_to_master(conn)
+        print("Consolidation finished.")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Re-map the Hotmart landing zone into the CRM without calling the API."
+    )
+    parser.add_argument(
+        "directory",
+        nargs="?",
+        help="Landing directory (defaults to HOTMART_LANDING_DIR)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Mapping processes (defaults to HOTMART_REPLAY_WORKERS or one per CPU)",
+    )
+    parser.add_argument(
+        "--full-rebuild",
+        action="store_true",
+        help="Rebuild the whole Master table instead of only the changes",
+    )
+    args = parser.parse_args()
+
+    replay_landing_to_db(
+        args.directory, workers=args.workers, full_rebuild=args.full_rebuild
+    )
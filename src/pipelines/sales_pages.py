@@ -0,0 +1,275 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional, Union
+from src.hotmart.sales import ResponseCache, get_sale_users, get_sale_price_details
+from src.hotmart.client import HotmartClient
+from src.hotmart.landing import LandingZone
+from src.models.schemas import (
+    AnyCustomer,
+    AnyProduct,
+    AnySale,
+    Customer,
+    CustomerRecord,
+    Product,
+    ProductRecord,
+    Sale,
+    SaleRecord,
+)
+from src.config import Config
+
+# =====================================================================
+# Hotmart /sales/history pages -> (customer, product, sale) records.
+#
+# Shared by the incremental sync (hotmart_to_db.py), the parallel backfill
+# (backfill.py) and the landing replay (replay_landing.py): enrichment of a
+# page through the secondary APIs, the mapping of each item, and the bounded
+# queue helper their fetcher threads use.
+# =====================================================================
+
+
+def _parse_hotmart_date(date_raw: Optional[Union[int, str]]) -> datetime:
+    """
+    Boundary Testable: Safely converts Hotmart millisecond timestamps to datetime.
+    """
+    if not date_raw:
+        return datetime.now()
+    try:
+        # Hotmart dates are in milliseconds
+        return datetime.fromtimestamp(int(date_raw) / 1000.0)
+    except (ValueError, TypeError, OSError):
+        return datetime.now()
+
+
+def _resolve_buyer_id(buyer_data: dict, txn_id: str) -> str:
+    """
+    MC/DC Testable: Resolves the best available unique ID for a buyer.
+    Conditions: ucode, id, txn_id.
+    """
+    ucode = buyer_data.get("ucode")
+    external_id = buyer_data.get("id")
+
+    if ucode:
+        return str(ucode)
+    if external_id:
+        return str(external_id)
+    return str(txn_id)
+
+
+def _resolve_transaction_id(item: dict) -> str:
+    """Reads the transaction code from a /sales/history item."""
+    purchase_data = item.get("purchase", {})
+    return purchase_data.get("transaction") or item.get("transaction") or "UNKNOWN"
+
+
+def _fetch_enrichment(
+    txn_id: str,
+    client: HotmartClient,
+    cache: Optional[ResponseCache] = None,
+    status: Optional[str] = None,
+) -> tuple[dict, dict]:
+    """
+    Calls the secondary APIs (/sales/users and /sales/price/details) for a transaction.
+    Failures are logged and degrade to empty dicts, so the sale is still saved.
+    With a cache, responses fetched under the same sale status are reused.
+    """
+    user_detail = {}
+    try:
+        users_meta = get_sale_users(txn_id, client=client, cache=cache, status=status)
+        users_list = users_meta.get("users", [])
+        for user in users_list:
+            if user.get("role") in ("BUYer", "BUYER"):
+                user_detail = user.get("user", {})
+                break
+        if not user_detail and users_list:
+            user_detail = users_list[0].get("user", {})
+    except Exception as e:
+        print(f"User enrichment failed for {txn_id}: {e}")
+
+    price_detail = {}
+    try:
+        price_detail = get_sale_price_details(
+            txn_id, client=client, cache=cache, status=status
+        )
+    except Exception as e:
+        print(f"Price enrichment failed for {txn_id}: {e}")
+
+    return user_detail, price_detail
+
+
+def _enrich_item(
+    item: dict, client: HotmartClient, cache: Optional[ResponseCache] = None
+) -> tuple[dict, dict]:
+    try:
+        txn_id = _resolve_transaction_id(item)
+        status = item.get("purchase", {}).get("status") or item.get("status")
+    except Exception:
+        # Malformed item: the mapping step reports and skips it
+        return {}, {}
+    return _fetch_enrichment(txn_id, client, cache, str(status) if status else None)
+
+
+def _enrich_items(
+    items: list[dict],
+    client: HotmartClient,
+    max_workers: int,
+    cache: Optional[ResponseCache] = None,
+) -> list[tuple[dict, dict]]:
+    """
+    Fans out the enrichment lookups of a whole page over a bounded thread pool.
+    At most max_workers transactions are in flight and results keep the page order.
+    """
+    if max_workers <= 1 or len(items) <= 1:
+        return [_enrich_item(item, client, cache) for item in items]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(lambda item: _enrich_item(item, client, cache), items))
+
+
+def _extract_sale_models(
+    item: dict,
+    client: HotmartClient,
+    enrichment: Optional[tuple[dict, dict]] = None,
+    strict: bool = True,
+) -> tuple[AnyCustomer, AnyProduct, AnySale]:
+    """
+    Orchestrates the mapping from Hotmart JSON to Pydantic models.
+    enrichment carries the pre-fetched (user_detail, price_detail) pair;
+    when omitted the secondary APIs are called inline.
+    With strict=False the same fields go into the unvalidated slots records
+    (CustomerRecord, ProductRecord, SaleRecord) used by the sync hot path.
+    """
+    if strict:
+        customer_cls, product_cls, sale_cls = Customer, Product, Sale
+    else:
+        customer_cls, product_cls, sale_cls = CustomerRecord, ProductRecord, SaleRecord
+
+    purchase_data = item.get("purchase", {})
+    buyer_data = item.get("buyer", {})
+    prod_data = item.get("product", {})
+
+    txn_id = _resolve_transaction_id(item)
+    status = purchase_data.get("status") or item.get("status") or "UNKNOWN"
+
+    # Dates
+    purchased_at = _parse_hotmart_date(purchase_data.get("order_date"))
+    updated_at_raw = purchase_data.get("approved_date")
+    updated_at = None
+    if updated_at_raw:
+        updated_at = _parse_hotmart_date(updated_at_raw)
+
+    # IDs and Contact
+    buyer_id = _resolve_buyer_id(buyer_data, txn_id)
+    phone_fallback = buyer_data.get("phone") or purchase_data.get("phone")
+    document = buyer_data.get("document") or purchase_data.get("document")
+
+    # Enrichment with secondary APIs
+    if enrichment is None:
+        enrichment = _fetch_enrichment(txn_id, client)
+    user_detail, price_detail = enrichment
+
+    user_address = user_detail.get("address", {})
+    phone_rich = user_detail.get("phone") or phone_fallback
+
+    # Model Mapping
+    customer = customer_cls(
+        id=buyer_id,
+        email=buyer_data.get("email")
+        or user_detail.get("email")
+        or f"unknown_{txn_id}@noemail.com",
+        name=buyer_data.get("name") or user_detail.get("name") or "Unknown Buyer",
+        phone=str(phone_rich) if phone_rich else None,
+        document=str(document) if document else None,
+        zip_code=user_address.get("zip_code"),
+        address=user_address.get("address"),
+        number=user_address.get("number"),
+        neighborhood=user_address.get("neighborhood"),
+        city=user_address.get("city"),
+        state=user_address.get("state"),
+        country=user_address.get("country"),
+        created_at=purchased_at,
+        updated_at=updated_at,
+    )
+
+    product = product_cls(
+        id=str(prod_data.get("id", "0")),
+        name=prod_data.get("name", "Unknown Product"),
+    )
+
+    # Payment
+    payment_method = purchase_data.get("payment", {}).get("type") or "UNKNOWN"
+    payment_type = None
+    installments = None
+    payment_meta = price_detail.get("payment")
+    if payment_meta:
+        payment_type = payment_meta.get("type") or payment_method
+        installments = payment_meta.get("installments_number")
+
+    total_price = purchase_data.get("price", {}).get("value") or getattr(
+        purchase_data, "price", 0.0
+    )
+
+    # Status resilience (Hypothesis found dictionary case)
+    status_str = str(status) if not isinstance(status, str) else status
+
+    sale = sale_cls(
+        transaction=txn_id,
+        status=status_str.upper(),
+        total_price=float(total_price or 0.0),
+        currency=purchase_data.get("currency", "BRL"),
+        payment_method=payment_method,
+        payment_type=payment_type,
+        installments=installments,
+        approved_date=int(updated_at_raw) if updated_at_raw else None,
+        order_date=(
+            int(purchase_data.get("order_date"))
+            if purchase_data.get("order_date")
+            else None
+        ),
+        purchased_at=purchased_at,
+        updated_at=updated_at,
+        customer_id=customer.id,
+        product_id=product.id,
+    )
+
+    return customer, product, sale
+
+
+def _build_page_records(
+    items: list[dict],
+    client: HotmartClient,
+    max_workers: int,
+    cache: Optional[ResponseCache] = None,
+    strict: Optional[bool] = None,
+    landing: Optional[LandingZone] = None,
+) -> list[tuple[AnyCustomer, AnyProduct, AnySale]]:
+    """
+    Enriches a whole page at once, then maps the items in page order.
+    Builds slots records unless strict (default Config.HOTMART_STRICT_MODELS)
+    asks for Pydantic validation. The raw page and its enrichment are written
+    to landing before mapping, so a mapping error can be replayed later.
+    """
+    if strict is None:
+        strict = Config.HOTMART_STRICT_MODELS
+    enrichments = _enrich_items(items, client, max_workers, cache)
+    if landing is not None:
+        landing.write_page(items, enrichments)
+
+    records = []
+    for item, enrichment in zip(items, enrichments):
+        try:
+            records.append(_extract_sale_models(item, client, enrichment, strict))
+        except Exception as e:
+            print(f"Skipping malformed or incomplete item: {e}")
+    return records
+
+
+def _put_until_stopped(target: queue.Queue, message, stop: threading.Event):
+    """Puts on a bounded queue, blocking while it is full, unless stop is set."""
+    while not stop.is_set():
+        try:
+            target.put(message, timeout=0.5)
+            return
+        except queue.Full:
+            continue
@@ -1,4 +1,3 @@
-import sqlite3
 import csv
 import argparse
 from pathlib import Path
@@ -8,6 +7,7 @@ from src.scripts.export_meta_audience import (
     normalize_phone_and_get_state,
 )
 from src.config import Config
+from src.db.database import get_read_connection
 
 
 def export_meta_audience_v2(product_ids: list[str], output_file: str):
@@ -16,8 +16,7 @@ def export_meta_audience_v2(product_ids: list[str], output_file: str):
         print(f"Erro: Banco de dados {db_path} não encontrado.")
         return
 
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
+    conn = get_read_connection(db_path)
     cur = conn.cursor()
 
     # Query all sales joining with customers
@@ -0,0 +1,25 @@
+import threading
+import pytest
+from http.server import ThreadingHTTPServer
+
+
+@pytest.fixture
+def stub_server():
+    """
+    Starts local HTTP servers for the given BaseHTTPRequestHandler classes.
+    Returns the base URL (http://127.0.0.1:<port>) of each server started.
+    """
+    servers = []
+
+    def start(handler_cls) -> str:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler_cls)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield start
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -1,8 +1,19 @@
 import pytest
-from src.db.database import get_connection, init_db, upsert_master_customer, upsert_sale
-from src.logic.audiences import refresh_audiences
-from src.models.schemas import Sale
-from src.logic.user_logic import ESTETICA_PRODUCT_IDS
+from datetime import datetime
+from unittest.mock import patch
+from src.db.database import (
+    ESTETICA_PRODUCT_IDS,
+    get_connection,
+    get_read_connection,
+    init_db,
+    consolidate_all_to_master,
+    upsert_customer,
+    upsert_master_customer,
+    upsert_sale,
+)
+from src.logic import audiences
+from src.logic.audiences import refresh_audiences, _get_aggregated_audience_data
+from src.models.schemas import Customer, Sale
 
 
 @pytest.fixture
@@ -103,3 +114,170 @@ def test_audience_ltv_upsert(db_conn):
 
     cur.execute("SELECT value FROM audience_estetica WHERE email='ltv@test.com'")
     assert cur.fetchone()["value"] == 25.5
+
+
+def test_audience_aggregation_in_sql(db_conn):
+    """
+    Decision Test: The grouped SQL uses product_segments (unlisted products are
+    ILPI), normalizes emails, ignores non-approved sales and customers without
+    email, and yields one row per customer per segment.
+    """
+    db_conn.execute(
+        "INSERT INTO product_segments (product_id, segment) VALUES ('NEW-EST', 'ESTETICA')"
+    )
+    upsert_master_customer(
+        db_conn, "HOTMART", email=" Mixed@Test.com ", name="Mixed", hotmart_id="H_M"
+    )
+    upsert_master_customer(
+        db_conn, "HOTMART", email="", phone="5511", name="NoMail", hotmart_id="H_N"
+    )
+
+    for txn, cid, pid, status, val in [
+        ("T1", "H_M", "NEW-EST", "APPROVED", 40.0),
+        ("T2", "H_M", "NEW-EST", "COMPLETE", 2.5),
+        ("T3", "H_M", "OTHER", "APPROVED", 7.0),
+        ("T4", "H_M", "OTHER", "REFUNDED", 999.0),
+        ("T5", "H_N", "OTHER", "APPROVED", 5.0),
+    ]:
+        upsert_sale(
+            db_conn,
+            Sale(
+                transaction=txn,
+                status=status,
+                total_price=val,
+                currency="BRL",
+                customer_id=cid,
+                product_id=pid,
+            ),
+        )
+
+    rows = sorted(
+        (r["email"], r["segment"], r["value"])
+        for r in _get_aggregated_audience_data(db_conn)
+    )
+    assert rows == [
+        ("mixed@test.com", "ESTETICA", 42.5),
+        ("mixed@test.com", "ILPI", 7.0),
+    ]
+
+
+def _approved_sale(txn, customer_id, product_id, status="APPROVED", value=10.0):
+    return Sale(
+        transaction=txn,
+        status=status,
+        total_price=value,
+        currency="BRL",
+        customer_id=customer_id,
+        product_id=product_id,
+    )
+
+
+def test_audience_rebuild_drops_refunded_customers(db_conn):
+    """
+    Regression Test: A customer whose only sale was refunded leaves the
+    audience on the next rebuild; the upsert mode (rebuild=False) keeps them.
+    """
+    upsert_master_customer(
+        db_conn, "HOTMART", email="r@test.com", name="Refund", hotmart_id="H_R"
+    )
+    upsert_master_customer(
+        db_conn, "HOTMART", email="k@test.com", name="Keep", hotmart_id="H_K"
+    )
+    upsert_sale(db_conn, _approved_sale("T1", "H_R", "P1"))
+    upsert_sale(db_conn, _approved_sale("T2", "H_K", "P1"))
+    refresh_audiences(db_conn)
+
+    upsert_sale(db_conn, _approved_sale("T1", "H_R", "P1", status="REFUNDED"))
+    refresh_audiences(db_conn, rebuild=False)
+    emails = [r["email"] for r in db_conn.execute("SELECT email FROM audience_ilpi")]
+    assert sorted(emails) == ["k@test.com", "r@test.com"]
+
+    refresh_audiences(db_conn)
+    emails = [r["email"] for r in db_conn.execute("SELECT email FROM audience_ilpi")]
+    assert emails == ["k@test.com"]
+    tables = {
+        r["name"]
+        for r in db_conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    }
+    assert not {t for t in tables if t.endswith("_shadow")}
+
+
+def test_audience_rebuild_is_atomic_for_readers(tmp_path):
+    """
+    Boundary Test: While the shadow tables are being loaded a reader still sees
+    the previous complete audience; a failed rebuild leaves it untouched.
+    """
+    db_path = str(tmp_path / "gold.sqlite")
+    conn = get_connection(db_path)
+    init_db(conn)
+    for i in range(3):
+        upsert_master_customer(
+            conn, "HOTMART", email=f"u{i}@test.com", name=f"U{i}", hotmart_id=f"H{i}"
+        )
+        upsert_sale(conn, _approved_sale(f"T{i}", f"H{i}", "P1"))
+    refresh_audiences(conn)
+    upsert_sale(conn, _approved_sale("T0", "H0", "P1", status="REFUNDED"))
+    conn.commit()
+
+    reader = get_read_connection(db_path)
+    seen_mid_rebuild = []
+
+    def on_statement(sql):
+        # Runs in the writer's open transaction, after the old table is gone
+        if sql.startswith("ALTER TABLE audience_ilpi_shadow"):
+            seen_mid_rebuild.append(
+                reader.execute("SELECT count(*) FROM audience_ilpi").fetchone()[0]
+            )
+
+    conn.set_trace_callback(on_statement)
+    refresh_audiences(conn)
+    conn.set_trace_callback(None)
+    assert seen_mid_rebuild == [3]
+    assert reader.execute("SELECT count(*) FROM audience_ilpi").fetchone()[0] == 2
+
+    real_rows = audiences._get_aggregated_audience_data
+
+    def failing_rows(c):
+        yield from real_rows(c)
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        audiences._rebuild_audience_data(conn, failing_rows(conn))
+    assert reader.execute("SELECT count(*) FROM audience_ilpi").fetchone()[0] == 2
+    reader.close()
+    conn.close()
+
+
+def test_product_segments_is_the_single_segment_source(db_conn):
+    """
+    Regression Test: init_db mirrors ESTETICA_PRODUCT_IDS into product_segments
+    (stale ids removed), and consolidation takes the master segment from the
+    same table the audiences read.
+    """
+    removed = sorted(ESTETICA_PRODUCT_IDS)[0]
+    with patch(
+        "src.db.database.ESTETICA_PRODUCT_IDS", ESTETICA_PRODUCT_IDS - {removed}
+    ):
+        init_db(db_conn)
+    segments = {
+        r["product_id"]
+        for r in db_conn.execute("SELECT product_id FROM product_segments")
+    }
+    assert segments == ESTETICA_PRODUCT_IDS - {removed}
+
+    upsert_customer(
+        db_conn,
+        Customer(id="H_S", email="s@test.com", name="S", created_at=datetime.now()),
+    )
+    upsert_sale(db_conn, _approved_sale("T-S", "H_S", removed))
+    consolidate_all_to_master(db_conn)
+    refresh_audiences(db_conn)
+
+    master = db_conn.execute(
+        "SELECT segment FROM customers WHERE hotmart_id = 'H_S'"
+    ).fetchone()
+    assert master["segment"] == "ILPI"
+    member = db_conn.execute(
+        "SELECT email FROM audience_ilpi WHERE email = 's@test.com'"
+    ).fetchone()
+    assert member is not None
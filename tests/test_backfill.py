@@ -0,0 +1,237 @@
+import threading
+import pytest
+from datetime import datetime
+from unittest.mock import patch, MagicMock
+from src.db.database import get_connection, init_db
+from src.pipelines.backfill import (
+    MS_PER_DAY,
+    AdaptiveWindowSizer,
+    backfill_pool_size,
+    has_unfinished_backfill,
+    make_backfill_id,
+    run_backfill,
+)
+
+# =====================================================================
+# Objetivo: Backfill paralelo com checkpoints. Uma API falsa devolve
+# vendas por janela de datas (2 páginas cada); verificamos cobertura do
+# intervalo, gravação dos checkpoints e retomada após falha.
+# =====================================================================
+
+START = datetime(2024, 1, 1)
+END = datetime(2024, 1, 10)
+BACKFILL_ID = make_backfill_id(START, END)
+
+
+class FakeSalesApi:
+    """Thread-safe /sales/history stub: 2 pages per window, one sale each."""
+
+    def __init__(self, fail_on=None):
+        self.calls = []
+        self.fail_on = fail_on
+        self._lock = threading.Lock()
+
+    def __call__(self, client=None, start_date=None, end_date=None, page_token=None):
+        with self._lock:
+            self.calls.append((start_date, end_date, page_token))
+            if self.fail_on and self.fail_on(start_date, page_token):
+                self.fail_on = None
+                raise ConnectionError("API down")
+        page = 2 if page_token else 1
+        return {
+            "items": [
+                {
+                    "purchase": {
+                        "transaction": f"T-{start_date}-{page}",
+                        "status": "APPROVED",
+                        "price": {"value": 10},
+                        "order_date": int(start_date),
+                    },
+                    "buyer": {"email": f"b{start_date}@test.com"},
+                    "product": {"id": 1, "name": "P"},
+                }
+            ],
+            "page_info": {"next_page_token": f"{start_date}-p2"} if page == 1 else {},
+        }
+
+
+@pytest.fixture
+def db_conn():
+    conn = get_connection(":memory:")
+    init_db(conn)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture(autouse=True)
+def small_windows():
+    with patch("src.pipelines.backfill.Config") as mock_config:
+        mock_config.HOTMART_BACKFILL_WORKERS = 3
+        mock_config.HOTMART_BACKFILL_WINDOW_DAYS = 2
+        mock_config.HOTMART_BACKFILL_TARGET_ROWS = 100
+        mock_config.HOTMART_ENRICH_WORKERS = 1
+        with (
+            patch("src.pipelines.sales_pages.get_sale_users", return_value={}),
+            patch("src.pipelines.sales_pages.get_sale_price_details", return_value={}),
+        ):
+            yield
+
+
+def _checkpoints(conn):
+    return conn.execute(
+        "SELECT window_start, window_end, next_page_token, pages, row_count, status "
+        "FROM sync_checkpoints ORDER BY window_start"
+    ).fetchall()
+
+
+def test_backfill_covers_range_with_checkpoints(db_conn):
+    """
+    Happy Path Test: Windows tile the range without gaps or overlaps, every
+    page is saved and every checkpoint ends DONE with its row count.
+    """
+    api = FakeSalesApi()
+    with patch("src.pipelines.backfill.get_sales_history", side_effect=api):
+        saved = run_backfill(db_conn, START, END, client=MagicMock())
+
+    rows = _checkpoints(db_conn)
+    assert rows[0]["window_start"] == int(START.timestamp() * 1000)
+    assert rows[-1]["window_end"] == int(END.timestamp() * 1000)
+    for previous, current in zip(rows, rows[1:]):
+        assert current["window_start"] == previous["window_end"] + 1
+
+    assert all(r["status"] == "DONE" and r["pages"] == 2 for r in rows)
+    assert all(r["row_count"] == 2 for r in rows)
+    assert saved == 2 * len(rows)
+    sales = db_conn.execute("SELECT COUNT(*) FROM sales").fetchone()[0]
+    assert sales == saved
+    assert not has_unfinished_backfill(db_conn, BACKFILL_ID)
+
+
+def test_backfill_resumes_from_last_page_token(db_conn):
+    """
+    Recovery Test: Page 2 of the first window fails. The window keeps its
+    checkpoint (token of page 2); the next run only asks for that page.
+    """
+    first_start = str(int(START.timestamp() * 1000))
+    api = FakeSalesApi(
+        fail_on=lambda start, token: start == first_start and token is not None
+    )
+    with patch("src.pipelines.backfill.get_sales_history", side_effect=api):
+        run_backfill(db_conn, START, END, client=MagicMock())
+
+    assert has_unfinished_backfill(db_conn, BACKFILL_ID)
+    first = _checkpoints(db_conn)[0]
+    assert first["status"] == "RUNNING"
+    assert first["next_page_token"] == f"{first_start}-p2"
+
+    retry = FakeSalesApi()
+    with patch("src.pipelines.backfill.get_sales_history", side_effect=retry):
+        saved = run_backfill(db_conn, START, END, client=MagicMock())
+
+    assert retry.calls == [(first_start, str(first["window_end"]), f"{first_start}-p2")]
+    assert saved == 1
+    assert not has_unfinished_backfill(db_conn, BACKFILL_ID)
+
+
+def test_backfill_restarts_window_when_resume_token_fails(db_conn):
+    """
+    Recovery Test: The stored page token is rejected on resume; the window
+    restarts from its first page instead of failing on every run.
+    """
+    first_start = str(int(START.timestamp() * 1000))
+    api = FakeSalesApi(
+        fail_on=lambda start, token: start == first_start and token is not None
+    )
+    with patch("src.pipelines.backfill.get_sales_history", side_effect=api):
+        run_backfill(db_conn, START, END, client=MagicMock())
+
+    expired = FakeSalesApi(fail_on=lambda start, token: token == f"{start}-p2")
+    with patch("src.pipelines.backfill.get_sales_history", side_effect=expired):
+        run_backfill(db_conn, START, END, client=MagicMock())
+
+    window_end = str(_checkpoints(db_conn)[0]["window_end"])
+    assert expired.calls == [
+        (first_start, window_end, f"{first_start}-p2"),
+        (first_start, window_end, None),
+        (first_start, window_end, f"{first_start}-p2"),
+    ]
+    assert not has_unfinished_backfill(db_conn, BACKFILL_ID)
+
+
+def test_resumed_backfill_sizes_windows_from_checkpoints(db_conn):
+    """
+    Recovery Test: A DONE checkpoint of 2 days with 400 rows (200/day) seeds
+    the sizer, so the next window is cut to 1 day (target 100 rows) instead
+    of starting over at the configured 2 days.
+    """
+    start_ms = int(START.timestamp() * 1000)
+    db_conn.execute(
+        "INSERT INTO sync_checkpoints "
+        "(backfill_id, window_start, window_end, row_count, status) "
+        "VALUES (?, ?, ?, 400, 'DONE')",
+        (BACKFILL_ID, start_ms, start_ms + 2 * MS_PER_DAY - 1),
+    )
+    db_conn.commit()
+
+    with patch("src.pipelines.backfill.get_sales_history", side_effect=FakeSalesApi()):
+        run_backfill(db_conn, START, END, client=MagicMock(), workers=1)
+
+    second = _checkpoints(db_conn)[1]
+    assert second["window_start"] == start_ms + 2 * MS_PER_DAY
+    assert second["window_end"] - second["window_start"] + 1 == MS_PER_DAY
+
+
+def test_stale_backfill_range_is_abandoned(db_conn):
+    """
+    Decision Test: Unfinished windows of another range (edited .env dates)
+    do not count as an unfinished backfill and are retired by the next run.
+    """
+    db_conn.execute(
+        "INSERT INTO sync_checkpoints (backfill_id, window_start, window_end, status) "
+        "VALUES ('1-2', 1, 2, 'RUNNING')"
+    )
+    db_conn.commit()
+    assert has_unfinished_backfill(db_conn, "1-2")
+    assert not has_unfinished_backfill(db_conn, BACKFILL_ID)
+    assert not has_unfinished_backfill(db_conn, None)
+
+    with patch("src.pipelines.backfill.get_sales_history", side_effect=FakeSalesApi()):
+        run_backfill(db_conn, START, END, client=MagicMock())
+
+    status = db_conn.execute(
+        "SELECT status FROM sync_checkpoints WHERE backfill_id = '1-2'"
+    ).fetchone()[0]
+    assert status == "ABANDONED"
+
+
+def test_backfill_pool_size_covers_all_windows():
+    """
+    Boundary Test: The connection pool fits every window's page fetch plus
+    its enrichment workers, and never drops below HOTMART_POOL_SIZE.
+    """
+    with patch("src.pipelines.backfill.Config.HOTMART_POOL_SIZE", 10):
+        assert backfill_pool_size(3, 8) == 27
+        assert backfill_pool_size(1, 2) == 10
+
+
+def test_adaptive_window_sizer():
+    """
+    Boundary Test: Dense windows shrink toward target_rows, empty windows
+    double, and the length stays within [min_days, max_days].
+    """
+    sizer = AdaptiveWindowSizer(initial_days=30, target_rows=1000, max_days=730)
+
+    sizer.observe(days=30, rows=6000)  # 200 rows/day
+    assert sizer.days == pytest.approx(5)
+
+    sizer.observe(days=5, rows=0)
+    assert sizer.days == pytest.approx(10)
+
+    sizer.observe(days=10, rows=10)  # sparse: capped at 2x growth
+    assert sizer.days == pytest.approx(20)
+
+    sizer.observe(days=1, rows=10**9)
+    assert sizer.days == 1
+
+    assert AdaptiveWindowSizer(5000, 1000).days == 730
+    assert MS_PER_DAY == 24 * 60 * 60 * 1000
@@ -4,6 +4,7 @@ from src.db.database import (
     init_db,
     upsert_customer,
     consolidate_all_to_master,
+    consolidate_changes_to_master,
     upsert_sale,
 )
 from src.models.schemas import Customer, Sale
@@ -118,3 +119,276 @@ def test_segmentation_logic_ambos(temp_db):
     ).fetchone()
     assert row["segment"] == "AMBOS"
     assert bool(row["has_purchased"]) is True
+
+
+def test_manychat_duplicates_merge_into_one_master(temp_db):
+    """
+    Scenario: The same phone appears in several ManyChat rows (re-exports),
+    and two different contacts have no email at all.
+    Assertion: One master row per phone; first non-empty values win, the
+    latest remarketing date wins, and empty emails do not collide.
+    """
+    temp_db.executemany(
+        """
+        INSERT INTO manychat_contacts (nome, email, instagram, whatsapp, data_remarketing)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        [
+            ("First", "", "", "5511000000001", "2024-01-01T00:00:00"),
+            ("", "late@test.com", "insta_late", "5511000000001", ""),
+            ("Again", "", "", "5511000000001", "2024-03-01T00:00:00"),
+            ("Other", "", "", "5511000000002", ""),
+        ],
+    )
+
+    consolidate_all_to_master(temp_db)
+
+    rows = temp_db.execute("SELECT * FROM customers ORDER BY master_phone").fetchall()
+    assert len(rows) == 2
+
+    merged = rows[0]
+    assert merged["master_phone"] == "5511000000001"
+    assert merged["name"] == "First"
+    assert merged["master_email"] == "late@test.com"
+    assert merged["instagram"] == "insta_late"
+    assert merged["last_remarketing_at"] == "2024-03-01T00:00:00"
+    assert merged["source"] == "MANYCHAT"
+
+    assert rows[1]["master_email"] is None
+
+
+def test_manychat_only_supplements_hotmart_owned_row(temp_db):
+    """
+    Scenario: A Hotmart buyer also exists in ManyChat with another name.
+    Assertion: ManyChat only fills instagram/manychat_id on the Hotmart row.
+    """
+    upsert_customer(
+        temp_db,
+        Customer(
+            id="H1",
+            email="buyer@test.com",
+            name="Buyer Hotmart",
+            phone="5511999990000",
+            created_at=datetime.now(),
+        ),
+    )
+    temp_db.execute("""
+        INSERT INTO manychat_contacts (nome, email, instagram, whatsapp, data_remarketing)
+        VALUES ('Buyer ManyChat', 'buyer@test.com', 'buyer_insta', '5511999990000', '2024-01-01')
+    """)
+
+    consolidate_all_to_master(temp_db)
+
+    rows = temp_db.execute("SELECT * FROM customers").fetchall()
+    assert len(rows) == 1
+    assert rows[0]["name"] == "Buyer Hotmart"
+    assert rows[0]["source"] == "HOTMART"
+    assert rows[0]["instagram"] == "buyer_insta"
+    assert rows[0]["manychat_id"] is not None
+    assert rows[0]["last_remarketing_at"] is None
+
+
+def test_consolidation_is_idempotent_and_uses_latest_raw(temp_db):
+    """
+    Scenario: A Hotmart customer changes email between loads; consolidation
+    runs twice.
+    Assertion: The master row follows the latest Raw version and re-running
+    does not create duplicates.
+    """
+    upsert_customer(
+        temp_db,
+        Customer(id="H2", email="old@test.com", name="V1", created_at=datetime.now()),
+    )
+    temp_db.execute("UPDATE hotmart_customers SET imported_at = '2024-01-01 00:00:00'")
+    upsert_customer(
+        temp_db,
+        Customer(id="H2", email="new@test.com", name="V2", created_at=datetime.now()),
+    )
+    upsert_sale(
+        temp_db,
+        Sale(
+            transaction="T-H2",
+            status="APPROVED",
+            total_price=10.0,
+            currency="BRL",
+            customer_id="H2",
+            product_id="999",
+            purchased_at=datetime(2024, 5, 1),
+        ),
+    )
+
+    consolidate_all_to_master(temp_db)
+    consolidate_all_to_master(temp_db)
+
+    rows = temp_db.execute("SELECT * FROM customers").fetchall()
+    assert len(rows) == 1
+    assert rows[0]["hotmart_id"] == "H2"
+    assert rows[0]["name"] == "V2"
+    assert rows[0]["segment"] == "ILPI"
+    assert rows[0]["last_purchase_at"] == "2024-05-01T00:00:00"
+    assert bool(rows[0]["has_purchased"]) is True
+
+
+def _master_snapshot(conn):
+    """Master rows without the run timestamp, comparable across runs."""
+    rows = conn.execute("""
+        SELECT master_email, master_phone, name, instagram, hotmart_id,
+               manychat_id, source, has_purchased, segment,
+               last_remarketing_at, last_purchase_at
+        FROM customers ORDER BY master_phone, master_email
+    """).fetchall()
+    return [tuple(row) for row in rows]
+
+
+def _load_batch(conn, batch: int, imported_at: str):
+    """One sync run: a new buyer, a repeat purchase and a ManyChat contact."""
+    upsert_customer(
+        conn,
+        Customer(
+            id=f"HB{batch}",
+            email=f"buyer{batch}@test.com",
+            name=f"Buyer {batch}",
+            phone=f"55110000000{batch}",
+            created_at=datetime.now(),
+        ),
+    )
+    for txn, customer_id, product_id in [
+        (f"TB{batch}", f"HB{batch}", "999"),
+        (f"TR{batch}", "HB0", "5587176"),
+    ]:
+        upsert_sale(
+            conn,
+            Sale(
+                transaction=txn,
+                status="APPROVED",
+                total_price=10.0,
+                currency="BRL",
+                customer_id=customer_id,
+                product_id=product_id,
+                purchased_at=datetime(2024, 1, batch + 1),
+            ),
+            imported_at=imported_at,
+        )
+    conn.execute(
+        """
+        INSERT INTO manychat_contacts (nome, email, instagram, whatsapp)
+        VALUES (?, '', ?, ?)
+        """,
+        (f"Lead {batch}", f"insta_{batch}", f"55110000000{batch + 1}"),
+    )
+
+
+def test_delta_consolidation_matches_full_rebuild(temp_db):
+    """
+    Scenario: Three sync runs, each followed by a delta consolidation.
+    Assertion: The Master table ends up identical to a full rebuild, and each
+    delta only merges the rows that arrived in its run.
+    """
+    staged = []
+    for batch in range(3):
+        _load_batch(temp_db, batch, imported_at=f"2024-02-0{batch + 1} 10:00:00")
+        staged.append(consolidate_changes_to_master(temp_db))
+
+    # First run has no watermarks; later runs see one new buyer plus the
+    # repeat buyer HB0 and one new ManyChat contact
+    assert (
+        staged == [{"hotmart": 1, "manychat": 1}] + [{"hotmart": 2, "manychat": 1}] * 2
+    )
+
+    delta = _master_snapshot(temp_db)
+    consolidate_all_to_master(temp_db)
+    assert delta == _master_snapshot(temp_db)
+
+    repeat_buyer = temp_db.execute(
+        "SELECT * FROM customers WHERE hotmart_id = 'HB0'"
+    ).fetchone()
+    assert repeat_buyer["segment"] == "AMBOS"
+    assert repeat_buyer["last_purchase_at"] == "2024-01-03T00:00:00"
+
+
+def test_delta_consolidation_skips_untouched_customers(temp_db):
+    """
+    Scenario: Nothing new arrived since the last consolidation.
+    Assertion: The delta run merges nothing and leaves Master rows untouched;
+    the explicit full rebuild still re-merges everyone.
+    """
+    _load_batch(temp_db, 0, imported_at="2024-02-01 10:00:00")
+    consolidate_all_to_master(temp_db)
+    temp_db.execute("UPDATE customers SET name = 'Edited' WHERE hotmart_id = 'HB0'")
+    temp_db.commit()
+
+    assert consolidate_changes_to_master(temp_db) == {"hotmart": 0, "manychat": 0}
+    row = temp_db.execute("SELECT name FROM customers WHERE hotmart_id = 'HB0'")
+    assert row.fetchone()["name"] == "Edited"
+
+    assert consolidate_all_to_master(temp_db) == {"hotmart": 1, "manychat": 1}
+    row = temp_db.execute("SELECT name FROM customers WHERE hotmart_id = 'HB0'")
+    assert row.fetchone()["name"] == "Buyer 0"
+
+
+def test_seed_dedupes_emails_differing_in_case(temp_db):
+    """
+    Scenario: Two Hotmart buyers of the same batch share an email that only
+    differs in case.
+    Assertion: One master row, stored under the normalized email key.
+    """
+    temp_db.executemany(
+        "INSERT INTO hotmart_customers (id, email, name, created_at) "
+        "VALUES (?, ?, ?, '2024-01-01')",
+        [("HC1", "Case@Test.com", "Upper"), ("HC2", "case@test.com ", "Lower")],
+    )
+
+    consolidate_all_to_master(temp_db)
+
+    rows = temp_db.execute("SELECT master_email, hotmart_id FROM customers").fetchall()
+    assert len(rows) == 1
+    assert rows[0]["master_email"] == "case@test.com"
+
+
+def test_merge_keeps_attributes_when_identity_collides(temp_db, capsys):
+    """
+    Scenario: A Hotmart buyer's new version brings a phone that already
+    belongs to another master row, together with a new approved sale.
+    Assertion: The phone change is skipped (and reported) but the purchase
+    attributes still land on the buyer's master row.
+    """
+    upsert_customer(
+        temp_db,
+        Customer(id="HA", email="a@test.com", name="A", created_at=datetime.now()),
+    )
+    temp_db.execute(
+        "INSERT INTO manychat_contacts (nome, whatsapp) VALUES ('B', '5511000000009')"
+    )
+    consolidate_changes_to_master(temp_db)
+
+    upsert_customer(
+        temp_db,
+        Customer(
+            id="HA",
+            email="a@test.com",
+            name="A",
+            phone="5511000000009",
+            created_at=datetime.now(),
+        ),
+    )
+    upsert_sale(
+        temp_db,
+        Sale(
+            transaction="T-HA",
+            status="APPROVED",
+            total_price=10.0,
+            currency="BRL",
+            customer_id="HA",
+            product_id="999",
+            purchased_at=datetime(2024, 6, 1),
+        ),
+    )
+    consolidate_changes_to_master(temp_db)
+
+    buyer = temp_db.execute(
+        "SELECT * FROM customers WHERE hotmart_id = 'HA'"
+    ).fetchone()
+    assert buyer["master_phone"] is None
+    assert bool(buyer["has_purchased"]) is True
+    assert buyer["last_purchase_at"] == "2024-06-01T00:00:00"
+    assert "1 master row(s) kept their email/phone/id" in capsys.readouterr().out
@@ -1,7 +1,15 @@
 import sqlite3
 import pytest
 from datetime import datetime
-from src.db.database import init_db, upsert_customer, upsert_product, upsert_sale
+from src.db.database import (
+    get_connection,
+    get_read_connection,
+    init_db,
+    upsert_customer,
+    upsert_product,
+    upsert_sale,
+    bulk_upsert_sales,
+)
 from src.models.schemas import Customer, Product, Sale
 
 
@@ -137,3 +145,293 @@ def test_upsert_customer_boundary_append_only(mock_db):
     # Ensure count is 2
     cur.execute("SELECT count(*) FROM hotmart_customers")
     assert cur.fetchone()[0] == 2
+
+
+def test_upsert_customer_appends_only_changed_versions(mock_db):
+    """
+    CDC Test: Re-importing a buyer with the same attributes (only the sale
+    dates differ) appends nothing; a changed attribute appends one version
+    and hotmart_customers_current points at it.
+    """
+    for day in (1, 2):
+        upsert_customer(
+            mock_db,
+            Customer(
+                id="B-2", email="a@b.com", name="A", created_at=datetime(2024, 1, day)
+            ),
+        )
+    assert mock_db.execute("SELECT count(*) FROM hotmart_customers").fetchone()[0] == 1
+
+    upsert_customer(
+        mock_db,
+        Customer(
+            id="B-2",
+            email="a@b.com",
+            name="A",
+            city="Recife",
+            created_at=datetime(2024, 1, 3),
+        ),
+    )
+    history = mock_db.execute(
+        "SELECT row_id, city FROM hotmart_customers WHERE id = 'B-2' ORDER BY row_id"
+    ).fetchall()
+    assert [r["city"] for r in history] == [None, "Recife"]
+
+    current = mock_db.execute(
+        "SELECT row_id FROM hotmart_customers_current WHERE id = 'B-2'"
+    ).fetchone()
+    assert current["row_id"] == history[-1]["row_id"]
+
+
+def _page_record(txn: str, status="APPROVED"):
+    cust = Customer(
+        id=f"C-{txn}", email=f"{txn}@b.com", name=txn, created_at=datetime.now()
+    )
+    prod = Product(id="PROD-1", name="Curso")
+    sale = Sale(
+        transaction=txn,
+        status=status,
+        total_price=10.0,
+        currency="BRL",
+        customer_id=cust.id,
+        product_id=prod.id,
+    )
+    return cust, prod, sale
+
+
+def test_bulk_upsert_sales_single_transaction(mock_db):
+    """
+    Happy Path Test: A whole page is written in one transaction that the
+    caller commits (nothing is committed by the writer itself).
+    """
+    records = [_page_record(f"TX-{i}") for i in range(3)]
+
+    written = bulk_upsert_sales(mock_db, records, imported_at="2024-01-01 00:00:00")
+
+    assert written == 3
+    assert mock_db.in_transaction
+    mock_db.rollback()
+    assert mock_db.execute("SELECT count(*) FROM sales").fetchone()[0] == 0
+
+    bulk_upsert_sales(mock_db, records, imported_at="2024-01-01 00:00:00")
+    mock_db.commit()
+    assert mock_db.execute("SELECT count(*) FROM sales").fetchone()[0] == 3
+    assert mock_db.execute("SELECT count(*) FROM hotmart_customers").fetchone()[0] == 3
+    assert mock_db.execute("SELECT count(*) FROM products").fetchone()[0] == 1
+
+
+def test_bulk_upsert_sales_isolates_bad_item(mock_db):
+    """
+    Negative Test: A record violating NOT NULL (status) only skips itself;
+    its customer row is rolled back with it through the item SAVEPOINT.
+    """
+    records = [
+        _page_record("TX-OK-1"),
+        _page_record("TX-BAD", status=None),
+        _page_record("TX-OK-2"),
+    ]
+
+    written = bulk_upsert_sales(mock_db, records)
+    mock_db.commit()
+
+    assert written == 2
+    txns = {
+        r[0] for r in mock_db.execute("SELECT transaction_id FROM sales").fetchall()
+    }
+    assert txns == {"TX-OK-1", "TX-OK-2"}
+    cur = mock_db.execute(
+        "SELECT count(*) FROM hotmart_customers WHERE id = 'C-TX-BAD'"
+    )
+    assert cur.fetchone()[0] == 0
+
+
+def test_upsert_sale_idempotent_by_transaction(mock_db):
+    """
+    Idempotency Test: Re-importing the same transaction keeps a single row.
+    A status change updates it and bumps imported_at; an identical re-import
+    leaves imported_at untouched.
+    """
+    sale = Sale(
+        transaction="TXN-1",
+        status="APPROVED",
+        total_price=50.0,
+        currency="BRL",
+        customer_id="C1",
+        product_id="P1",
+    )
+    upsert_sale(mock_db, sale, imported_at="2024-01-01 00:00:00")
+    upsert_sale(mock_db, sale, imported_at="2024-01-02 00:00:00")
+
+    rows = mock_db.execute("SELECT status, imported_at FROM sales").fetchall()
+    assert len(rows) == 1
+    assert rows[0]["imported_at"] == "2024-01-01 00:00:00"
+
+    refunded = sale.model_copy(update={"status": "REFUNDED"})
+    upsert_sale(mock_db, refunded, imported_at="2024-01-03 00:00:00")
+
+    rows = mock_db.execute("SELECT status, imported_at FROM sales").fetchall()
+    assert len(rows) == 1
+    assert rows[0]["status"] == "REFUNDED"
+    assert rows[0]["imported_at"] == "2024-01-03 00:00:00"
+
+
+def test_init_db_removes_duplicate_sales():
+    """
+    Migration Test: A legacy database with repeated transaction rows is
+    deduplicated (latest row wins) and gets the unique index.
+    """
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute("""
+        CREATE TABLE sales (
+            transaction_id TEXT, status TEXT NOT NULL, total_price REAL NOT NULL,
+            currency TEXT NOT NULL, payment_method TEXT, payment_type TEXT,
+            installments INTEGER, approved_date INTEGER, order_date INTEGER,
+            purchased_at TIMESTAMP, updated_at TIMESTAMP,
+            customer_id TEXT NOT NULL, product_id TEXT NOT NULL,
+            imported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    for status in ("WAITING_PAYMENT", "APPROVED", "REFUNDED"):
+        conn.execute(
+            "INSERT INTO sales (transaction_id, status, total_price, currency, customer_id, product_id) "
+            "VALUES ('DUP', ?, 10, 'BRL', 'C1', 'P1')",
+            (status,),
+        )
+    conn.execute(
+        "INSERT INTO sales (transaction_id, status, total_price, currency, customer_id, product_id) "
+        "VALUES ('SOLO', 'APPROVED', 10, 'BRL', 'C2', 'P1')"
+    )
+
+    init_db(conn)
+
+    rows = conn.execute(
+        "SELECT transaction_id, status FROM sales ORDER BY transaction_id"
+    ).fetchall()
+    assert [(r[0], r[1]) for r in rows] == [("DUP", "REFUNDED"), ("SOLO", "APPROVED")]
+
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute(
+            "INSERT INTO sales (transaction_id, status, total_price, currency, customer_id, product_id) "
+            "VALUES ('SOLO', 'APPROVED', 10, 'BRL', 'C2', 'P1')"
+        )
+    conn.close()
+
+
+def test_init_db_builds_current_state_for_legacy_customers():
+    """
+    Migration Test: A legacy append-only hotmart_customers gets attribute
+    hashes and a current-state row per id (latest version), so re-importing
+    that same version appends nothing.
+    """
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute("""
+        CREATE TABLE hotmart_customers (
+            row_id INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT,
+            email TEXT NOT NULL, name TEXT NOT NULL, phone TEXT, document TEXT,
+            zip_code TEXT, address TEXT, number TEXT, neighborhood TEXT,
+            city TEXT, state TEXT, country TEXT,
+            created_at TIMESTAMP NOT NULL, updated_at TIMESTAMP,
+            imported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO hotmart_customers (id, email, name, created_at, imported_at) "
+        "VALUES ('L1', ?, 'Legacy', '2024-01-01', ?)",
+        [
+            ("new@test.com", "2024-02-01 00:00:00"),
+            ("old@test.com", "2024-01-01 00:00:00"),
+        ],
+    )
+
+    init_db(conn)
+
+    current = conn.execute(
+        "SELECT c.row_id, h.email FROM hotmart_customers_current c "
+        "JOIN hotmart_customers h ON h.row_id = c.row_id"
+    ).fetchall()
+    assert [tuple(r) for r in current] == [(1, "new@test.com")]
+
+    upsert_customer(
+        conn,
+        Customer(
+            id="L1", email="new@test.com", name="Legacy", created_at=datetime.now()
+        ),
+    )
+    assert conn.execute("SELECT count(*) FROM hotmart_customers").fetchone()[0] == 2
+    conn.close()
+
+
+def test_init_db_keys_and_dedupes_legacy_manychat_rows():
+    """
+    Migration Test: Legacy manychat_contacts rows get a natural key; rows
+    re-imported from the same export collapse to the most recent one.
+    """
+    conn = sqlite3.connect(":memory:")
+    conn.execute("""
+        CREATE TABLE manychat_contacts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, nome TEXT, email TEXT,
+            instagram TEXT, whatsapp TEXT, data_remarketing TEXT,
+            agendamento TEXT, data_agendamento TEXT, contactar TEXT,
+            data_contactar TEXT, ultima_interacao TEXT, data_registro TEXT,
+            imported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO manychat_contacts (nome, email, whatsapp, data_registro) VALUES (?, ?, ?, ?)",
+        [
+            ("First", "a@test.com", "5511", "2024-01-01T00:00:00"),
+            ("Again", "a@test.com", "5511", "2024-01-01T00:00:00"),
+            ("Other", None, "5522", None),
+        ],
+    )
+
+    init_db(conn)
+
+    rows = conn.execute(
+        "SELECT nome, natural_key FROM manychat_contacts ORDER BY id"
+    ).fetchall()
+    assert [tuple(r) for r in rows] == [
+        ("Again", "5511|a@test.com|2024-01-01T00:00:00"),
+        ("Other", "5522||"),
+    ]
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute(
+            "INSERT INTO manychat_contacts (nome, natural_key) VALUES ('Dup', '5522||')"
+        )
+    conn.close()
+
+
+def test_connection_profiles_wal_and_read_only(tmp_path):
+    """
+    Concurrency Test: The writer profile turns on WAL with tuned pragmas; a
+    read-only connection keeps reading the last committed snapshot while a
+    write transaction is open, and refuses to write.
+    """
+    db_path = str(tmp_path / "crm.sqlite")
+    writer = get_connection(db_path)
+    init_db(writer)
+
+    assert writer.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert writer.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    assert writer.execute("PRAGMA busy_timeout").fetchone()[0] > 0
+    assert writer.execute("PRAGMA temp_store").fetchone()[0] == 2  # MEMORY
+
+    upsert_product(writer, Product(id="P1", name="Committed"))
+    writer.commit()
+
+    reader = get_read_connection(db_path)
+    # Writer holds an open transaction with an uncommitted change
+    upsert_product(writer, Product(id="P2", name="Pending"))
+
+    names = [r["name"] for r in reader.execute("SELECT name FROM products")]
+    assert names == ["Committed"]
+
+    with pytest.raises(sqlite3.OperationalError):
+        reader.execute("DELETE FROM products")
+
+    writer.commit()
+    assert reader.execute("SELECT count(*) FROM products").fetchone()[0] == 2
+    reader.close()
+    writer.close()
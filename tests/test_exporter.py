@@ -0,0 +1,108 @@
+import csv
+import gzip
+import os
+import pytest
+from src.db.database import get_connection, init_db
+from src.logic.exporter import iter_cursor, write_csv_export
+
+# =====================================================================
+# Objetivo: O exportador grava CSVs em streaming (fetchmany em chunks),
+# opcionalmente gzip, e não reescreve um export cujo conteúdo não mudou
+# desde o anterior (digest SHA-256 guardado ao lado dos arquivos).
+# =====================================================================
+
+HEADER = ["name", "email", "value"]
+
+
+@pytest.fixture
+def db_conn():
+    conn = get_connection(":memory:")
+    init_db(conn)
+    conn.execute("CREATE TEMP TABLE t (name TEXT, email TEXT, value REAL)")
+    conn.executemany(
+        "INSERT INTO t VALUES (?, ?, ?)",
+        [(f"N{i}", f"e{i}@test.com", float(i)) for i in range(25)],
+    )
+    yield conn
+    conn.close()
+
+
+def _read(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+
+def test_iter_cursor_uses_fetchmany_chunks(db_conn):
+    """
+    Happy Path Test: The cursor is drained with fetchmany(chunk_size), never
+    fetchall, and every row comes out in order.
+    """
+    calls = []
+
+    class Spy:
+        def __init__(self, cur):
+            self.cur = cur
+
+        def fetchmany(self, size):
+            calls.append(size)
+            return self.cur.fetchmany(size)
+
+    rows = list(iter_cursor(Spy(db_conn.execute("SELECT * FROM t")), 10))
+    assert len(rows) == 25 and rows[0]["name"] == "N0"
+    assert calls == [10, 10, 10, 10]
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_export_skips_unchanged_content(db_conn, tmp_path, compress):
+    """
+    Decision Test: The first export writes the file; the same content on a
+    later day is skipped (path None); changed content is written again.
+    """
+    out = str(tmp_path)
+
+    def export(date_str):
+        cur = db_conn.execute("SELECT * FROM t ORDER BY value")
+        return write_csv_export(
+            iter_cursor(cur, 7),
+            HEADER,
+            out,
+            "publico_x",
+            chunk_size=7,
+            compress=compress,
+            date_str=date_str,
+        )
+
+    path, count = export("2026-01-01")
+    assert count == 25
+    assert path.endswith(".csv.gz" if compress else ".csv")
+    rows = _read(path)
+    assert rows[0] == HEADER and len(rows) == 26
+    assert rows[1] == ["N0", "e0@test.com", "0.0"]
+
+    assert export("2026-01-02") == (None, 25)
+    assert not any(".tmp" in f or "2026-01-02" in f for f in os.listdir(out))
+
+    db_conn.execute("UPDATE t SET value = 99 WHERE name = 'N3'")
+    path, _ = export("2026-01-03")
+    assert path is not None and "2026-01-03" in path
+
+
+def test_export_failure_keeps_previous_state(tmp_path):
+    """
+    Boundary Test: An error while streaming leaves no partial file and keeps
+    the previous digest, so the next run still exports.
+    """
+    out = str(tmp_path)
+    write_csv_export([["a", "b", 1]], HEADER, out, "x", date_str="d1")
+
+    def broken():
+        yield ["a", "b", 1]
+        raise RuntimeError("cursor lost")
+
+    with pytest.raises(RuntimeError):
+        write_csv_export(broken(), HEADER, out, "x", date_str="d2")
+    assert sorted(os.listdir(out)) == ["x.sha256", "x_d1.csv"]
+
+    path, _ = write_csv_export([["a", "b", 2]], HEADER, out, "x", date_str="d2")
+    assert path is not None
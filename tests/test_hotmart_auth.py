@@ -2,6 +2,8 @@ import pytest
 import responses
 import os
 import base64
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
 from src.hotmart.auth import HotmartAuth
 
 
@@ -84,3 +86,79 @@ def test_hotmart_auth_get_access_token(mock_env):
     token2 = auth.get_access_token()
     assert token2 == "mocked_hotmart_access_token"
     assert len(responses.calls) == 1  # Verify it only made one HTTP request
+
+
+@responses.activate
+def test_hotmart_auth_refreshes_before_expiry(mock_env):
+    """
+    Boundary Test: The cached token is reused while it is fresh and refreshed
+    once it enters the REFRESH_MARGIN_SECONDS window before expires_in.
+    """
+    auth = HotmartAuth()
+    url = f"{auth.AUTH_URL}?grant_type=client_credentials"
+    responses.add(responses.POST, url, json={"access_token": "t1", "expires_in": 3600})
+    responses.add(responses.POST, url, json={"access_token": "t2", "expires_in": 3600})
+
+    with patch("src.hotmart.auth.time.time", return_value=1000.0):
+        assert auth.get_access_token() == "t1"
+
+    # Still outside the refresh margin: no new request
+    fresh_until = 1000.0 + 3600 - auth.REFRESH_MARGIN_SECONDS
+    with patch("src.hotmart.auth.time.time", return_value=fresh_until - 1):
+        assert auth.get_access_token() == "t1"
+    assert len(responses.calls) == 1
+
+    # Inside the margin: proactive refresh
+    with patch("src.hotmart.auth.time.time", return_value=fresh_until):
+        assert auth.get_access_token() == "t2"
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_hotmart_auth_single_flight_refresh(mock_env):
+    """
+    Concurrency Test: Many workers asking for a token at once trigger a single
+    call to the auth endpoint, and invalidating a stale token is idempotent.
+    """
+    auth = HotmartAuth()
+    url = f"{auth.AUTH_URL}?grant_type=client_credentials"
+    responses.add(responses.POST, url, json={"access_token": "t1", "expires_in": 3600})
+    responses.add(responses.POST, url, json={"access_token": "t2", "expires_in": 3600})
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        tokens = list(executor.map(lambda _: auth.get_access_token(), range(16)))
+    assert set(tokens) == {"t1"}
+    assert len(responses.calls) == 1
+
+    # Every worker saw a 401 with t1; only the first invalidation counts
+    for _ in range(5):
+        auth.invalidate("t1")
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        tokens = list(executor.map(lambda _: auth.get_access_token(), range(16)))
+    assert set(tokens) == {"t2"}
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_hotmart_auth_token_cache_file(mock_env, tmp_path):
+    """
+    State Test: A token persisted by one instance is reused by a new instance
+    (scheduler restart) without another auth round trip.
+    """
+    cache_file = tmp_path / "token.json"
+    url = f"{HotmartAuth.AUTH_URL}?grant_type=client_credentials"
+    responses.add(
+        responses.POST, url, json={"access_token": "cached", "expires_in": 3600}
+    )
+
+    first = HotmartAuth(token_cache_path=str(cache_file))
+    assert first.get_access_token() == "cached"
+    assert cache_file.exists()
+
+    restarted = HotmartAuth(token_cache_path=str(cache_file))
+    assert restarted.get_access_token() == "cached"
+    assert len(responses.calls) == 1
+
+    # A token rejected by the API is also dropped from the cache file
+    restarted.invalidate("cached")
+    assert not cache_file.exists()
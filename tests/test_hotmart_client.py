@@ -1,4 +1,5 @@
 import pytest
+import requests
 import responses
 import os
 from unittest.mock import patch
@@ -74,3 +75,55 @@ def test_hotmart_client_post_method(mock_request, mock_env):
 
     mock_request.assert_called_once_with("POST", "another/endpoint", json={"data": 123})
     assert result == {"created": True}
+
+
+@responses.activate
+def test_hotmart_client_retries_once_after_401(mock_env):
+    """
+    Recovery Test: A 401 invalidates the token, re-authenticates and retries
+    the request once, transparently for the caller.
+    """
+    auth_url = "https://api-sec-vlc.hotmart.com/security/oauth/token?grant_type=client_credentials"
+    responses.add(
+        responses.POST, auth_url, json={"access_token": "old", "expires_in": 3600}
+    )
+    responses.add(
+        responses.POST, auth_url, json={"access_token": "new", "expires_in": 3600}
+    )
+
+    client = HotmartClient()
+    api_url = f"{client.BASE_URL}/sales/history"
+    responses.add(
+        responses.GET,
+        api_url,
+        match=[responses.matchers.header_matcher({"Authorization": "Bearer old"})],
+        status=401,
+    )
+    responses.add(
+        responses.GET,
+        api_url,
+        match=[responses.matchers.header_matcher({"Authorization": "Bearer new"})],
+        json={"items": []},
+        status=200,
+    )
+
+    assert client.get("sales/history") == {"items": []}
+    assert client.auth._access_token == "new"
+
+
+@responses.activate
+def test_hotmart_client_401_twice_raises(mock_env):
+    """
+    Negative Test: The 401 retry happens only once; a second 401 is raised.
+    """
+    auth_url = "https://api-sec-vlc.hotmart.com/security/oauth/token?grant_type=client_credentials"
+    responses.add(responses.POST, auth_url, json={"access_token": "t"})
+
+    client = HotmartClient()
+    responses.add(responses.GET, f"{client.BASE_URL}/sales/history", status=401)
+
+    with pytest.raises(requests.HTTPError):
+        client.get("sales/history")
+
+    api_calls = [c for c in responses.calls if "sales/history" in c.request.url]
+    assert len(api_calls) == 2
@@ -0,0 +1,221 @@
+import json
+import threading
+import pytest
+import requests
+from http.server import BaseHTTPRequestHandler
+from unittest.mock import MagicMock
+from src.hotmart.auth import HotmartAuth
+from src.hotmart.client import HotmartClient
+from src.hotmart.rate_limit import RequestScheduler, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _throttling_handler(throttle_first: int, status: int = 429, headers=None):
+    """
+    Builds a stub Hotmart handler that answers the first `throttle_first` API
+    calls with `status` (plus `headers`) and then succeeds.
+    """
+
+    class ThrottlingHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        lock = threading.Lock()
+        api_calls = 0
+
+        def _send(self, code: int, payload: dict, extra_headers=None):
+            body = json.dumps(payload).encode()
+            self.send_response(code)
+            for key, value in (extra_headers or {}).items():
+                self.send_header(key, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            self._send(200, {"access_token": "stub_token", "expires_in": 3600})
+
+        def do_GET(self):
+            with self.lock:
+                type(self).api_calls += 1
+                call_number = type(self).api_calls
+            if call_number <= throttle_first:
+                self._send(status, {"error": "throttled"}, headers)
+            else:
+                self._send(200, {"items": [], "call": call_number})
+
+        def log_message(self, *args):
+            pass
+
+    return ThrottlingHandler
+
+
+def _make_client(base_url: str, scheduler: RequestScheduler) -> HotmartClient:
+    auth = HotmartAuth(client_id="id", client_secret="secret")
+    auth.AUTH_URL = f"{base_url}/security/oauth/token"
+    client = HotmartClient(auth=auth, scheduler=scheduler)
+    client.BASE_URL = base_url
+    return client
+
+
+# =====================================================================
+# UNIT TESTS: TokenBucket / RequestScheduler
+# =====================================================================
+
+
+def test_token_bucket_allows_burst_then_paces():
+    """
+    Boundary Test: A bucket with rate=2/s and capacity=2 lets two requests
+    through immediately and delays the third by half a second.
+    """
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=2, clock=clock, sleep=clock.sleep)
+
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == pytest.approx(0.5)
+
+
+def test_token_bucket_unlimited_still_honors_pause():
+    """
+    Decision Test: rate=0 never throttles on its own, but a server pause holds it.
+    """
+    clock = FakeClock()
+    bucket = TokenBucket(rate=0, clock=clock, sleep=clock.sleep)
+
+    for _ in range(100):
+        assert bucket.acquire() == 0
+
+    bucket.pause_for(3)
+    assert bucket.acquire() == pytest.approx(3)
+
+
+def test_scheduler_per_endpoint_budget():
+    """
+    Decision Test: The endpoint budget only applies to its own endpoint.
+    """
+    clock = FakeClock()
+    scheduler = RequestScheduler(
+        rate=0,
+        endpoint_rates={"sales/users": 1},
+        clock=clock,
+        sleep=clock.sleep,
+    )
+
+    scheduler.acquire("/sales/users")
+    scheduler.acquire("/sales/users")
+    assert clock.sleeps == [pytest.approx(1.0)]
+
+    scheduler.acquire("/sales/history")
+    scheduler.acquire("/sales/history")
+    assert len(clock.sleeps) == 1
+
+
+@pytest.mark.parametrize(
+    "headers, expected",
+    [
+        ({"Retry-After": "7"}, 7.0),  # delta-seconds
+        ({"X-RateLimit-Reset": "4"}, 4.0),  # seconds until reset
+        ({"Retry-After": "2", "X-RateLimit-Reset": "9"}, 2.0),  # Retry-After wins
+    ],
+)
+def test_scheduler_honors_rate_limit_headers(headers, expected):
+    """
+    MC/DC Test: A 429 is delayed by the server-provided time when present.
+    """
+    clock = FakeClock()
+    scheduler = RequestScheduler(rate=0, clock=clock, sleep=clock.sleep)
+    response = MagicMock(status_code=429, headers=headers)
+
+    assert scheduler.wait_before_retry("sales/history", 0, response) == expected
+    scheduler.acquire("sales/history")
+    assert clock.sleeps == [pytest.approx(expected)]
+
+
+def test_scheduler_backoff_is_jittered_and_capped():
+    """
+    Property Test: Without headers the delay is within [0, min(max, base * 2^n)].
+    """
+    scheduler = RequestScheduler(backoff_base=0.5, backoff_max=4.0)
+    for attempt in range(8):
+        for _ in range(20):
+            delay = scheduler.backoff_delay(attempt)
+            assert 0 <= delay <= min(4.0, 0.5 * 2**attempt)
+
+
+def test_scheduler_pauses_when_quota_exhausted():
+    """
+    State Test: X-RateLimit-Remaining: 0 holds the next request until the reset.
+    """
+    clock = FakeClock()
+    scheduler = RequestScheduler(rate=0, clock=clock, sleep=clock.sleep)
+    response = MagicMock(
+        status_code=200,
+        headers={"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "5"},
+    )
+
+    scheduler.observe("sales/history", response)
+    scheduler.acquire("sales/history")
+    assert clock.sleeps == [pytest.approx(5.0)]
+
+
+# =====================================================================
+# INTEGRATION TESTS: local stub server emulating Hotmart throttling
+# =====================================================================
+
+
+def test_client_recovers_from_throttling(stub_server):
+    """
+    Integration Test: Two 429 answers with Retry-After are waited out and the
+    third attempt returns the page instead of raising.
+    """
+    base_url = stub_server(_throttling_handler(2, headers={"Retry-After": "1"}))
+    sleeps = []
+    scheduler = RequestScheduler(rate=0, max_retries=3, sleep=sleeps.append)
+    client = _make_client(base_url, scheduler)
+
+    result = client.get("/sales/history")
+
+    assert result["call"] == 3
+    assert len(sleeps) == 2
+    assert all(s == pytest.approx(1.0, abs=0.1) for s in sleeps)
+
+
+def test_client_backs_off_on_server_errors(stub_server):
+    """
+    Integration Test: 503 without headers uses jittered exponential backoff.
+    """
+    base_url = stub_server(_throttling_handler(2, status=503))
+    sleeps = []
+    scheduler = RequestScheduler(
+        rate=0, max_retries=3, backoff_base=0.1, sleep=sleeps.append
+    )
+    client = _make_client(base_url, scheduler)
+
+    assert client.get("/sales/history")["call"] == 3
+    assert len(sleeps) == 2
+    assert 0 <= sleeps[0] <= 0.1
+    assert 0 <= sleeps[1] <= 0.2
+
+
+def test_client_gives_up_after_max_retries(stub_server):
+    """
+    Negative Test: A server that keeps throttling raises after max_retries.
+    """
+    base_url = stub_server(_throttling_handler(100, headers={"Retry-After": "0"}))
+    scheduler = RequestScheduler(rate=0, max_retries=2, sleep=lambda s: None)
+    client = _make_client(base_url, scheduler)
+
+    with pytest.raises(requests.HTTPError):
+        client.get("/sales/history")
@@ -1,8 +1,9 @@
 import pytest
 import os
 import responses
+from unittest.mock import MagicMock
 from pydantic import ValidationError
-from src.hotmart.sales import get_sales_history
+from src.hotmart.sales import ResponseCache, get_sale_users, get_sales_history
 
 
 @pytest.fixture
@@ -86,3 +87,77 @@ def test_sales_history_success_contract(mock_env):
     request = responses.calls[1].request
     assert "start_date=1672531200000" in request.url
     assert "end_date=1704067199000" in request.url
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_response_cache_ttl_and_status_invalidation(tmp_path):
+    """
+    MC/DC Test: A cached enrichment is reused only when the entry exists (A),
+    is younger than the TTL (B) and was fetched under the same sale status (C).
+    Truth Table:
+    A     | B     | C     | Output
+    --------------------------------
+    False | -     | -     | API call (miss)
+    True  | True  | True  | Cached payload (hit)
+    True  | True  | False | API call (invalidated)
+    True  | False | True  | API call (expired)
+    """
+    clock = FakeClock()
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), ttl_seconds=60, clock=clock)
+    client = MagicMock()
+    client.get.return_value = {"users": [{"role": "BUYER"}]}
+
+    # A = False
+    get_sale_users("T1", client=client, cache=cache, status="APPROVED")
+    assert client.get.call_count == 1
+
+    # A, B, C = True
+    assert get_sale_users("T1", client=client, cache=cache, status="APPROVED") == {
+        "users": [{"role": "BUYER"}]
+    }
+    assert client.get.call_count == 1
+
+    # C = False: status moved on, refetch and re-key under the new status
+    get_sale_users("T1", client=client, cache=cache, status="REFUNDED")
+    assert client.get.call_count == 2
+
+    # B = False
+    clock.now += 61
+    get_sale_users("T1", client=client, cache=cache, status="REFUNDED")
+    assert client.get.call_count == 3
+
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 3
+    assert stats["invalidated"] == 1 and stats["expired"] == 1
+    assert stats["hit_rate"] == 0.25
+    cache.close()
+
+    # Persistent: a new process sees the last fetched entry
+    reopened = ResponseCache(
+        str(tmp_path / "cache.sqlite"), ttl_seconds=60, clock=clock
+    )
+    get_sale_users("T1", client=client, cache=reopened, status="REFUNDED")
+    assert client.get.call_count == 3
+    reopened.close()
+
+
+def test_response_cache_commits_without_fsync(tmp_path):
+    """
+    Concurrency Test: The cache database runs in WAL with synchronous=NORMAL,
+    so a put (one commit per miss) does not fsync and block the other
+    enrichment threads.
+    """
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), ttl_seconds=60)
+    assert cache._conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    # 1 = NORMAL
+    assert cache._conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+    cache.put("/sales/users", "T1", {"users": []}, "APPROVED")
+    assert cache.get("/sales/users", "T1", "APPROVED") == {"users": []}
+    cache.close()
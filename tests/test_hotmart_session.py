@@ -0,0 +1,64 @@
+import json
+from http.server import BaseHTTPRequestHandler
+from src.hotmart.auth import HotmartAuth
+from src.hotmart.client import HotmartClient
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """Minimal Hotmart stub speaking HTTP/1.1 so connections stay open."""
+
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self._send_json({"access_token": "stub_token", "expires_in": 3600})
+
+    def do_GET(self):
+        self._send_json({"path": self.path})
+
+    def log_message(self, *args):
+        pass
+
+
+def _make_client(base_url: str, pool_size: int = 2) -> HotmartClient:
+    auth = HotmartAuth(client_id="id", client_secret="secret")
+    auth.AUTH_URL = f"{base_url}/security/oauth/token"
+    client = HotmartClient(auth=auth, pool_size=pool_size)
+    client.BASE_URL = base_url
+    return client
+
+
+def test_client_shares_session_with_auth():
+    """
+    State Test: The client hands its pooled session to the auth object it creates
+    (or receives without a session), so the token call reuses the same pool.
+    """
+    auth = HotmartAuth(client_id="id", client_secret="secret")
+    client = HotmartClient(auth=auth)
+    assert auth.session is client.session
+
+
+def test_client_reuses_keep_alive_connection(stub_server):
+    """
+    Integration Test (local stub): Auth + 3 API calls travel over a single
+    TCP connection. The counters prove the handshake only happens once.
+    """
+    base_url = stub_server(KeepAliveHandler)
+    client = _make_client(base_url)
+
+    for i in range(3):
+        assert client.get(f"/sales/users?transaction=TX{i}") == {
+            "path": f"/sales/users?transaction=TX{i}"
+        }
+
+    stats = client.connection_stats()
+    assert stats["requests"] == 4
+    assert stats["connections_opened"] == 1
+    assert stats["connections_reused"] == 3
@@ -1,8 +1,16 @@
+import os
+import pytest
+import pandas as pd
 from unittest.mock import patch, MagicMock
 from hypothesis import given, strategies as st
+from src.db.database import get_connection, init_db, consolidate_changes_to_master
 from src.pipelines.manychat_csv_importer import (
     excel_date_to_datetime,
+    excel_dates_to_iso,
+    _read_manychat_chunks,
+    _ingest_manychat_file,
     import_manychat_csv,
+    import_manychat_batch,
 )
 
 # =====================================================================
@@ -48,17 +56,62 @@ def test_excel_date_to_datetime_valid_comma():
     assert result.startswith("2026-02-04")
 
 
+@given(
+    st.lists(
+        st.one_of(
+            st.floats(min_value=-700000, max_value=3000000).map(str),
+            st.floats(min_value=0, max_value=100000).map(
+                lambda v: str(v).replace(".", ",")
+            ),
+            st.sampled_from(["", "abc", "nan", "inf", "1e5", "46057,56185"]),
+        ),
+        max_size=20,
+    )
+)
+def test_excel_dates_to_iso_matches_scalar_property(values):
+    """
+    Property-Based Test: The vectorized column conversion returns exactly what
+    excel_date_to_datetime() returns for each value (microseconds included).
+    """
+    with patch("builtins.print"):
+        expected = [excel_date_to_datetime(v) for v in values]
+    assert excel_dates_to_iso(pd.Series(values, dtype=object)).tolist() == expected
+
+
+def test_read_manychat_chunks_streams_clean_rows(tmp_path):
+    """
+    Boundary Test: A 5-row export read with chunk_size=2 comes back as 2+2+1
+    rows, stripped, flags upper-cased, dates converted and missing columns ''.
+    """
+    path = tmp_path / "export.csv"
+    lines = ["nome\twhatsapp\tagendamento\tdata_registro"]
+    lines += [f" User {i} \t 551100000000{i} \tsim\t46057,5" for i in range(5)]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    chunks = list(_read_manychat_chunks(str(path), chunk_size=2))
+
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    first = chunks[0].iloc[0]
+    assert first["nome"] == "User 0"
+    assert first["whatsapp"] == "5511000000000"
+    assert first["agendamento"] == "SIM"
+    assert first["data_registro"] == "2026-02-04T12:00:00"
+    assert first["email"] == ""
+    assert first["data_remarketing"] == ""
+
+
 # =====================================================================
 # INTEGRATION & MOCK TESTS (MC/DC logic)
 # =====================================================================
 
 
+@patch("src.pipelines.manychat_csv_importer._file_sha256", return_value="file-hash")
+@patch("src.pipelines.manychat_csv_importer.init_db")
 @patch("src.pipelines.manychat_csv_importer.get_connection")
-@patch("builtins.open")
-@patch("src.pipelines.manychat_csv_importer.csv.DictReader")
-@patch("src.pipelines.manychat_csv_importer.consolidate_all_to_master")
+@patch("src.pipelines.manychat_csv_importer.pd.read_csv")
+@patch("src.pipelines.manychat_csv_importer.consolidate_changes_to_master")
 def test_import_manychat_csv_skips_empty_contacts(
-    mock_consolidate, mock_csv_reader, mock_open, mock_get_conn
+    mock_consolidate, mock_read_csv, mock_get_conn, mock_init_db, mock_hash
 ):
     """
     Happy Path / Decision Test: Rows without both email AND whatsapp are stored
@@ -69,32 +122,41 @@ def test_import_manychat_csv_skips_empty_contacts(
     mock_cur = MagicMock()
     mock_get_conn.return_value = mock_conn
     mock_conn.cursor.return_value = mock_cur
+    mock_cur.rowcount = 1
+    # File not in the import ledger yet
+    mock_conn.execute.return_value.fetchone.return_value = None
 
-    mock_reader_instance = MagicMock()
-    mock_reader_instance.__iter__.return_value = [
-        {
-            "nome": "No Contact Info",
-            "email": "",
-            "whatsapp": "",
-            "instagram": "insta_ghost",
-        }
-    ]
-    mock_csv_reader.return_value = mock_reader_instance
+    # read_csv(chunksize=...) is used as a context manager yielding chunks
+    mock_read_csv.return_value.__enter__.return_value = iter(
+        [
+            pd.DataFrame(
+                [
+                    {
+                        "nome": "No Contact Info",
+                        "email": "",
+                        "whatsapp": "",
+                        "instagram": "insta_ghost",
+                    }
+                ]
+            )
+        ]
+    )
 
     import_manychat_csv("dummy_path.csv")
 
     # Raw insert should happen regardless
-    mock_cur.execute.assert_called()
+    mock_cur.executemany.assert_called()
     # Consolidation should be triggered
     mock_consolidate.assert_called_once_with(mock_conn)
 
 
+@patch("src.pipelines.manychat_csv_importer._file_sha256", return_value="file-hash")
+@patch("src.pipelines.manychat_csv_importer.init_db")
 @patch("src.pipelines.manychat_csv_importer.get_connection")
-@patch("builtins.open")
-@patch("src.pipelines.manychat_csv_importer.csv.DictReader")
-@patch("src.pipelines.manychat_csv_importer.consolidate_all_to_master")
+@patch("src.pipelines.manychat_csv_importer.pd.read_csv")
+@patch("src.pipelines.manychat_csv_importer.consolidate_changes_to_master")
 def test_import_manychat_csv_creates_new_master(
-    mock_consolidate, mock_csv_reader, mock_open, mock_get_conn
+    mock_consolidate, mock_read_csv, mock_get_conn, mock_init_db, mock_hash
 ):
     """
     Happy Path Test: Verifies that importer triggers consolidation after raw insert.
@@ -104,16 +166,24 @@ def test_import_manychat_csv_creates_new_master(
     mock_cur = MagicMock()
     mock_get_conn.return_value = mock_conn
     mock_conn.cursor.return_value = mock_cur
+    mock_cur.rowcount = 1
+    # File not in the import ledger yet
+    mock_conn.execute.return_value.fetchone.return_value = None
 
-    mock_reader_instance = MagicMock()
-    mock_reader_instance.__iter__.return_value = [
-        {
-            "nome": "Valid User",
-            "email": "test@test.com",
-            "whatsapp": "551199999",
-        }
-    ]
-    mock_csv_reader.return_value = mock_reader_instance
+    # read_csv(chunksize=...) is used as a context manager yielding chunks
+    mock_read_csv.return_value.__enter__.return_value = iter(
+        [
+            pd.DataFrame(
+                [
+                    {
+                        "nome": "Valid User",
+                        "email": "test@test.com",
+                        "whatsapp": "551199999",
+                    }
+                ]
+            )
+        ]
+    )
 
     import_manychat_csv("dummy_path.csv")
 
@@ -121,12 +191,13 @@ def test_import_manychat_csv_creates_new_master(
     mock_consolidate.assert_called_once_with(mock_conn)
 
 
+@patch("src.pipelines.manychat_csv_importer._file_sha256", return_value="file-hash")
+@patch("src.pipelines.manychat_csv_importer.init_db")
 @patch("src.pipelines.manychat_csv_importer.get_connection")
-@patch("builtins.open")
-@patch("src.pipelines.manychat_csv_importer.csv.DictReader")
-@patch("src.pipelines.manychat_csv_importer.consolidate_all_to_master")
+@patch("src.pipelines.manychat_csv_importer.pd.read_csv")
+@patch("src.pipelines.manychat_csv_importer.consolidate_changes_to_master")
 def test_import_manychat_csv_updates_existing_master(
-    mock_consolidate, mock_csv_reader, mock_open, mock_get_conn
+    mock_consolidate, mock_read_csv, mock_get_conn, mock_init_db, mock_hash
 ):
     """
     Happy Path Test: Verifies that importer triggers consolidation after raw insert.
@@ -136,16 +207,244 @@ def test_import_manychat_csv_updates_existing_master(
     mock_cur = MagicMock()
     mock_get_conn.return_value = mock_conn
     mock_conn.cursor.return_value = mock_cur
+    mock_cur.rowcount = 1
+    # File not in the import ledger yet
+    mock_conn.execute.return_value.fetchone.return_value = None
 
-    mock_reader_instance = MagicMock()
-    mock_reader_instance.__iter__.return_value = [
-        {
-            "nome": "Existing User",
-            "whatsapp": "551199999",
-        }
-    ]
-    mock_csv_reader.return_value = mock_reader_instance
+    # read_csv(chunksize=...) is used as a context manager yielding chunks
+    mock_read_csv.return_value.__enter__.return_value = iter(
+        [
+            pd.DataFrame(
+                [
+                    {
+                        "nome": "Existing User",
+                        "whatsapp": "551199999",
+                    }
+                ]
+            )
+        ]
+    )
 
     import_manychat_csv("dummy_path.csv")
 
     mock_consolidate.assert_called_once_with(mock_conn)
+
+
+# =====================================================================
+# BATCH IMPORT (real SQLite file)
+# =====================================================================
+
+
+def _write_csv(path, rows, trailer=b""):
+    lines = ["nome\temail\twhatsapp"] + ["\t".join(row) for row in rows]
+    path.write_bytes(("\n".join(lines) + "\n").encode("utf-8") + trailer)
+    return str(path)
+
+
+def test_import_manychat_batch_consolidates_once_and_keeps_failed_files(tmp_path):
+    """
+    Integration Test: Two good files and one that breaks mid-way.
+    Assertion: One consolidation for the whole batch; the bad file's
+    uncommitted chunk is rolled back and only the good files are deleted.
+    """
+    db_path = str(tmp_path / "crm.db")
+    conn = get_connection(db_path)
+    init_db(conn)
+    conn.close()
+
+    good_a = _write_csv(tmp_path / "a.csv", [("Ana", "ana@test.com", "5511000000001")])
+    good_b = _write_csv(tmp_path / "b.csv", [("Bia", "", "5511000000002")])
+    # Enough rows to be inserted before the decoder hits the invalid bytes
+    bad = _write_csv(
+        tmp_path / "c.csv",
+        [(f"Bad {i}", "", f"55119{i:08d}") for i in range(2000)],
+        trailer=b"\xff\xfe\tbroken\n",
+    )
+
+    with (
+        patch(
+            "src.pipelines.manychat_csv_importer.get_connection",
+            side_effect=lambda: get_connection(db_path),
+        ),
+        patch(
+            "src.pipelines.manychat_csv_importer.consolidate_changes_to_master",
+            wraps=consolidate_changes_to_master,
+        ) as mock_consolidate,
+    ):
+        results = import_manychat_batch([good_a, bad, good_b])
+
+    assert mock_consolidate.call_count == 1
+    assert results["imported"] == {good_a: 1, good_b: 1}
+    assert list(results["failed"]) == [bad]
+
+    assert not os.path.exists(good_a)
+    assert not os.path.exists(good_b)
+    assert os.path.exists(bad)
+
+    conn = get_connection(db_path)
+    raw = conn.execute("SELECT nome FROM manychat_contacts ORDER BY id").fetchall()
+    master = conn.execute("SELECT name FROM customers ORDER BY name").fetchall()
+    conn.close()
+    assert [row["nome"] for row in raw] == ["Ana", "Bia"]
+    assert [row["name"] for row in master] == ["Ana", "Bia"]
+
+
+@pytest.fixture
+def manychat_db():
+    conn = get_connection(":memory:")
+    init_db(conn)
+    yield conn
+    conn.close()
+
+
+def test_ingest_skips_same_file_and_overlapping_rows(manychat_db, tmp_path):
+    """
+    Decision Test: The same export dropped twice is skipped by content hash;
+    an overlapping export only inserts the rows not seen before.
+    """
+    rows = [("Ana", "", "5511000000001"), ("Bia", "", "5511000000002")]
+    first = _write_csv(tmp_path / "first.csv", rows)
+    assert _ingest_manychat_file(manychat_db, first) == 2
+    assert _ingest_manychat_file(manychat_db, first) == 0
+
+    overlap = _write_csv(
+        tmp_path / "overlap.csv", rows + [("Cris", "", "5511000000003")]
+    )
+    assert _ingest_manychat_file(manychat_db, overlap) == 1
+
+    names = manychat_db.execute("SELECT nome FROM manychat_contacts ORDER BY id")
+    assert [row["nome"] for row in names] == ["Ana", "Bia", "Cris"]
+
+
+def test_ingest_resumes_after_last_committed_chunk(manychat_db, tmp_path):
+    """
+    Recovery Test: The process dies after the first chunk of 2 rows.
+    Assertion: The restart reads the file from row 3 on and the ledger ends
+    DONE with every row counted once.
+    """
+    path = _write_csv(
+        tmp_path / "big.csv", [(f"User {i}", "", f"551100000000{i}") for i in range(5)]
+    )
+    real_reader = _read_manychat_chunks
+
+    def crash_after_first_chunk(file_path, skip_rows=0):
+        for chunk in real_reader(file_path, chunk_size=2, skip_rows=skip_rows):
+            yield chunk
+            raise RuntimeError("killed")
+
+    with patch(
+        "src.pipelines.manychat_csv_importer._read_manychat_chunks",
+        side_effect=crash_after_first_chunk,
+    ):
+        with pytest.raises(RuntimeError):
+            _ingest_manychat_file(manychat_db, path)
+
+    with patch(
+        "src.pipelines.manychat_csv_importer._read_manychat_chunks",
+        wraps=lambda file_path, skip_rows=0: real_reader(
+            file_path, chunk_size=2, skip_rows=skip_rows
+        ),
+    ) as mock_reader:
+        assert _ingest_manychat_file(manychat_db, path) == 3
+
+    mock_reader.assert_called_once_with(path, skip_rows=2)
+    ledger = manychat_db.execute("SELECT * FROM manychat_import_files").fetchone()
+    assert ledger["status"] == "DONE"
+    assert ledger["rows_committed"] == 5
+    assert ledger["rows_inserted"] == 5
+    count = manychat_db.execute("SELECT COUNT(*) FROM manychat_contacts").fetchone()
+    assert count[0] == 5
+
+
+def test_reexported_contact_updates_raw_and_master(manychat_db, tmp_path):
+    """
+    Regression Test: A contact exported again with a newer data_remarketing
+    refreshes its raw row (bumped past the watermark) and the delta
+    consolidation carries the new date to the master record.
+    """
+
+    def export(name, remarketing_serial):
+        path = tmp_path / name
+        path.write_text(
+            "nome\temail\twhatsapp\tdata_remarketing\n"
+            f"Ana\tana@test.com\t5511000000001\t{remarketing_serial}\n",
+            encoding="utf-8",
+        )
+        return str(path)
+
+    def master_remarketing():
+        row = manychat_db.execute(
+            "SELECT last_remarketing_at FROM customers WHERE master_phone = '5511000000001'"
+        ).fetchone()
+        return row[0]
+
+    assert _ingest_manychat_file(manychat_db, export("first.csv", "45658")) == 1
+    consolidate_changes_to_master(manychat_db)
+    first_date = master_remarketing()
+    assert first_date.startswith("2025-01-01")
+
+    assert _ingest_manychat_file(manychat_db, export("same.csv", "45658,0")) == 0
+    assert _ingest_manychat_file(manychat_db, export("newer.csv", "45700")) == 1
+    consolidate_changes_to_master(manychat_db)
+
+    assert (
+        manychat_db.execute("SELECT COUNT(*) FROM manychat_contacts").fetchone()[0] == 1
+    )
+    assert master_remarketing().startswith("2025-02-12")
+
+
+def test_reexport_keeps_master_manychat_id_valid(manychat_db, tmp_path):
+    """
+    Regression Test: Re-exporting a changed contact keeps its raw id, so
+    customers.manychat_id still points at an existing manychat_contacts row.
+    """
+
+    def export(name, ana_instagram):
+        path = tmp_path / name
+        path.write_text(
+            "nome\temail\tinstagram\twhatsapp\n"
+            f"Ana\tana@test.com\t{ana_instagram}\t5511000000001\n"
+            "Bob\tbob@test.com\t@bob\t5511000000002\n",
+            encoding="utf-8",
+        )
+        return str(path)
+
+    assert _ingest_manychat_file(manychat_db, export("first.csv", "@ana")) == 2
+    consolidate_changes_to_master(manychat_db)
+    assert _ingest_manychat_file(manychat_db, export("second.csv", "@ana.new")) == 1
+    consolidate_changes_to_master(manychat_db)
+
+    dangling = manychat_db.execute(
+        """
+        SELECT COUNT(*) FROM customers c
+        WHERE c.manychat_id IS NOT NULL
+        AND NOT EXISTS (SELECT 1 FROM manychat_contacts m WHERE m.id = c.manychat_id)
+        """
+    ).fetchone()[0]
+    assert dangling == 0
+    ana = manychat_db.execute(
+        "SELECT instagram FROM manychat_contacts WHERE whatsapp = '5511000000001'"
+    ).fetchone()
+    assert ana[0] == "@ana.new"
+
+
+def test_contacts_without_phone_or_email_do_not_collide(manychat_db, tmp_path):
+    """
+    Boundary Test: Two different contacts without phone and email, registered
+    at the same time, are kept apart (name/instagram join their natural key),
+    and exporting them again still does not duplicate them.
+    """
+    path = tmp_path / "anonymous.csv"
+    path.write_text(
+        "nome\tinstagram\tdata_registro\nAna\t@ana\t45658\nBob\t@bob\t45658\n",
+        encoding="utf-8",
+    )
+
+    assert _ingest_manychat_file(manychat_db, str(path)) == 2
+    path.write_text(path.read_text(encoding="utf-8") + "\n", encoding="utf-8")
+    assert _ingest_manychat_file(manychat_db, str(path)) == 0
+
+    names = manychat_db.execute(
+        "SELECT nome FROM manychat_contacts ORDER BY nome"
+    ).fetchall()
+    assert [row[0] for row in names] == ["Ana", "Bob"]
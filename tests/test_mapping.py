@@ -1,13 +1,22 @@
 import pytest
+from dataclasses import asdict
 from unittest.mock import patch, MagicMock
 from datetime import datetime
 from hypothesis import given, strategies as st
-from src.pipelines.hotmart_to_db import (
+from src.pipelines.sales_pages import (
     _parse_hotmart_date,
     _resolve_buyer_id,
     _extract_sale_models,
 )
-from src.models.schemas import Customer, Product, Sale
+from src.db.database import _customer_params, _product_params, _sale_params
+from src.models.schemas import (
+    Customer,
+    CustomerRecord,
+    Product,
+    ProductRecord,
+    Sale,
+    SaleRecord,
+)
 
 
 # 1. Boundary Testing: _parse_hotmart_date
@@ -60,8 +69,8 @@ def test_resolve_buyer_id_mcdc(buyer_data, txn_id, expected):
         ),
     )
 )
-@patch("src.pipelines.hotmart_to_db.get_sale_price_details")
-@patch("src.pipelines.hotmart_to_db.get_sale_users")
+@patch("src.pipelines.sales_pages.get_sale_price_details")
+@patch("src.pipelines.sales_pages.get_sale_users")
 def test_extract_sale_models_no_crash_property(mock_get_users, mock_get_price, item):
     """
     Property-Based Testing:
@@ -82,8 +91,8 @@ def test_extract_sale_models_no_crash_property(mock_get_users, mock_get_price, i
 
 
 # 4. Functional / Happy Path (Regressão)
-@patch("src.pipelines.hotmart_to_db.get_sale_price_details")
-@patch("src.pipelines.hotmart_to_db.get_sale_users")
+@patch("src.pipelines.sales_pages.get_sale_price_details")
+@patch("src.pipelines.sales_pages.get_sale_users")
 def test_extract_sale_models_happy_path(mock_get_users, mock_get_price):
     """
     Regressão: Verifica se o mapeamento básico continua funcionando após a refatoração.
@@ -108,3 +117,40 @@ def test_extract_sale_models_happy_path(mock_get_users, mock_get_price):
     assert product.name == "Test Prod"
     assert sale.transaction == "TX123"
     assert sale.status == "APPROVED"
+
+
+# 5. Fast path: slots records carry the same values as the Pydantic models
+def test_extract_sale_records_match_models():
+    """
+    Regressão: strict=False builds CustomerRecord/ProductRecord/SaleRecord with
+    exactly the values of the validated models, and they bind to the same
+    SQL parameters.
+    """
+    item = {
+        "purchase": {
+            "transaction": "TX9",
+            "status": "approved",
+            "price": {"value": 97},
+            "order_date": 1704067200000,
+            "approved_date": 1704067300000,
+            "payment": {"type": "PIX"},
+        },
+        "buyer": {"ucode": "U9", "email": "fast@test.com", "phone": 5511999},
+        "product": {"id": 7, "name": "Prod"},
+    }
+    enrichment = (
+        {"address": {"city": "Recife", "state": "PE"}},
+        {"payment": {"type": "PIX", "installments_number": 1}},
+    )
+
+    models = _extract_sale_models(item, MagicMock(), enrichment, strict=True)
+    records = _extract_sale_models(item, MagicMock(), enrichment, strict=False)
+
+    assert [type(r) for r in records] == [CustomerRecord, ProductRecord, SaleRecord]
+    assert not hasattr(records[2], "__dict__")
+    for model, record in zip(models, records):
+        assert model.model_dump() == asdict(record)
+
+    assert _customer_params(models[0]) == _customer_params(records[0])
+    assert _product_params(models[1]) == _product_params(records[1])
+    assert _sale_params(models[2], "now") == _sale_params(records[2], "now")
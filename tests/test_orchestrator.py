@@ -0,0 +1,69 @@
+from unittest.mock import patch
+from src.orchestrator import run_daily_job
+from src.pipelines import context
+from src.pipelines.context import PipelineContext
+
+# =====================================================================
+# Objetivo: O job diário usa uma única conexão (PipelineContext) em todas
+# as etapas, e o schema é inicializado uma vez por processo.
+# =====================================================================
+
+STEPS = [
+    "sync_sales_to_db",
+    "process_manychat_input_dir",
+    "refresh_audiences",
+    "generate_audience_report",
+    "export_audiences_to_csv",
+    "generate_remarketing_batch",
+    "generate_remarketing_report",
+]
+
+
+def test_daily_job_shares_one_connection(tmp_path):
+    """
+    Happy Path Test: Every step receives the same connection object, opened
+    once for the job and closed at the end.
+    """
+    seen = []
+
+    def record(*args, **kwargs):
+        seen.append(kwargs.get("conn", args[0] if args else None))
+
+    db_path = str(tmp_path / "job.sqlite")
+    patches = [patch(f"src.orchestrator.{step}", side_effect=record) for step in STEPS]
+    with (
+        patch("src.orchestrator.PipelineContext", lambda: PipelineContext(db_path)),
+        patch(
+            "src.pipelines.context.get_connection", wraps=context.get_connection
+        ) as opened,
+    ):
+        for p in patches:
+            p.start()
+        try:
+            run_daily_job()
+        finally:
+            for p in patches:
+                p.stop()
+
+    assert len(seen) == len(STEPS)
+    assert all(conn is seen[0] for conn in seen)
+    assert opened.call_count == 1
+
+
+def test_schema_initialized_once_per_process(tmp_path):
+    """
+    Boundary Test: init_db runs for the first context on a database file only;
+    later contexts (e.g. the next daily run) reuse the checked schema, while
+    in-memory databases are always initialized.
+    """
+    db_path = str(tmp_path / "once.sqlite")
+    with patch("src.pipelines.context.init_db", wraps=context.init_db) as init:
+        for _ in range(3):
+            with PipelineContext(db_path) as ctx:
+                ctx.conn.execute("SELECT count(*) FROM sales").fetchone()
+        assert init.call_count == 1
+
+        for _ in range(2):
+            with PipelineContext(":memory:") as ctx:
+                ctx.conn.execute("SELECT count(*) FROM sales").fetchone()
+        assert init.call_count == 3
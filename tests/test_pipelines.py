@@ -1,3 +1,6 @@
+import sqlite3
+import threading
+import time
 import pytest
 from unittest.mock import patch, MagicMock, ANY
 from datetime import datetime, timedelta
@@ -8,20 +11,17 @@ from src.pipelines.hotmart_to_db import (
     do_incremental_sync,
     sync_sales_to_db,
 )
+from src.pipelines.sales_pages import _enrich_items
 from src.config import Config
 
 
-@patch("src.pipelines.hotmart_to_db.get_sale_price_details")
-@patch("src.pipelines.hotmart_to_db.get_sale_users")
+@patch("src.pipelines.sales_pages.get_sale_price_details")
+@patch("src.pipelines.sales_pages.get_sale_users")
 @patch("src.pipelines.hotmart_to_db.HotmartClient")
 @patch("src.pipelines.hotmart_to_db.get_sales_history")
-@patch("src.pipelines.hotmart_to_db.upsert_customer")
-@patch("src.pipelines.hotmart_to_db.upsert_product")
-@patch("src.pipelines.hotmart_to_db.upsert_sale")
+@patch("src.pipelines.hotmart_to_db.bulk_upsert_sales")
 def test_fetch_and_save_sales_pagination(
-    mock_upsert_sale,
-    mock_upsert_product,
-    mock_upsert_customer,
+    mock_bulk_upsert,
     mock_get_sales,
     mock_client,
     mock_get_users,
@@ -57,10 +57,11 @@ def test_fetch_and_save_sales_pagination(
     mock_get_sales.side_effect = [page_1, page_2]
     mock_get_users.return_value = {}
     mock_get_price.return_value = {}
+    mock_bulk_upsert.side_effect = lambda conn, records, imported_at=None: len(records)
     mock_conn = MagicMock()
 
     # Act
-    fetch_and_save_sales(
+    total = fetch_and_save_sales(
         mock_conn, start_date_ms="1000", end_date_ms="2000", client=mock_client
     )
 
@@ -76,13 +77,45 @@ def test_fetch_and_save_sales_pagination(
         page_token="token_abc123",
     )
 
-    # Assert that Both TX1 and TX2 items were successfully upserted to the DB
-    assert mock_upsert_sale.call_count == 2
+    # Assert that Both TX1 and TX2 items were upserted, one batch per page
+    assert mock_bulk_upsert.call_count == 2
+    assert total == 2
 
-    # Verify commit was called
+    # Verify a single commit per page
     assert mock_conn.commit.call_count == 2
 
 
+@patch("src.pipelines.sales_pages.get_sale_price_details")
+@patch("src.pipelines.sales_pages.get_sale_users")
+def test_enrich_items_bounded_and_ordered(mock_get_users, mock_get_price):
+    """
+    Concurrency Test: The enrichment fan-out never exceeds max_workers in flight
+    and returns results in page order, even when lookups finish out of order.
+    """
+    lock = threading.Lock()
+    state = {"in_flight": 0, "peak": 0}
+
+    def slow_users(txn_id, client=None, **kwargs):
+        with lock:
+            state["in_flight"] += 1
+            state["peak"] = max(state["peak"], state["in_flight"])
+        # Later transactions finish first
+        time.sleep(0.02 * (10 - int(txn_id[2:])) / 10)
+        with lock:
+            state["in_flight"] -= 1
+        return {"users": [{"role": "BUYER", "user": {"name": txn_id}}]}
+
+    mock_get_users.side_effect = slow_users
+    mock_get_price.side_effect = lambda txn_id, client=None, **kwargs: {"txn": txn_id}
+
+    items = [{"transaction": f"TX{i}"} for i in range(10)]
+    results = _enrich_items(items, MagicMock(), max_workers=3)
+
+    assert [user["name"] for user, _ in results] == [f"TX{i}" for i in range(10)]
+    assert [price["txn"] for _, price in results] == [f"TX{i}" for i in range(10)]
+    assert 1 < state["peak"] <= 3
+
+
 def test_date_str_to_ms():
     """
     Unit Test: Verifies correct conversion from YYYY-MM-DD to Milliseconds.
@@ -93,14 +126,15 @@ def test_date_str_to_ms():
     assert _date_str_to_ms(date_str) == expected_ms
 
 
+@patch("src.pipelines.hotmart_to_db.open_landing_zone")
 @patch("src.pipelines.hotmart_to_db.Config.is_dev")
 @patch("src.pipelines.hotmart_to_db.HotmartClient")
-@patch("src.pipelines.hotmart_to_db.fetch_and_save_sales")
-def test_do_initial_sync(mock_fetch, mock_client, mock_is_dev):
+@patch("src.pipelines.hotmart_to_db.run_backfill")
+def test_do_initial_sync(mock_backfill, mock_client, mock_is_dev, mock_landing):
     """
-    Decision Test: Verifies that initial sync slices a large date range into chunks.
+    Decision Test: Verifies that initial sync hands the whole .env range to
+    the checkpointed backfill (which cuts its own windows).
     Scenario: 3 year span from .env.
-    Assertion: Should result in 2 calls to fetch_and_save_sales (730 day max per chunk).
     """
     mock_is_dev.return_value = False
     Config.HOTMART_START_DATE = "2020-01-01"
@@ -109,27 +143,13 @@ def test_do_initial_sync(mock_fetch, mock_client, mock_is_dev):
     mock_conn = MagicMock()
     do_initial_sync(mock_conn)
 
-    assert mock_fetch.call_count == 2
-
-    expected_start_1 = _date_str_to_ms("2020-01-01")
-    expected_end_1 = _date_str_to_ms("2021-12-31")
-
-    expected_start_2 = _date_str_to_ms("2022-01-01")
-    expected_end_2 = _date_str_to_ms("2022-12-31")
-
-    mock_fetch.assert_any_call(
+    mock_backfill.assert_called_once_with(
         mock_conn,
-        expected_start_1,
-        expected_end_1,
-        client=mock_client(),
-        imported_at=ANY,
-    )
-    mock_fetch.assert_any_call(
-        mock_conn,
-        expected_start_2,
-        expected_end_2,
+        datetime(2020, 1, 1),
+        datetime(2022, 12, 31),
         client=mock_client(),
         imported_at=ANY,
+        landing=mock_landing.return_value,
     )
 
 
@@ -148,11 +168,15 @@ def test_do_initial_sync_missing_dates(mock_fetch):
     mock_fetch.assert_not_called()
 
 
+@patch("src.pipelines.hotmart_to_db.open_landing_zone")
+@patch("src.pipelines.hotmart_to_db.open_response_cache")
 @patch("src.pipelines.hotmart_to_db.Config.is_dev")
 @patch("src.pipelines.hotmart_to_db.HotmartClient")
 @patch("src.pipelines.hotmart_to_db.datetime")
 @patch("src.pipelines.hotmart_to_db.fetch_and_save_sales")
-def test_do_incremental_sync(mock_fetch, mock_datetime, mock_client, mock_is_dev):
+def test_do_incremental_sync(
+    mock_fetch, mock_datetime, mock_client, mock_is_dev, mock_open_cache, mock_landing
+):
     """
     Happy Path Test: Incremental sync fetches data from max current date to yesterday.
     """
@@ -178,9 +202,14 @@ def test_do_incremental_sync(mock_fetch, mock_datetime, mock_client, mock_is_dev
         expected_end,
         client=mock_client(),
         imported_at=ANY,
+        cache=mock_open_cache.return_value,
+        landing=mock_landing.return_value,
     )
+    mock_open_cache.return_value.close.assert_called_once()
 
 
+@patch("src.pipelines.hotmart_to_db.has_unfinished_backfill", return_value=False)
+@patch("src.pipelines.hotmart_to_db.consolidate_changes_to_master")
 @patch("src.pipelines.hotmart_to_db.generate_delta_report")
 @patch("src.pipelines.hotmart_to_db.get_max_sale_date")
 @patch("src.pipelines.hotmart_to_db.do_initial_sync")
@@ -188,7 +217,14 @@ def test_do_incremental_sync(mock_fetch, mock_datetime, mock_client, mock_is_dev
 @patch("src.pipelines.hotmart_to_db.init_db")
 @patch("src.pipelines.hotmart_to_db.get_connection")
 def test_sync_sales_to_db_empty(
-    mock_get_conn, mock_init, mock_inc, mock_init_sync, mock_get_max, mock_report
+    mock_get_conn,
+    mock_init,
+    mock_inc,
+    mock_init_sync,
+    mock_get_max,
+    mock_report,
+    mock_consolidate,
+    mock_unfinished,
 ):
     """
     Decision Test: Branch to Initial Sync.
@@ -203,9 +239,12 @@ def test_sync_sales_to_db_empty(
     # We use ANY for imported_at because it's generated inside sync_sales_to_db
     mock_init_sync.assert_called_once_with(mock_conn, imported_at=ANY)
     mock_inc.assert_not_called()
+    mock_consolidate.assert_called_once_with(mock_conn)
     mock_conn.close.assert_called_once()
 
 
+@patch("src.pipelines.hotmart_to_db.has_unfinished_backfill", return_value=False)
+@patch("src.pipelines.hotmart_to_db.consolidate_changes_to_master")
 @patch("src.pipelines.hotmart_to_db.generate_delta_report")
 @patch("src.pipelines.hotmart_to_db.get_max_sale_date")
 @patch("src.pipelines.hotmart_to_db.do_initial_sync")
@@ -213,7 +252,14 @@ def test_sync_sales_to_db_empty(
 @patch("src.pipelines.hotmart_to_db.init_db")
 @patch("src.pipelines.hotmart_to_db.get_connection")
 def test_sync_sales_to_db_incremental(
-    mock_get_conn, mock_init, mock_inc, mock_init_sync, mock_get_max, mock_report
+    mock_get_conn,
+    mock_init,
+    mock_inc,
+    mock_init_sync,
+    mock_get_max,
+    mock_report,
+    mock_consolidate,
+    mock_unfinished,
 ):
     """
     Decision Test: Branch to Incremental Sync.
@@ -228,3 +274,89 @@ def test_sync_sales_to_db_incremental(
     mock_inc.assert_called_once_with(mock_conn, "2024-01-01T10:00:00", imported_at=ANY)
     mock_init_sync.assert_not_called()
     mock_conn.close.assert_called_once()
+
+
+def _paged_history(total_pages, fetched, fail_at=None):
+    """get_sales_history stub: one sale per page, pages linked by token."""
+
+    def fake(client=None, start_date=None, end_date=None, page_token=None):
+        page = int(page_token or 1)
+        if page == fail_at:
+            raise ConnectionError("API down")
+        fetched.append(page)
+        return {
+            "items": [
+                {
+                    "transaction": f"TX{page}",
+                    "purchase": {"price": {"value": 1}, "order_date": 1704067200000},
+                }
+            ],
+            "page_info": (
+                {"next_page_token": str(page + 1)} if page < total_pages else {}
+            ),
+        }
+
+    return fake
+
+
+@patch("src.pipelines.hotmart_to_db.Config.HOTMART_PREFETCH_PAGES", 2)
+@patch("src.pipelines.sales_pages.get_sale_price_details", return_value={})
+@patch("src.pipelines.sales_pages.get_sale_users", return_value={})
+@patch("src.pipelines.hotmart_to_db.get_sales_history")
+@patch("src.pipelines.hotmart_to_db.bulk_upsert_sales")
+def test_fetch_and_save_sales_prefetch_is_bounded(
+    mock_bulk_upsert, mock_get_sales, mock_users, mock_price
+):
+    """
+    Concurrency Test: Pages are fetched while the writer is busy, but never
+    more than the queue size (+1 page held by the fetcher) ahead of it.
+    """
+    fetched, lead = [], []
+    mock_get_sales.side_effect = _paged_history(8, fetched)
+
+    def slow_write(conn, records, imported_at=None):
+        time.sleep(0.05)
+        lead.append(len(fetched) - (len(lead) + 1))
+        return len(records)
+
+    mock_bulk_upsert.side_effect = slow_write
+
+    total = fetch_and_save_sales(
+        MagicMock(), "1000", "2000", client=MagicMock(), max_workers=1
+    )
+
+    assert total == 8
+    assert fetched == list(range(1, 9))
+    # Prefetch happened (the fetcher ran ahead) and stayed bounded
+    assert max(lead) >= 1
+    assert max(lead) <= 3
+
+
+@patch("src.pipelines.sales_pages.get_sale_price_details", return_value={})
+@patch("src.pipelines.sales_pages.get_sale_users", return_value={})
+@patch("src.pipelines.hotmart_to_db.get_sales_history")
+@patch("src.pipelines.hotmart_to_db.bulk_upsert_sales")
+def test_fetch_and_save_sales_shutdown_on_errors(
+    mock_bulk_upsert, mock_get_sales, mock_users, mock_price
+):
+    """
+    Negative Test: A writer error stops the fetcher and propagates; a fetch
+    error keeps the pages already saved and ends the loop.
+    """
+    fetched = []
+    mock_get_sales.side_effect = _paged_history(1000, fetched)
+    mock_bulk_upsert.side_effect = sqlite3.OperationalError("disk I/O error")
+
+    with pytest.raises(sqlite3.OperationalError):
+        fetch_and_save_sales(MagicMock(), "1000", "2000", client=MagicMock())
+
+    assert len(fetched) < 10
+    assert not any(t.name == "hotmart-page-fetcher" for t in threading.enumerate())
+
+    fetched.clear()
+    mock_get_sales.side_effect = _paged_history(5, fetched, fail_at=3)
+    mock_bulk_upsert.side_effect = lambda conn, records, imported_at=None: len(records)
+
+    total = fetch_and_save_sales(MagicMock(), "1000", "2000", client=MagicMock())
+    assert total == 2
+    assert fetched == [1, 2]
@@ -0,0 +1,171 @@
+import re
+import pytest
+from src.db.database import get_connection, init_db, SQL_MAX_SALE_DATE
+from src.db.consolidation import (
+    create_consolidation_stage,
+    SQL_STAGE_CHANGED_CUSTOMERS,
+    SQL_STAGE_SALES_SUMMARY,
+    SQL_STAGE_HOTMART,
+    SQL_STAGE_MANYCHAT,
+    SQL_RESOLVE_HOTMART,
+    SQL_RESOLVE_MANYCHAT,
+    SQL_MARK_SEEDED_HOTMART,
+    SQL_MARK_SEEDED_MANYCHAT,
+)
+from src.logic.audiences import SQL_AGGREGATE_AUDIENCES
+from src.logic.remarketing import SQL_FIND_ELIGIBLE_REMARKETING
+from src.logic.reporting import (
+    SQL_LOAD_BUYERS,
+    SQL_LOAD_VALUE,
+    SQL_LOAD_CANCELLATIONS,
+    SQL_RECENT_LOADS,
+    POSITIVE_STATUSES,
+    NEGATIVE_STATUSES,
+)
+
+# =====================================================================
+# Objetivo: Regressão de plano de execução. Cada template SQL do pipeline
+# buscar (SEARCH) nas tabelas do banco; qualquer "SCAN <tabela>", mesmo
+# "USING INDEX" ou "USING COVERING INDEX", lê a tabela (ou o índice) inteira
+# e só é aceito quando consta em ALLOWED_SCANS com a justificativa.
+# =====================================================================
+
+# (template, table) pairs whose scan is bounded by design
+ALLOWED_SCANS = {
+    # Reads the imported_at index backwards and stops after two distinct loads
+    ("report_recent_loads", "sales"),
+}
+
+LOAD_FILTER = "WHERE imported_at = ?"
+
+WATERMARKS = {
+    "sales_mark": "2024-01-01 00:00:00",
+    "sales_limit": "2024-01-02 00:00:00",
+    "hotmart_mark": 100,
+    "hotmart_limit": 200,
+    "manychat_mark": 100,
+    "manychat_limit": 200,
+}
+
+QUERY_TEMPLATES = [
+    ("audience_aggregate", SQL_AGGREGATE_AUDIENCES, []),
+    ("remarketing_eligible", SQL_FIND_ELIGIBLE_REMARKETING, {"limit": 50}),
+    ("consolidation_changed_customers", SQL_STAGE_CHANGED_CUSTOMERS, WATERMARKS),
+    ("consolidation_sales_summary", SQL_STAGE_SALES_SUMMARY, []),
+    ("consolidation_stage_hotmart", SQL_STAGE_HOTMART, []),
+    ("consolidation_stage_manychat", SQL_STAGE_MANYCHAT, WATERMARKS),
+    ("consolidation_resolve_hotmart", SQL_RESOLVE_HOTMART, {"pass": 1}),
+    ("consolidation_resolve_manychat", SQL_RESOLVE_MANYCHAT, {"pass": 1}),
+    ("consolidation_mark_hotmart", SQL_MARK_SEEDED_HOTMART, []),
+    ("consolidation_mark_manychat", SQL_MARK_SEEDED_MANYCHAT, []),
+    ("max_sale_date", SQL_MAX_SALE_DATE, []),
+    ("report_recent_loads", SQL_RECENT_LOADS, []),
+    (
+        "report_buyers",
+        SQL_LOAD_BUYERS.format(where_clause=LOAD_FILTER),
+        ["2024-01-01 00:00:00"],
+    ),
+    (
+        "report_value",
+        SQL_LOAD_VALUE.format(
+            where_clause=LOAD_FILTER,
+            connector="AND",
+            placeholders=", ".join("?" for _ in POSITIVE_STATUSES),
+        ),
+        ["2024-01-01 00:00:00", *POSITIVE_STATUSES],
+    ),
+    (
+        "report_cancellations",
+        SQL_LOAD_CANCELLATIONS.format(
+            where_clause=LOAD_FILTER,
+            connector="AND",
+            placeholders=", ".join("?" for _ in NEGATIVE_STATUSES),
+        ),
+        ["2024-01-01 00:00:00", *NEGATIVE_STATUSES],
+    ),
+]
+
+
+@pytest.fixture(scope="module")
+def db_conn():
+    conn = get_connection(":memory:")
+    init_db(conn)
+    create_consolidation_stage(conn)
+    yield conn
+    conn.close()
+
+
+def _table_aliases(conn, sql: str) -> dict:
+    """Maps every table name and alias used in FROM/JOIN clauses to its table."""
+    tables = {
+        row[0]
+        for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    }
+    aliases = {name: name for name in tables}
+    for table, alias in re.findall(
+        r"(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", sql, re.IGNORECASE
+    ):
+        if table in tables and alias and alias.upper() not in ("WHERE", "ON", "JOIN"):
+            aliases[alias] = table
+    return aliases
+
+
+def full_table_scans(conn, sql: str, params) -> list:
+    """
+    Returns the database tables that EXPLAIN QUERY PLAN walks end to end,
+    with or without an index (SCAN instead of SEARCH).
+    """
+    aliases = _table_aliases(conn, sql)
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+
+    scans = []
+    for row in plan:
+        match = re.match(r"SCAN (\w+)\b", row["detail"])
+        if match and match.group(1) in aliases:
+            scans.append(aliases[match.group(1)])
+    return scans
+
+
+@pytest.mark.parametrize(
+    "name, sql, params", QUERY_TEMPLATES, ids=[q[0] for q in QUERY_TEMPLATES]
+)
+def test_query_template_uses_indexes(db_conn, name, sql, params):
+    """
+    Regression Test: No SQL template may scan a database table, unless the
+    scan is listed in ALLOWED_SCANS.
+    """
+    scans = full_table_scans(db_conn, sql, params)
+    assert [table for table in scans if (name, table) not in ALLOWED_SCANS] == []
+
+
+def test_full_scan_detector_catches_unindexed_query(db_conn):
+    """
+    Self-Test: The detector flags a query filtering on a column without index.
+    """
+    sql = "SELECT * FROM sales s WHERE s.currency = ?"
+    assert full_table_scans(db_conn, sql, ["BRL"]) == ["sales"]
+
+
+def test_full_scan_detector_catches_index_scans(db_conn):
+    """
+    Self-Test: Walking a whole index (plain or covering) is still a scan.
+    """
+    ordered = "SELECT * FROM sales s ORDER BY s.customer_id"
+    covering = "SELECT DISTINCT imported_at FROM sales"
+    assert full_table_scans(db_conn, ordered, []) == ["sales"]
+    assert full_table_scans(db_conn, covering, []) == ["sales"]
+
+
+def test_remarketing_selection_reads_index_in_order(db_conn):
+    """
+    Regression Test: The remarketing batch reads the next_eligible_at index in
+    order, with no temp B-tree sort, so its cost depends on the batch size only.
+    """
+    plan = [
+        row["detail"]
+        for row in db_conn.execute(
+            f"EXPLAIN QUERY PLAN {SQL_FIND_ELIGIBLE_REMARKETING}", {"limit": 50}
+        )
+    ]
+    assert any("idx_customers_next_eligible" in detail for detail in plan)
+    assert not any("TEMP B-TREE" in detail for detail in plan)
@@ -1,4 +1,6 @@
 import pytest
+import sqlite3
+from unittest.mock import patch
 from datetime import datetime, timedelta
 from src.db.database import get_connection, init_db, upsert_master_customer
 from src.logic.remarketing import generate_remarketing_batch
@@ -96,3 +98,125 @@ def test_remarketing_phone_requirement(db_conn):
     emails = [r["email"] for r in cur.fetchall()]
     assert "phone@test.com" in emails
     assert "nophone@test.com" not in emails
+
+
+def test_next_eligible_at_maintained_by_triggers(db_conn):
+    """
+    Decision Test: next_eligible_at is the latest of (remarketing + 30 days,
+    purchase + 30 days), '' when never contacted nor bought, NULL without a
+    phone, and follows every change of those columns.
+    """
+
+    def next_eligible(email):
+        return db_conn.execute(
+            "SELECT next_eligible_at FROM customers WHERE master_email = ?", (email,)
+        ).fetchone()[0]
+
+    upsert_master_customer(db_conn, "MANYCHAT", email="n@test.com", phone="1")
+    assert next_eligible("n@test.com") == ""
+
+    db_conn.execute(
+        "UPDATE customers SET last_purchase_at = '2026-01-10T08:00:00.123456' "
+        "WHERE master_email = 'n@test.com'"
+    )
+    assert next_eligible("n@test.com") == "2026-02-09 08:00:00"
+
+    db_conn.execute(
+        "UPDATE customers SET last_remarketing_at = '2026-03-01 00:00:00' "
+        "WHERE master_email = 'n@test.com'"
+    )
+    assert next_eligible("n@test.com") == "2026-03-31 00:00:00"
+
+    db_conn.execute(
+        "UPDATE customers SET master_phone = '' WHERE master_email = 'n@test.com'"
+    )
+    assert next_eligible("n@test.com") is None
+
+
+def test_remarketing_batch_rotates_longest_waiting(db_conn):
+    """
+    Boundary Test: The batch takes the contacts eligible the longest first,
+    so consecutive batches rotate through the whole eligible base.
+    """
+    old = (datetime.now() - timedelta(days=90)).isoformat()
+    older = (datetime.now() - timedelta(days=120)).isoformat()
+    upsert_master_customer(db_conn, "MANYCHAT", email="new@test.com", phone="1")
+    upsert_master_customer(
+        db_conn, "MANYCHAT", email="old@test.com", phone="2", last_remarketing_at=old
+    )
+    upsert_master_customer(
+        db_conn,
+        "MANYCHAT",
+        email="older@test.com",
+        phone="3",
+        last_remarketing_at=older,
+    )
+
+    batches = []
+    for _ in range(4):
+        generate_remarketing_batch(db_conn, limit=1)
+        batches.append(
+            [
+                r["email"]
+                for r in db_conn.execute(
+                    "SELECT email FROM remarketing_history ORDER BY id DESC LIMIT 1"
+                )
+            ]
+        )
+    assert batches[:3] == [["new@test.com"], ["older@test.com"], ["old@test.com"]]
+    count = db_conn.execute("SELECT COUNT(*) FROM remarketing_history").fetchone()[0]
+    assert count == 3
+
+
+def test_remarketing_batch_is_set_based(db_conn):
+    """
+    Happy Path Test: A large batch writes history and Master with one
+    statement each, stamping every contact with the same run timestamp.
+    """
+    db_conn.executemany(
+        "INSERT INTO customers (master_email, master_phone) VALUES (?, ?)",
+        [(f"bulk{i}@test.com", f"55{i:06d}") for i in range(5000)],
+    )
+    db_conn.commit()
+
+    statements = []
+    db_conn.set_trace_callback(statements.append)
+    generate_remarketing_batch(db_conn, limit=4000)
+    db_conn.set_trace_callback(None)
+
+    assert (
+        db_conn.execute("SELECT COUNT(*) FROM remarketing_history").fetchone()[0]
+        == 4000
+    )
+    stamps = db_conn.execute(
+        "SELECT DISTINCT last_remarketing_at FROM customers "
+        "WHERE last_remarketing_at IS NOT NULL"
+    ).fetchall()
+    assert len(stamps) == 1
+    history_writes = [s for s in statements if "INSERT INTO remarketing_history" in s]
+    assert len(history_writes) == 1
+    assert (
+        db_conn.execute("SELECT COUNT(*) FROM temp.remarketing_batch").fetchone()[0]
+        == 0
+    )
+
+
+def test_remarketing_batch_rolls_back_on_failure(db_conn):
+    """
+    Boundary Test: If the Master update fails, no history row is kept and no
+    contact is marked, so the next run picks the same contacts.
+    """
+    upsert_master_customer(db_conn, "MANYCHAT", email="x@test.com", phone="9")
+    with patch(
+        "src.logic.remarketing.SQL_MARK_REMARKETED", "UPDATE missing_table SET x = 1"
+    ):
+        with pytest.raises(sqlite3.OperationalError):
+            generate_remarketing_batch(db_conn, limit=10)
+
+    assert (
+        db_conn.execute("SELECT COUNT(*) FROM remarketing_history").fetchone()[0] == 0
+    )
+    generate_remarketing_batch(db_conn, limit=10)
+    assert (
+        db_conn.execute("SELECT COUNT(*) FROM remarketing_history").fetchone()[0] == 1
+    )
@@ -0,0 +1,135 @@
+import pytest
+from unittest.mock import patch, MagicMock
+from src.db.database import get_connection, init_db, bulk_upsert_sales
+from src.hotmart.landing import LandingZone, list_landing_files, read_landing_file
+from src.pipelines.sales_pages import _build_page_records
+from src.pipelines.replay_landing import replay_landing
+
+# =====================================================================
+# Objetivo: A landing zone guarda cada página crua (item + enriquecimento)
+# e o replay re-mapeia esses arquivos localmente, gerando no banco o mesmo
+# resultado do sync original, sem chamar a API.
+# =====================================================================
+
+
+def _page(start: int, count: int) -> list[dict]:
+    return [
+        {
+            "purchase": {
+                "transaction": f"TX{i}",
+                "status": "APPROVED",
+                "price": {"value": 10.0 * i},
+                "order_date": 1704067200000 + i,
+            },
+            "buyer": {"ucode": f"U{i}", "email": f"b{i}@test.com"},
+            "product": {"id": i % 3, "name": f"P{i % 3}"},
+        }
+        for i in range(start, start + count)
+    ]
+
+
+def _users(txn_id, client=None, **kwargs):
+    return {"users": [{"role": "BUYER", "user": {"address": {"city": txn_id}}}]}
+
+
+def _price(txn_id, client=None, **kwargs):
+    return {"payment": {"type": "PIX", "installments_number": 1}}
+
+
+def _sales(conn):
+    return [
+        tuple(row)
+        for row in conn.execute(
+            "SELECT transaction_id, status, total_price, payment_type, customer_id, "
+            "product_id, purchased_at FROM sales ORDER BY transaction_id"
+        )
+    ]
+
+
+@pytest.fixture
+def landed(tmp_path):
+    """Runs two pages through the live mapping with a landing zone attached."""
+    landing = LandingZone(str(tmp_path), run_id="run1")
+    conn = get_connection(":memory:")
+    init_db(conn)
+    with (
+        patch("src.pipelines.sales_pages.get_sale_users", side_effect=_users),
+        patch("src.pipelines.sales_pages.get_sale_price_details", side_effect=_price),
+    ):
+        for page in (_page(0, 5), _page(5, 4)):
+            records = _build_page_records(page, MagicMock(), 2, landing=landing)
+            bulk_upsert_sales(conn, records)
+            conn.commit()
+    yield str(tmp_path), _sales(conn)
+    conn.close()
+
+
+def test_landing_zone_is_append_only(landed):
+    """
+    Happy Path Test: One gzip'd JSONL file per page, in write order, holding
+    the raw item and its enrichment; a landed file is never overwritten.
+    """
+    directory, _ = landed
+    files = list_landing_files(directory)
+    assert [f.rsplit("/", 1)[-1] for f in files] == [
+        "run1-000001.jsonl.gz",
+        "run1-000002.jsonl.gz",
+    ]
+
+    item, (user_detail, price_detail) = next(read_landing_file(files[0]))
+    assert item["purchase"]["transaction"] == "TX0"
+    assert user_detail == {"address": {"city": "TX0"}}
+    assert price_detail["payment"]["type"] == "PIX"
+
+    rewrite = LandingZone(directory, run_id="run1")
+    with pytest.raises(FileExistsError):
+        rewrite.write_page(_page(0, 1), [({}, {})])
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_replay_rebuilds_the_same_sales(landed, workers):
+    """
+    Regression Test: Replaying the landing zone into an empty database (inline
+    and with a process pool) yields exactly the sales of the live sync.
+    """
+    directory, live_sales = landed
+    conn = get_connection(":memory:")
+    init_db(conn)
+
+    with patch("src.pipelines.sales_pages.get_sale_users") as mock_users:
+        saved = replay_landing(conn, list_landing_files(directory), workers=workers)
+
+    mock_users.assert_not_called()
+    assert saved == 9
+    assert _sales(conn) == live_sales
+    conn.close()
+
+
+def test_replay_applies_changed_mapping(landed):
+    """
+    Regression Test: Replaying a sale already stored overwrites every mapped
+    column, so a mapping fix reaches existing rows.
+    """
+    directory, _ = landed
+    conn = get_connection(":memory:")
+    init_db(conn)
+    paths = list_landing_files(directory)
+    replay_landing(conn, paths, workers=1, imported_at="2024-01-01 00:00:00")
+    conn.execute(
+        "UPDATE sales SET payment_type = NULL, installments = NULL, "
+        "currency = 'USD', product_id = 'OLD' WHERE transaction_id = 'TX1'"
+    )
+    conn.commit()
+
+    replay_landing(conn, paths, workers=1, imported_at="2024-02-01 00:00:00")
+
+    row = conn.execute(
+        "SELECT payment_type, installments, currency, product_id, imported_at "
+        "FROM sales WHERE transaction_id = 'TX1'"
+    ).fetchone()
+    assert tuple(row) == ("PIX", 1, "BRL", "1", "2024-02-01 00:00:00")
+    untouched = conn.execute(
+        "SELECT imported_at FROM sales WHERE transaction_id = 'TX2'"
+    ).fetchone()[0]
+    assert untouched == "2024-01-01 00:00:00"
+    conn.close()